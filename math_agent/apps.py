@@ -1,6 +1,11 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class MathAgentConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "math_agent"
+
+    def ready(self):
+        from .utils.search import restore_search_triggers
+        post_migrate.connect(restore_search_triggers, sender=self)
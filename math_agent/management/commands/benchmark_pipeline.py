@@ -0,0 +1,85 @@
+import json
+import platform
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from math_agent.utils.benchmark import StubBackend, throwaway_database, seed_corpus, run_scenario
+
+
+def int_list(value):
+    try:
+        return sorted({int(item) for item in value.split(',') if item.strip()})
+    except ValueError:
+        raise CommandError(f"Expected a comma-separated list of integers, got '{value}'")
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark pipeline throughput end to end against a stubbed LLM and embedding backend, "
+        "in a throwaway database, and write the results to a JSON report."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', default='1,4,10', help="Comma-separated worker counts to try")
+        parser.add_argument('--corpus', default='1000,10000', help="Comma-separated corpus sizes (stored problems) to try, e.g. 1000,100000,1000000")
+        parser.add_argument('--modes', choices=['both', 'mcq', 'non-mcq'], default='both', help="Problem modes to try")
+        parser.add_argument('--valid', type=int, default=20, help="Valid problems each benchmark batch asks for")
+        parser.add_argument('--problems-per-call', type=int, default=1, help="Problems per generator call")
+        parser.add_argument('--llm-latency', type=float, default=0.05, help="Seconds every stubbed LLM call takes")
+        parser.add_argument('--embedding-latency', type=float, default=0.01, help="Seconds every stubbed embedding request takes")
+        parser.add_argument('--dimensions', type=int, default=64, help="Embedding dimensions of the stub (the real model has 1536)")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed of the stub")
+        parser.add_argument('--output', default='benchmark_report.json', help="Path of the JSON report")
+        parser.add_argument('--verbose', action='store_true', help="Show the batch runner's progress output")
+
+    def handle(self, *args, **options):
+        workers_list = int_list(options['workers'])
+        corpus_sizes = int_list(options['corpus'])
+        modes = {'both': [False, True], 'mcq': [True], 'non-mcq': [False]}[options['modes']]
+        batch_options = {'problems_per_call': options['problems_per_call']} if options['problems_per_call'] > 1 else {}
+
+        scenarios = []
+        with throwaway_database():
+            with StubBackend(
+                llm_latency=options['llm_latency'],
+                embedding_latency=options['embedding_latency'],
+                dimensions=options['dimensions'],
+                seed=options['seed']
+            ) as stub:
+                for corpus_size in corpus_sizes:
+                    added = seed_corpus(corpus_size, stub)
+                    self.stdout.write(f"📚 Corpus at {corpus_size} problems ({added} added)")
+                    for mcq_mode in modes:
+                        for workers in workers_list:
+                            result = run_scenario(workers, corpus_size, mcq_mode, options['valid'], batch_options, quiet=not options['verbose'])
+                            scenarios.append(result)
+                            self.stdout.write(
+                                f"   {workers:>3} workers | {'MCQ' if mcq_mode else 'non-MCQ':<7} | "
+                                f"{result['attempts_per_second']:.3f} attempts/s | {result['valid_per_second']:.3f} valid/s | "
+                                f"similarity {result['similarity_check']['mean_ms']} ms | "
+                                f"result write {result['db_writes']['results']['mean_ms']} ms"
+                            )
+
+        report = {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'environment': {
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'platform': platform.platform()
+            },
+            'config': {
+                'workers': workers_list,
+                'corpus_sizes': corpus_sizes,
+                'modes': ['mcq' if mode else 'non-mcq' for mode in modes],
+                'valid_per_batch': options['valid'],
+                'problems_per_call': options['problems_per_call'],
+                'llm_latency': options['llm_latency'],
+                'embedding_latency': options['embedding_latency'],
+                'dimensions': options['dimensions'],
+                'seed': options['seed']
+            },
+            'scenarios': scenarios
+        }
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Benchmark report with {len(scenarios)} scenarios written to {options['output']}"))
@@ -0,0 +1,83 @@
+import json
+import platform
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from math_agent.utils.benchmark import throwaway_database
+from math_agent.utils.similarity_benchmark import (
+    SIMILARITY_BACKENDS, EMBEDDING_DIMENSIONS, SyntheticCorpus, seed_embeddings, exact_matches, benchmark_backend
+)
+from math_agent.utils.similarity_utils import SIMILARITY_THRESHOLD
+from .benchmark_pipeline import int_list
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark similarity search backends on synthetic embeddings with clustered near-duplicates, "
+        "in a throwaway database: query latency, memory, index build time and recall at the threshold."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000', help="Comma-separated corpus sizes, e.g. 1000,10000,100000,1000000")
+        parser.add_argument('--backends', default=','.join(SIMILARITY_BACKENDS), help=f"Comma-separated backends out of {', '.join(SIMILARITY_BACKENDS)}")
+        parser.add_argument('--dimensions', type=int, default=EMBEDDING_DIMENSIONS, help="Embedding dimensions")
+        parser.add_argument('--queries', type=int, default=20, help="Queries per backend and size")
+        parser.add_argument('--duplicate-rate', type=float, default=0.1, help="Share of the corpus in near-duplicate clusters")
+        parser.add_argument('--cluster-size', type=int, default=5, help="Near-duplicates per cluster")
+        parser.add_argument('--threshold', type=float, default=SIMILARITY_THRESHOLD, help="Similarity threshold")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed")
+        parser.add_argument('--output', default='similarity_report.json', help="Path of the JSON report")
+
+    def handle(self, *args, **options):
+        sizes = int_list(options['sizes'])
+        backend_names = [name.strip() for name in options['backends'].split(',') if name.strip()]
+        unknown = [name for name in backend_names if name not in SIMILARITY_BACKENDS]
+        if unknown:
+            raise CommandError(f"Unknown backends: {', '.join(unknown)}. Use: {', '.join(SIMILARITY_BACKENDS)}")
+
+        corpus = SyntheticCorpus(options['dimensions'], options['duplicate_rate'], options['cluster_size'], seed=options['seed'])
+        results = []
+        with throwaway_database():
+            for size in sizes:
+                added = seed_embeddings(size, corpus)
+                queries = corpus.queries(options['queries'])
+                truth = exact_matches(queries, options['threshold'])
+                self.stdout.write(f"📚 Corpus at {size} embeddings ({added} added), {sum(len(t) for t in truth)} true matches for {len(queries)} queries")
+
+                for name in backend_names:
+                    try:
+                        result = benchmark_backend(SIMILARITY_BACKENDS[name](), queries, truth, options['threshold'])
+                    except ImportError as e:
+                        self.stdout.write(self.style.WARNING(f"   {name:<7} skipped: {str(e)}"))
+                        results.append({'backend': name, 'size': size, 'skipped': str(e)})
+                        continue
+                    result['size'] = size
+                    results.append(result)
+                    recall = 'n/a' if result['recall'] is None else f"{result['recall']:.3f}"
+                    self.stdout.write(
+                        f"   {name:<7} build {result['build_ms']} ms | query p50 {result['query_ms']['p50']} ms, "
+                        f"p95 {result['query_ms']['p95']} ms | index {result['index_bytes'] / 1e6:.1f} MB | recall {recall}"
+                    )
+
+        report = {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'environment': {
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'platform': platform.platform()
+            },
+            'config': {
+                'sizes': sizes,
+                'backends': backend_names,
+                'dimensions': options['dimensions'],
+                'queries': options['queries'],
+                'duplicate_rate': options['duplicate_rate'],
+                'cluster_size': options['cluster_size'],
+                'threshold': options['threshold'],
+                'seed': options['seed']
+            },
+            'results': results
+        }
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Similarity report with {len(results)} results written to {options['output']}"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from math_agent.utils.hinter import fill_pending_hints
+
+
+class Command(BaseCommand):
+    help = "Write the hints still pending for valid problems of batches generated with deferred hints."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=None, help="Only this batch's problems")
+        parser.add_argument('--limit', type=int, default=None, help="Stop after this many problems")
+
+    def handle(self, *args, **options):
+        counts = fill_pending_hints(options['batch'], options['limit'])
+        self.stdout.write(self.style.SUCCESS(f"Wrote hints for {counts['hinted']} problems ({counts['failed']} failed)"))
@@ -0,0 +1,50 @@
+import os
+from django.core.management.base import BaseCommand, CommandError
+from math_agent.models import Batch
+from math_agent.utils.importer import import_batch, import_problems, check_import_file, IMPORT_CHUNK, EMBED_BATCH
+from math_agent.utils.similarity_utils import SIMILARITY_THRESHOLD
+
+
+class Command(BaseCommand):
+    help = (
+        "Import existing problems from JSONL or CSV files (optionally gzipped) into a batch, embedding "
+        "their questions in bulk and linking them to similar stored problems, so new generations are "
+        "deduplicated against them. Run again with --batch to resume an interrupted import."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+', help="JSONL or CSV files, e.g. a previous export")
+        parser.add_argument('--batch', type=int, default=None, help="Import into (or resume the import into) this batch instead of a new one")
+        parser.add_argument('--name', default=None, help="Name of the new batch (default: Import of <files>)")
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK, help="Problems written per transaction")
+        parser.add_argument('--embed-batch', type=int, default=EMBED_BATCH, help="Questions per embedding request")
+        parser.add_argument('--threshold', type=float, default=SIMILARITY_THRESHOLD, help="Similarity threshold for linking problems")
+        parser.add_argument('--no-links', action='store_true', help="Don't compare the problems or link similar ones")
+
+    def handle(self, *args, **options):
+        try:
+            for path in options['files']:
+                check_import_file(path)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        name = options['name'] or f"Import of {', '.join(os.path.basename(path) for path in options['files'])}"[:255]
+        try:
+            batch = import_batch(name, options['batch'])
+        except Batch.DoesNotExist:
+            raise CommandError(f"Batch {options['batch']} not found")
+        self.stdout.write(f"📥 Importing into batch {batch.id} (if interrupted, resume with --batch {batch.id})")
+
+        counts = import_problems(
+            options['files'],
+            batch,
+            chunk_size=options['chunk_size'],
+            embed_batch=options['embed_batch'],
+            threshold=options['threshold'],
+            link=not options['no_links'],
+            log=self.stdout.write
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {counts.get('imported', 0)} problems into batch {batch.id} "
+            f"({counts.get('skipped', 0)} rows without question/answer or with an unknown status skipped)"
+        ))
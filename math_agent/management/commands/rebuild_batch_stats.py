@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from math_agent.utils.batch_stats import rebuild_batch_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored outcome counters of batches from their problems, failed attempts and target results."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, action='append', default=None, help="Only this batch (repeatable)")
+
+    def handle(self, *args, **options):
+        updated = rebuild_batch_stats(options['batch'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the counters of {updated} batches"))
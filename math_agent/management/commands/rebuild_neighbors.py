@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from math_agent.utils.similarity_utils import rebuild_neighbors, NEIGHBOR_LIMIT
+
+
+class Command(BaseCommand):
+    help = "Recompute every problem's top similar problems from the similarity links, e.g. after deleting problems or changing SIMILAR_PROBLEMS_TOP_K."
+
+    def handle(self, *args, **options):
+        rows = rebuild_neighbors()
+        self.stdout.write(self.style.SUCCESS(f"Wrote {rows} neighbour rows (top {NEIGHBOR_LIMIT} per problem)"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from math_agent.utils.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Drop and rebuild the full-text search index over problem questions, answers and hints."
+
+    def handle(self, *args, **options):
+        rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the search index ({connection.vendor})"))
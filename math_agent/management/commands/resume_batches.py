@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from math_agent.models import Batch
+from math_agent.utils.batch_runner import resume_batch, BatchBusy, NUM_WORKERS
+
+
+class Command(BaseCommand):
+    help = "Resume interrupted batches from their recorded attempts without redoing paid-for stages."
+
+    def add_arguments(self, parser):
+        parser.add_argument('batch_ids', nargs='*', type=int, help="Batches to resume (default: every unfinished batch)")
+        parser.add_argument('--workers', type=int, default=NUM_WORKERS, help="Number of worker threads")
+        parser.add_argument('--force', action='store_true', help="Also resume batches whose attempts still hold live leases")
+
+    def handle(self, *args, **options):
+        batches = Batch.objects.exclude(status='completed').order_by('created_at')
+        if options['batch_ids']:
+            batches = batches.filter(id__in=options['batch_ids'])
+            missing = set(options['batch_ids']) - set(batches.values_list('id', flat=True))
+            if missing:
+                raise CommandError(f"Not found or already completed: {sorted(missing)}")
+
+        if not batches.exists():
+            self.stdout.write("No unfinished batches to resume.")
+            return
+
+        for batch in batches:
+            # Batches still coordinated or worked on by another process are skipped
+            try:
+                summary = resume_batch(batch, num_workers=options['workers'], force=options['force'])
+            except BatchBusy as e:
+                self.stdout.write(self.style.WARNING(f"Skipping batch {batch.id}: {e}"))
+                continue
+            stats = summary['stats']
+            self.stdout.write(self.style.SUCCESS(
+                f"Batch {batch.id} {batch.status}: {stats['valid']}/{batch.number_of_valid_needed} valid, "
+                f"total cost ${summary['total_cost']:.4f}"
+            ))
@@ -0,0 +1,31 @@
+import threading
+import time
+from django.core.management.base import BaseCommand
+from math_agent.utils.batch_runner import start_workers, NUM_WORKERS
+from math_agent.utils.result_writer import result_writer
+
+
+class Command(BaseCommand):
+    help = "Run pipeline workers that claim attempts of running batches from the shared database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=NUM_WORKERS, help="Number of worker threads")
+        parser.add_argument('--batch', type=int, default=None, help="Only work on this batch")
+
+    def handle(self, *args, **options):
+        stop_event = threading.Event()
+        workers = start_workers(options['workers'], options['batch'], stop_event)
+        scope = f"batch {options['batch']}" if options['batch'] else "all running batches"
+        self.stdout.write(self.style.SUCCESS(f"{len(workers)} workers claiming attempts from {scope}. Press Ctrl+C to stop."))
+
+        try:
+            while any(worker.is_alive() for worker in workers):
+                time.sleep(1)
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping workers after their current attempts...")
+            stop_event.set()
+            for worker in workers:
+                worker.join()
+        finally:
+            # Save the results and LLM call records still queued before the process exits
+            result_writer.flush()
@@ -0,0 +1,173 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("math_agent", "0008_alter_batch_options_alter_batch_batch_cost_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="batch",
+            name="mcq_mode",
+            field=models.BooleanField(default=False),
+        ),
+        # Batches that existed before this migration have all finished
+        migrations.AddField(
+            model_name="batch",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("running", "Running"),
+                    ("completed", "Completed"),
+                    ("stopped", "Stopped"),
+                    ("interrupted", "Interrupted"),
+                ],
+                default="completed",
+                max_length=20,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="batch",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("running", "Running"),
+                    ("completed", "Completed"),
+                    ("stopped", "Stopped"),
+                    ("interrupted", "Interrupted"),
+                ],
+                default="running",
+                max_length=20,
+            ),
+        ),
+        migrations.CreateModel(
+            name="Attempt",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("number", models.IntegerField()),
+                ("subject", models.CharField(max_length=100)),
+                ("topic", models.CharField(max_length=100)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("running", "Running"),
+                            ("completed", "Completed"),
+                            ("failed", "Failed"),
+                            ("cancelled", "Cancelled"),
+                        ],
+                        default="pending",
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "outcome",
+                    models.CharField(
+                        blank=True,
+                        choices=[
+                            ("discarded", "Discarded"),
+                            ("solved", "Solved"),
+                            ("valid", "Valid"),
+                        ],
+                        max_length=20,
+                        null=True,
+                    ),
+                ),
+                (
+                    "failed_stage",
+                    models.CharField(blank=True, max_length=20, null=True),
+                ),
+                ("error", models.TextField(blank=True, null=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "batch",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="attempts",
+                        to="math_agent.batch",
+                    ),
+                ),
+                (
+                    "problem",
+                    models.OneToOneField(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="attempt",
+                        to="math_agent.problem",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["number"],
+            },
+        ),
+        migrations.CreateModel(
+            name="AttemptStage",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "stage",
+                    models.CharField(
+                        choices=[
+                            ("generator", "Generator"),
+                            ("checker", "Checker"),
+                            ("target", "Target"),
+                            ("judge", "Judge"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("output", models.JSONField()),
+                (
+                    "cost",
+                    models.DecimalField(decimal_places=6, default=0.0, max_digits=10),
+                ),
+                ("retries", models.IntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "attempt",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stages",
+                        to="math_agent.attempt",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="attempt",
+            constraint=models.UniqueConstraint(
+                fields=("batch", "number"), name="unique_attempt_number_per_batch"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="attemptstage",
+            constraint=models.UniqueConstraint(
+                fields=("attempt", "stage"), name="unique_stage_per_attempt"
+            ),
+        ),
+    ]
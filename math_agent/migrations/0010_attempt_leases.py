@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("math_agent", "0009_attempt_attemptstage_batch_status"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="attempt",
+            name="lease_expires_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="attempt",
+            name="lease_owner",
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name="attempt",
+            name="lease_version",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name="attempt",
+            index=models.Index(
+                fields=["status", "lease_expires_at"], name="attempt_claim_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("math_agent", "0010_attempt_leases"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="batch",
+            name="options",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.CreateModel(
+            name="TopicStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("subject", models.CharField(max_length=100)),
+                ("topic", models.CharField(max_length=100)),
+                ("attempts", models.IntegerField(default=0)),
+                ("valid", models.IntegerField(default=0)),
+                ("solved", models.IntegerField(default=0)),
+                ("discarded", models.IntegerField(default=0)),
+                ("errors", models.IntegerField(default=0)),
+                (
+                    "cost",
+                    models.DecimalField(decimal_places=6, default=0.0, max_digits=12),
+                ),
+                ("seconds", models.FloatField(default=0.0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name_plural": "Topic stats",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("subject", "topic"), name="unique_topic_stats"
+                    )
+                ],
+            },
+        ),
+    ]
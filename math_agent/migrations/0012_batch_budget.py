@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("math_agent", "0011_batch_options_topicstats"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="batch",
+            name="budget_limit",
+            field=models.DecimalField(
+                blank=True, decimal_places=6, max_digits=12, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="batch",
+            name="max_cost_per_valid",
+            field=models.DecimalField(
+                blank=True, decimal_places=6, max_digits=10, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="batch",
+            name="reserved_cost",
+            field=models.DecimalField(decimal_places=6, default=0.0, max_digits=12),
+        ),
+    ]
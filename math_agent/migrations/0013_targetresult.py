@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("math_agent", "0012_batch_budget"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TargetResult",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("provider", models.CharField(max_length=50)),
+                ("model", models.CharField(max_length=100)),
+                ("answer", models.TextField()),
+                ("solved", models.BooleanField()),
+                ("judge", models.CharField(max_length=150)),
+                (
+                    "cost",
+                    models.DecimalField(decimal_places=6, default=0.0, max_digits=10),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "problem",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="target_results",
+                        to="math_agent.problem",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("problem", "provider", "model"),
+                        name="unique_target_result",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("math_agent", "0013_targetresult"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="problem",
+            name="solve_rate",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="targetresult",
+            name="samples",
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name="targetresult",
+            name="samples_solved",
+            field=models.IntegerField(default=0),
+        ),
+    ]
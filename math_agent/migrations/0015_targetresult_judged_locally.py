@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("math_agent", "0014_target_samples"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="targetresult",
+            name="judged_locally",
+            field=models.IntegerField(default=0),
+        ),
+    ]
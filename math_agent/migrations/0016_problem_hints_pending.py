@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("math_agent", "0015_targetresult_judged_locally"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="problem",
+            name="hints_pending",
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("math_agent", "0016_problem_hints_pending"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LLMCall",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("provider", models.CharField(max_length=50)),
+                ("model", models.CharField(max_length=100)),
+                (
+                    "role",
+                    models.CharField(
+                        choices=[
+                            ("generator", "Generator"),
+                            ("checker", "Checker"),
+                            ("target", "Target"),
+                            ("judge", "Judge"),
+                            ("hinter", "Hinter"),
+                            ("other", "Other"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("retry", models.IntegerField(default=0)),
+                ("started_at", models.DateTimeField()),
+                ("duration", models.FloatField()),
+                ("input_tokens", models.IntegerField(blank=True, null=True)),
+                ("output_tokens", models.IntegerField(blank=True, null=True)),
+                (
+                    "cost",
+                    models.DecimalField(decimal_places=6, default=0.0, max_digits=10),
+                ),
+                ("error", models.TextField(blank=True, null=True)),
+                (
+                    "attempt",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="llm_calls",
+                        to="math_agent.attempt",
+                    ),
+                ),
+                (
+                    "batch",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="llm_calls",
+                        to="math_agent.batch",
+                    ),
+                ),
+                (
+                    "problem",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="llm_calls",
+                        to="math_agent.problem",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "LLM call",
+                "indexes": [
+                    models.Index(
+                        fields=["batch", "role"], name="llmcall_batch_role_idx"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("math_agent", "0017_llmcall"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="batch",
+            name="profile_trace",
+            field=models.FileField(blank=True, null=True, upload_to="profiles/"),
+        ),
+    ]
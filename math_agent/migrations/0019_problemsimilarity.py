@@ -0,0 +1,85 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BACKFILL_CHUNK = 1000
+
+
+def backfill_similarities(apps, schema_editor):
+    """Turn the similar_problems JSON of existing problems into ProblemSimilarity rows."""
+    Problem = apps.get_model("math_agent", "Problem")
+    ProblemSimilarity = apps.get_model("math_agent", "ProblemSimilarity")
+    existing = set(Problem.objects.values_list("id", flat=True))
+
+    links = {}
+    problems = Problem.objects.exclude(similar_problems={}).values_list(
+        "id", "similar_problems"
+    )
+    for problem_id, similar_problems in problems.iterator(chunk_size=BACKFILL_CHUNK):
+        for similar_id, score in (similar_problems or {}).items():
+            similar_id = int(similar_id)
+            if similar_id == problem_id or similar_id not in existing:
+                continue
+            # Newer problem first, so a pair recorded on both problems is stored once
+            pair = (max(problem_id, similar_id), min(problem_id, similar_id))
+            links[pair] = float(score)
+
+    rows = [
+        ProblemSimilarity(problem_id=newer, similar_id=older, score=score)
+        for (newer, older), score in links.items()
+    ]
+    ProblemSimilarity.objects.bulk_create(
+        rows, batch_size=BACKFILL_CHUNK, ignore_conflicts=True
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("math_agent", "0018_batch_profile_trace"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProblemSimilarity",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("score", models.FloatField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "problem",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="similarities",
+                        to="math_agent.problem",
+                    ),
+                ),
+                (
+                    "similar",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="similar_to",
+                        to="math_agent.problem",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "Problem similarities",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("problem", "similar"), name="unique_problem_similarity"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_similarities, migrations.RunPython.noop),
+    ]
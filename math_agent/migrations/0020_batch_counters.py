@@ -0,0 +1,110 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:02
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def backfill_counters(apps, schema_editor):
+    """Count the problems, failed attempts and judged answers of existing batches."""
+    Batch = apps.get_model("math_agent", "Batch")
+    Problem = apps.get_model("math_agent", "Problem")
+    Attempt = apps.get_model("math_agent", "Attempt")
+    TargetResult = apps.get_model("math_agent", "TargetResult")
+
+    problems = {
+        row["batch_id"]: row
+        for row in Problem.objects.values("batch_id").annotate(
+            valid=Count("id", filter=Q(status="valid")),
+            solved=Count("id", filter=Q(status="solved")),
+            discarded=Count("id", filter=Q(status="discarded")),
+        )
+    }
+    errors = {
+        row["batch_id"]: row["errors"]
+        for row in Attempt.objects.filter(status="failed")
+        .values("batch_id")
+        .annotate(errors=Count("id"))
+    }
+    judging = {
+        row["problem__batch_id"]: row
+        for row in TargetResult.objects.values("problem__batch_id").annotate(
+            judged=Sum("samples"), judged_locally=Sum("judged_locally")
+        )
+    }
+
+    batches = list(Batch.objects.all())
+    for batch in batches:
+        counts = problems.get(batch.id, {})
+        batch.valid_count = counts.get("valid", 0)
+        batch.solved_count = counts.get("solved", 0)
+        batch.discarded_count = counts.get("discarded", 0)
+        batch.error_count = errors.get(batch.id, 0)
+        batch.attempt_count = (
+            batch.valid_count
+            + batch.solved_count
+            + batch.discarded_count
+            + batch.error_count
+        )
+        batch.judged_count = judging.get(batch.id, {}).get("judged") or 0
+        batch.judged_locally_count = (
+            judging.get(batch.id, {}).get("judged_locally") or 0
+        )
+    Batch.objects.bulk_update(
+        batches,
+        [
+            "valid_count",
+            "solved_count",
+            "discarded_count",
+            "error_count",
+            "attempt_count",
+            "judged_count",
+            "judged_locally_count",
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("math_agent", "0019_problemsimilarity"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="batch",
+            name="attempt_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="batch",
+            name="discarded_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="batch",
+            name="error_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="batch",
+            name="judged_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="batch",
+            name="judged_locally_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="batch",
+            name="solved_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="batch",
+            name="valid_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
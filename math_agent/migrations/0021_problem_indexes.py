@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("math_agent", "0020_batch_counters"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="problem",
+            name="batch",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="problems",
+                to="math_agent.batch",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="problem",
+            index=models.Index(
+                fields=["batch", "status", "created_at", "id"],
+                name="problem_batch_status_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="problem",
+            index=models.Index(
+                fields=["batch", "created_at", "id"], name="problem_batch_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="problem",
+            index=models.Index(
+                fields=["status", "created_at", "id"], name="problem_status_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="problem",
+            index=models.Index(fields=["created_at", "id"], name="problem_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="problem",
+            index=models.Index(
+                fields=["subject", "topic"], name="problem_subject_topic_idx"
+            ),
+        ),
+    ]
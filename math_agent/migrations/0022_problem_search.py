@@ -0,0 +1,82 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:24
+
+from django.db import migrations
+
+# The DDL is spelled out here rather than imported from math_agent.utils.search, so
+# later changes to the runtime index code don't change what this migration does.
+
+SQLITE_HINTS_TEXT = "(SELECT group_concat(value, ' ') FROM json_each({row}.hints))"
+
+SQLITE_SEARCH_SQL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS math_agent_problem_fts
+        USING fts5(question, answer, hints, tokenize='porter unicode61')""",
+    f"""CREATE TRIGGER IF NOT EXISTS math_agent_problem_fts_insert AFTER INSERT ON math_agent_problem BEGIN
+        INSERT INTO math_agent_problem_fts(rowid, question, answer, hints)
+        VALUES (new.id, new.question, new.answer, {SQLITE_HINTS_TEXT.format(row='new')});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS math_agent_problem_fts_update AFTER UPDATE OF question, answer, hints ON math_agent_problem BEGIN
+        DELETE FROM math_agent_problem_fts WHERE rowid = old.id;
+        INSERT INTO math_agent_problem_fts(rowid, question, answer, hints)
+        VALUES (new.id, new.question, new.answer, {SQLITE_HINTS_TEXT.format(row='new')});
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS math_agent_problem_fts_delete AFTER DELETE ON math_agent_problem BEGIN
+        DELETE FROM math_agent_problem_fts WHERE rowid = old.id;
+    END""",
+]
+SQLITE_FILL_SQL = f"""INSERT INTO math_agent_problem_fts(rowid, question, answer, hints)
+    SELECT id, question, answer, {SQLITE_HINTS_TEXT.format(row='math_agent_problem')} FROM math_agent_problem"""
+SQLITE_DROP_SQL = [
+    "DROP TRIGGER IF EXISTS math_agent_problem_fts_insert",
+    "DROP TRIGGER IF EXISTS math_agent_problem_fts_update",
+    "DROP TRIGGER IF EXISTS math_agent_problem_fts_delete",
+    "DROP TABLE IF EXISTS math_agent_problem_fts",
+]
+
+POSTGRES_SEARCH_SQL = [
+    """ALTER TABLE math_agent_problem ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(question, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(answer, '')), 'B') ||
+        setweight(jsonb_to_tsvector('english', coalesce(hints, '{}'::jsonb), '["string"]'), 'C')
+    ) STORED""",
+    "CREATE INDEX IF NOT EXISTS problem_search_idx ON math_agent_problem USING GIN (search_vector)",
+]
+POSTGRES_DROP_SQL = [
+    "DROP INDEX IF EXISTS problem_search_idx",
+    "ALTER TABLE math_agent_problem DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def run_statements(schema_editor, statements):
+    for statement in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement, params=None)
+
+
+def create_search_index(apps, schema_editor):
+    """Full-text index over question, answer and hints, filled with the existing problems."""
+    connection = schema_editor.connection
+    new = (
+        connection.vendor == "sqlite"
+        and "math_agent_problem_fts" not in connection.introspection.table_names()
+    )
+    run_statements(
+        schema_editor, {"sqlite": SQLITE_SEARCH_SQL, "postgresql": POSTGRES_SEARCH_SQL}
+    )
+    if new:
+        schema_editor.execute(SQLITE_FILL_SQL, params=None)
+
+
+def remove_search_index(apps, schema_editor):
+    run_statements(
+        schema_editor, {"sqlite": SQLITE_DROP_SQL, "postgresql": POSTGRES_DROP_SQL}
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("math_agent", "0021_problem_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, remove_search_index),
+    ]
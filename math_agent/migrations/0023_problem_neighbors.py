@@ -0,0 +1,82 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_neighbors(apps, schema_editor):
+    """Build the top neighbour lists of existing problems from their similarity links."""
+    neighbors = apps.get_model("math_agent", "ProblemNeighbor")._meta.db_table
+    similarities = apps.get_model("math_agent", "ProblemSimilarity")._meta.db_table
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f"""INSERT INTO {neighbors} (problem_id, neighbor_id, score)
+            SELECT problem_id, neighbor_id, score FROM (
+                SELECT problem_id, neighbor_id, score,
+                    ROW_NUMBER() OVER (PARTITION BY problem_id ORDER BY score DESC, neighbor_id) AS position
+                FROM (
+                    SELECT problem_id, similar_id AS neighbor_id, score FROM {similarities}
+                    UNION ALL
+                    SELECT similar_id, problem_id, score FROM {similarities}
+                ) links
+            ) ranked
+            WHERE position <= %s""",
+            [getattr(settings, "SIMILAR_PROBLEMS_TOP_K", 20)],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("math_agent", "0022_problem_search"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProblemNeighbor",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("score", models.FloatField()),
+                (
+                    "neighbor",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="math_agent.problem",
+                    ),
+                ),
+                (
+                    "problem",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="neighbors",
+                        to="math_agent.problem",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["problem", "-score", "neighbor"],
+                        name="problem_neighbor_score_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("problem", "neighbor"), name="unique_problem_neighbor"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_neighbors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("math_agent", "0023_problem_neighbors"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="batch",
+            name="coordinator",
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name="batch",
+            name="coordinator_expires_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -4,11 +4,35 @@ from django.core.validators import MinValueValidator
 # Create your models here.
 
 class Batch(models.Model):
+    STATUS_CHOICES = [
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('stopped', 'Stopped'),
+        ('interrupted', 'Interrupted')
+    ]
+
     name = models.CharField(max_length=255)
     taxonomy_json = models.JSONField()
     pipeline = models.JSONField()  # Dictionary of dictionaries for generator, hinter, checker, target, judge
     number_of_valid_needed = models.IntegerField(validators=[MinValueValidator(1)])
+    mcq_mode = models.BooleanField(default=False)
+    options = models.JSONField(default=dict, blank=True)  # Optional run settings, e.g. {"sampler": {"policy": "bandit"}}
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='running')
     batch_cost = models.DecimalField(max_digits=12, decimal_places=6, default=0.00)  # Track total batch cost
+    budget_limit = models.DecimalField(max_digits=12, decimal_places=6, null=True, blank=True)  # Hard cap on total batch spend
+    max_cost_per_valid = models.DecimalField(max_digits=10, decimal_places=6, null=True, blank=True)  # Spend allowed per valid problem needed
+    reserved_cost = models.DecimalField(max_digits=12, decimal_places=6, default=0.00)  # Estimated cost of LLM calls in flight
+    coordinator = models.CharField(max_length=255, null=True, blank=True)  # Process dispatching the batch's attempts
+    coordinator_expires_at = models.DateTimeField(null=True, blank=True)
+    profile_trace = models.FileField(upload_to='profiles/', null=True, blank=True)  # Chrome trace of the last profiled run
+    # Outcome counters kept up to date by the pipeline, so pages don't count problems
+    valid_count = models.IntegerField(default=0)
+    solved_count = models.IntegerField(default=0)
+    discarded_count = models.IntegerField(default=0)
+    error_count = models.IntegerField(default=0)  # Attempts that failed
+    attempt_count = models.IntegerField(default=0)  # Finished attempts: saved problems plus failed attempts
+    judged_count = models.IntegerField(default=0)  # Judged target answer samples
+    judged_locally_count = models.IntegerField(default=0)  # ...of which decided by the local judge
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -30,14 +54,16 @@ class Problem(models.Model):
     question = models.TextField()
     answer = models.TextField()
     hints = models.JSONField()  # Dictionary of hints
+    hints_pending = models.BooleanField(default=False)  # Hints deferred until the problem turned out valid
     rejection_reason = models.TextField(null=True, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES)
-    batch = models.ForeignKey(Batch, on_delete=models.CASCADE, related_name='problems')
+    batch = models.ForeignKey(Batch, on_delete=models.CASCADE, related_name='problems', db_index=False)  # Indexed by the composite indexes below
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     problem_embedding = models.JSONField(null=True, blank=True)
     similar_problems = models.JSONField(default=dict, blank=True)
     cost = models.DecimalField(max_digits=10, decimal_places=6, default=0.00)  # Track cost up to 6 decimal places
+    solve_rate = models.FloatField(null=True, blank=True)  # Share of judged target samples that solved the problem; pass@k stops drawing after the first solve
 
     def __str__(self):
         return f"{self.subject} - {self.topic} - {self.status}"
@@ -45,3 +71,185 @@ class Problem(models.Model):
     class Meta:
         verbose_name_plural = "Problems"
         ordering = ['-created_at']
+        indexes = [
+            # Problem lists filter by batch and/or status and page newest first on (created_at, id)
+            models.Index(fields=['batch', 'status', 'created_at', 'id'], name='problem_batch_status_idx'),
+            models.Index(fields=['batch', 'created_at', 'id'], name='problem_batch_created_idx'),
+            models.Index(fields=['status', 'created_at', 'id'], name='problem_status_created_idx'),
+            models.Index(fields=['created_at', 'id'], name='problem_created_idx'),
+            models.Index(fields=['subject', 'topic'], name='problem_subject_topic_idx')
+        ]
+
+
+class Attempt(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled')
+    ]
+
+    batch = models.ForeignKey(Batch, on_delete=models.CASCADE, related_name='attempts')
+    number = models.IntegerField()  # Attempt number within the batch
+    subject = models.CharField(max_length=100)
+    topic = models.CharField(max_length=100)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    outcome = models.CharField(max_length=20, choices=Problem.STATUS_CHOICES, null=True, blank=True)
+    failed_stage = models.CharField(max_length=20, null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
+    problem = models.OneToOneField(Problem, on_delete=models.SET_NULL, null=True, blank=True, related_name='attempt')
+    lease_owner = models.CharField(max_length=255, null=True, blank=True)  # Worker currently holding the attempt
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    lease_version = models.IntegerField(default=0)  # Bumped on every claim, used for compare-and-set
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Batch {self.batch_id} - Attempt {self.number} - {self.status}"
+
+    class Meta:
+        ordering = ['number']
+        constraints = [
+            models.UniqueConstraint(fields=['batch', 'number'], name='unique_attempt_number_per_batch')
+        ]
+        indexes = [
+            models.Index(fields=['status', 'lease_expires_at'], name='attempt_claim_idx')
+        ]
+
+class AttemptStage(models.Model):
+    STAGE_CHOICES = [
+        ('generator', 'Generator'),
+        ('checker', 'Checker'),
+        ('target', 'Target'),
+        ('judge', 'Judge')
+    ]
+
+    attempt = models.ForeignKey(Attempt, on_delete=models.CASCADE, related_name='stages')
+    stage = models.CharField(max_length=20, choices=STAGE_CHOICES)
+    output = models.JSONField()  # Stage result, reused instead of calling the model again on retry/resume
+    cost = models.DecimalField(max_digits=10, decimal_places=6, default=0.00)
+    retries = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Attempt {self.attempt_id} - {self.stage}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['attempt', 'stage'], name='unique_stage_per_attempt')
+        ]
+
+class TargetResult(models.Model):
+    # How one target model did on a problem, so a single generation can be evaluated against several targets
+    problem = models.ForeignKey(Problem, on_delete=models.CASCADE, related_name='target_results')
+    provider = models.CharField(max_length=50)
+    model = models.CharField(max_length=100)
+    answer = models.TextField()
+    solved = models.BooleanField()
+    judge = models.CharField(max_length=150)  # provider/model of the judge that graded the answer
+    cost = models.DecimalField(max_digits=10, decimal_places=6, default=0.00)  # Target plus judge cost
+    samples = models.IntegerField(default=1)  # Target answers judged (pass@k stops drawing after the first solve)
+    samples_solved = models.IntegerField(default=0)
+    judged_locally = models.IntegerField(default=0)  # Judged samples decided without calling the judge model
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Problem {self.problem_id} - {self.provider}/{self.model}: {'solved' if self.solved else 'unsolved'}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['problem', 'provider', 'model'], name='unique_target_result')
+        ]
+
+class ProblemSimilarity(models.Model):
+    # Similarity link between two problems, stored once with the newer problem first.
+    # Saving a problem only inserts these rows, so it never locks the older problems it resembles.
+    problem = models.ForeignKey(Problem, on_delete=models.CASCADE, related_name='similarities')
+    similar = models.ForeignKey(Problem, on_delete=models.CASCADE, related_name='similar_to')
+    score = models.FloatField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Problem {self.problem_id} ~ {self.similar_id}: {self.score:.3f}"
+
+    class Meta:
+        verbose_name_plural = "Problem similarities"
+        constraints = [
+            models.UniqueConstraint(fields=['problem', 'similar'], name='unique_problem_similarity')
+        ]
+
+
+class ProblemNeighbor(models.Model):
+    # One of a problem's most similar problems, from either side of a ProblemSimilarity link.
+    # Capped to the top SIMILAR_PROBLEMS_TOP_K per problem when links are saved, so a problem's page reads them with one query.
+    problem = models.ForeignKey(Problem, on_delete=models.CASCADE, related_name='neighbors', db_index=False)  # Indexed by problem_neighbor_score_idx
+    neighbor = models.ForeignKey(Problem, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+
+    def __str__(self):
+        return f"Problem {self.problem_id} -> {self.neighbor_id}: {self.score:.3f}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['problem', 'neighbor'], name='unique_problem_neighbor')
+        ]
+        indexes = [
+            models.Index(fields=['problem', '-score', 'neighbor'], name='problem_neighbor_score_idx')
+        ]
+
+class LLMCall(models.Model):
+    # Telemetry for a single LLM request, written in bulk by utils/telemetry.py
+    ROLE_CHOICES = [
+        ('generator', 'Generator'),
+        ('checker', 'Checker'),
+        ('target', 'Target'),
+        ('judge', 'Judge'),
+        ('hinter', 'Hinter'),
+        ('other', 'Other')
+    ]
+
+    provider = models.CharField(max_length=50)
+    model = models.CharField(max_length=100)
+    role = models.CharField(max_length=20, choices=ROLE_CHOICES)
+    batch = models.ForeignKey(Batch, on_delete=models.SET_NULL, null=True, blank=True, related_name='llm_calls')
+    attempt = models.ForeignKey(Attempt, on_delete=models.SET_NULL, null=True, blank=True, related_name='llm_calls')
+    problem = models.ForeignKey(Problem, on_delete=models.SET_NULL, null=True, blank=True, related_name='llm_calls')
+    retry = models.IntegerField(default=0)  # Stage retry the call was made on
+    started_at = models.DateTimeField()
+    duration = models.FloatField()  # Seconds
+    input_tokens = models.IntegerField(null=True, blank=True)
+    output_tokens = models.IntegerField(null=True, blank=True)
+    cost = models.DecimalField(max_digits=10, decimal_places=6, default=0.00)
+    error = models.TextField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.role} {self.provider}/{self.model} at {self.started_at}"
+
+    class Meta:
+        verbose_name = "LLM call"
+        indexes = [
+            models.Index(fields=['batch', 'role'], name='llmcall_batch_role_idx')
+        ]
+
+class TopicStats(models.Model):
+    # Outcomes per taxonomy topic across all batches, used to steer topic sampling
+    subject = models.CharField(max_length=100)
+    topic = models.CharField(max_length=100)
+    attempts = models.IntegerField(default=0)
+    valid = models.IntegerField(default=0)
+    solved = models.IntegerField(default=0)
+    discarded = models.IntegerField(default=0)
+    errors = models.IntegerField(default=0)
+    cost = models.DecimalField(max_digits=12, decimal_places=6, default=0.00)
+    seconds = models.FloatField(default=0.0)  # Wall-clock time spent on attempts
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.subject} - {self.topic}: {self.valid}/{self.attempts} valid"
+
+    class Meta:
+        verbose_name_plural = "Topic stats"
+        constraints = [
+            models.UniqueConstraint(fields=['subject', 'topic'], name='unique_topic_stats')
+        ]
@@ -1,3 +1,913 @@
-from django.test import TestCase
+import contextlib
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from fractions import Fraction
+from unittest import mock
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from .models import Batch, Problem, ProblemNeighbor, Attempt, AttemptStage
+from .utils import leases
+from .utils.budget import reserve_call, settle_call, charge_to_batch, BudgetExceeded
+from .utils import batch_runner
+from .utils.batch_runner import run_batch, resume_batch, generate_for_group, BatchBusy
+from .utils.generator import generate_problems
+from .utils.importer import import_batch, import_problems
+from .utils.local_judge import normalize_answer, split_assignment, parse_number, parse_choices, local_verdict, mcq_verdict, judge_answer
+from .utils.evaluation import sample_until_solved, derive_status, pipeline_targets, fan_out
+from .utils.dispatch import plan_dispatch, estimate_valid_yield, DEFAULT_PRIOR_YIELD, MIN_YIELD
+from .utils.batch_stats import rebuild_batch_stats
+from .utils.checker import check_problem
+from .utils.hinter import fill_pending_hints
+from .utils.system_messages import CHECKER_NO_HINTS_MESSAGE, HINT_CHECKER_MESSAGE
+from .utils.search import search_problems
+from .utils.similarity_utils import NEIGHBOR_LIMIT, link_similar_problems, rebuild_neighbors, top_neighbors, similar_problems_page
 
 # Create your tests here.
+
+PROBLEM_TABLE = Problem._meta.db_table
+
+
+class ProblemQueryPlanTests(TestCase):
+    """
+    The problem pages should read problems through the composite indexes, without a
+    full table scan or a sort, on SQLite and on PostgreSQL.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.batches = [
+            Batch.objects.create(name=f"Batch {i}", taxonomy_json={}, pipeline={}, number_of_valid_needed=1)
+            for i in range(3)
+        ]
+        Problem.objects.bulk_create([
+            Problem(
+                subject=f"Subject {i % 4}",
+                topic=f"Topic {i % 7}",
+                question=f"Question {i}",
+                answer='42',
+                hints={},
+                status=['valid', 'solved', 'discarded'][i % 3],
+                batch=cls.batches[i % 3]
+            )
+            for i in range(300)
+        ])
+        rebuild_batch_stats()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def explain(self, sql, params=()):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # The test tables are small enough that a sequential scan would always win
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute(f'EXPLAIN {sql}', params)
+            else:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+
+    def problem_plans(self, url):
+        """Query plans of the queries a page runs against the problem table."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [
+            self.explain(query['sql'])
+            for query in queries.captured_queries
+            if query['sql'].startswith('SELECT') and f'"{PROBLEM_TABLE}"' in query['sql']
+        ]
+
+    def assertIndexScan(self, plan, index=None):
+        if connection.vendor == 'postgresql':
+            self.assertNotIn(f'Seq Scan on {PROBLEM_TABLE}', plan)
+            self.assertNotRegex(plan, r'(?m)^\s*(->\s*)?Sort\b')
+        else:
+            self.assertNotRegex(plan, rf'(?m)SCAN {PROBLEM_TABLE}$')
+            self.assertNotIn('TEMP B-TREE', plan)
+        if index is not None:
+            self.assertIn(index, plan)
+
+    def next_page_url(self, url):
+        response = self.client.get(url)
+        match = re.search(r'href="(\?[^"]*after=[^"]*)"', response.content.decode())
+        self.assertIsNotNone(match)
+        return url.split('?')[0] + match.group(1).replace('&amp;', '&')
+
+    def test_batch_problem_list_by_status(self):
+        url = reverse('math_agent:problems', args=[self.batches[0].id]) + '?status=valid&page_size=10'
+        for page_url in (url, self.next_page_url(url)):
+            plans = self.problem_plans(page_url)
+            self.assertEqual(len(plans), 1)
+            self.assertIndexScan(plans[0], 'problem_batch_status_idx')
+
+    def test_batch_problem_list(self):
+        url = reverse('math_agent:problems', args=[self.batches[0].id]) + '?page_size=10'
+        for page_url in (url, self.next_page_url(url)):
+            plans = self.problem_plans(page_url)
+            self.assertEqual(len(plans), 1)
+            self.assertIndexScan(plans[0], 'problem_batch_created_idx')
+
+    def test_all_problems_by_status(self):
+        url = reverse('math_agent:all_problems') + '?status=solved&page_size=10'
+        for page_url in (url, self.next_page_url(url)):
+            plans = self.problem_plans(page_url)
+            self.assertEqual(len(plans), 1)
+            self.assertIndexScan(plans[0], 'problem_status_created_idx')
+
+    def test_all_problems(self):
+        url = reverse('math_agent:all_problems') + '?page_size=10'
+        for page_url in (url, self.next_page_url(url)):
+            plans = self.problem_plans(page_url)
+            self.assertEqual(len(plans), 1)
+            self.assertIndexScan(plans[0], 'problem_created_idx')
+
+    def test_problem_detail(self):
+        problem = Problem.objects.filter(batch=self.batches[1]).first()
+        plans = self.problem_plans(reverse('math_agent:problem_detail', args=[problem.id]))
+        self.assertTrue(plans)
+        for plan in plans:
+            self.assertIndexScan(plan)
+
+    def test_batch_pages_use_stored_counters(self):
+        for url in (reverse('math_agent:batch_list'), reverse('math_agent:batch_detail', args=[self.batches[2].id])):
+            self.assertEqual(self.problem_plans(url), [])
+
+    def test_stats_rebuild(self):
+        with CaptureQueriesContext(connection) as queries:
+            rebuild_batch_stats([batch.id for batch in self.batches])
+        plans = [
+            self.explain(query['sql'])
+            for query in queries.captured_queries
+            if query['sql'].startswith('SELECT') and f'FROM "{PROBLEM_TABLE}"' in query['sql']
+        ]
+        self.assertEqual(len(plans), 1)
+        self.assertIndexScan(plans[0], 'problem_batch_status_idx')
+
+    def test_subject_topic_filter(self):
+        queryset = Problem.objects.filter(subject='Subject 1', topic='Topic 3').order_by().values_list('id', flat=True)
+        sql, params = queryset.query.sql_with_params()
+        self.assertIndexScan(self.explain(sql, params), 'problem_subject_topic_idx')
+
+
+class ProblemSearchTests(TestCase):
+    """The full-text index follows problem writes, and search ranks, filters and pages its results."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.batch = Batch.objects.create(name="Algebra", taxonomy_json={}, pipeline={}, number_of_valid_needed=1)
+        cls.other_batch = Batch.objects.create(name="Geometry", taxonomy_json={}, pipeline={}, number_of_valid_needed=1)
+        cls.in_question, cls.in_hints, cls.other = Problem.objects.bulk_create([
+            Problem(subject='Algebra', topic='Quadratics', question='Solve the quadratic equation x^2 - 5x + 6 = 0', answer='2 and 3',
+                    hints={'0': 'Factor the left side'}, status='valid', batch=cls.batch),
+            Problem(subject='Algebra', topic='Roots', question='Find both roots of x^2 = 9', answer='3 and -3',
+                    hints={'0': 'No need for the quadratic formula'}, status='solved', batch=cls.batch),
+            Problem(subject='Geometry', topic='Triangles', question='Find the area of a triangle with base 4 and height 6', answer='12',
+                    hints={}, status='valid', batch=cls.other_batch)
+        ])
+
+    def ids(self, text, **filters):
+        return [problem.id for problem in search_problems(text, **filters).items]
+
+    def test_ranks_question_matches_first(self):
+        self.assertEqual(self.ids('quadratic'), [self.in_question.id, self.in_hints.id])
+        self.assertEqual(self.ids('equations'), [self.in_question.id])
+
+    def test_filters(self):
+        self.assertEqual(self.ids('quadratic', status='solved'), [self.in_hints.id])
+        self.assertEqual(self.ids('find', batch_id=self.other_batch.id), [self.other.id])
+
+    def test_index_follows_writes(self):
+        problem = Problem.objects.create(subject='Number Theory', topic='Primes', question='Count the primes below 100', answer='25',
+                                         hints={'0': 'Use the sieve of Eratosthenes'}, status='valid', batch=self.batch)
+        self.assertEqual(self.ids('eratosthenes'), [problem.id])
+        problem.question = 'Count the composite numbers below 100'
+        problem.save()
+        self.assertEqual(self.ids('primes'), [])
+        self.assertEqual(self.ids('composite'), [problem.id])
+        problem.delete()
+        self.assertEqual(self.ids('composite'), [])
+
+    def test_user_syntax_is_searched_as_words(self):
+        self.assertEqual(self.ids('"triangle" AND (area'), [self.other.id])
+        self.assertEqual(self.ids(' ?! '), [])
+
+    def test_pages(self):
+        first = search_problems('find', page_size=1)
+        second = search_problems('find', page=2, page_size=1)
+        self.assertTrue(first.has_next)
+        self.assertFalse(second.has_next)
+        self.assertEqual({problem.id for problem in first.items + second.items}, {self.in_hints.id, self.other.id})
+
+    def test_search_view(self):
+        response = self.client.get(reverse('math_agent:search'), {'q': 'quadratic', 'format': 'json', 'page_size': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['id'] for result in response.json()['results']], [self.in_question.id])
+        self.assertTrue(response.json()['has_next'])
+        response = self.client.get(reverse('math_agent:search'), {'q': 'triangle'})
+        self.assertContains(response, reverse('math_agent:problem_detail', args=[self.other.id]))
+
+
+class ProblemNeighborTests(TestCase):
+    """Each problem keeps its top similar problems as they are linked; the rest stay reachable page by page."""
+
+    @classmethod
+    def setUpTestData(cls):
+        batch = Batch.objects.create(name="Batch", taxonomy_json={}, pipeline={}, number_of_valid_needed=1)
+        cls.hub = Problem.objects.create(subject='S', topic='T', question='Hub', answer='1', hints={}, status='valid', batch=batch)
+        cls.scores = {}
+        for group in range(3):
+            problems = [
+                Problem(subject='S', topic='T', question=f'Problem {group}-{i}', answer='1', hints={}, status='valid', batch=batch,
+                        similar_problems={str(cls.hub.id): 0.5 + (group * 10 + i) / 100})
+                for i in range(10)
+            ]
+            Problem.objects.bulk_create(problems)
+            link_similar_problems(problems)
+            cls.scores.update({problem.id: problem.similar_problems[str(cls.hub.id)] for problem in problems})
+        cls.ranked = sorted(cls.scores, key=lambda problem_id: -cls.scores[problem_id])
+
+    def test_top_neighbors_are_capped_and_sorted(self):
+        neighbors = top_neighbors(self.hub.id)
+        self.assertEqual([neighbor['neighbor_id'] for neighbor in neighbors], self.ranked[:NEIGHBOR_LIMIT])
+        self.assertEqual(ProblemNeighbor.objects.filter(problem=self.hub).count(), NEIGHBOR_LIMIT)
+        # The older side of a link lists the newer one too
+        self.assertEqual([neighbor['neighbor_id'] for neighbor in top_neighbors(self.ranked[0])], [self.hub.id])
+
+    def test_rebuild_matches_incremental_lists(self):
+        before = top_neighbors(self.hub.id)
+        rebuild_neighbors()
+        self.assertEqual(top_neighbors(self.hub.id), before)
+
+    def test_pages_cover_every_similar_problem(self):
+        seen, after = [], None
+        while True:
+            page = similar_problems_page(self.hub.id, after, page_size=7)
+            seen += [row['neighbor_id'] for row in page.items]
+            if not page.has_next:
+                break
+            after = page.next_cursor
+        self.assertEqual(seen, self.ranked)
+
+    def test_detail_page_reads_neighbors_with_one_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('math_agent:problem_detail', args=[self.hub.id]))
+        self.assertContains(response, reverse('math_agent:similar_problems', args=[self.hub.id]))
+        neighbor_queries = [query['sql'] for query in queries.captured_queries if ProblemNeighbor._meta.db_table in query['sql']]
+        self.assertEqual(len(neighbor_queries), 1)
+        self.assertFalse(any('problem_embedding' in query['sql'] for query in queries.captured_queries))
+
+
+class DeferredHintTests(TestCase):
+    """Problems generated without hints are checked without hint validation; their hints are checked once written."""
+
+    CHECKER = {'provider': 'openai', 'model': 'checker'}
+
+    def setUp(self):
+        batch = Batch.objects.create(
+            name="Batch", taxonomy_json={}, number_of_valid_needed=1,
+            pipeline={'generator': {'provider': 'openai', 'model': 'generator'}, 'checker': self.CHECKER}
+        )
+        self.problem = Problem.objects.create(
+            subject='S', topic='T', question='Q', answer='1', hints={}, hints_pending=True, status='valid', batch=batch, cost=0
+        )
+
+    def test_problem_checked_without_hints(self):
+        with mock.patch('math_agent.utils.checker.call_llm', return_value=({'valid': True, 'corrected_hints': {'0': 'x'}}, 0.1)) as call:
+            is_valid, _, corrected_hints, _ = check_problem('Q', '1', {}, self.CHECKER, with_hints=False)
+        messages = call.call_args.args[1]
+        self.assertEqual(messages[0]['content'], CHECKER_NO_HINTS_MESSAGE)
+        self.assertNotIn('HINT VALIDATION', messages[0]['content'])
+        self.assertNotIn('hints', messages[1]['content'])
+        self.assertTrue(is_valid)
+        self.assertEqual(corrected_hints, {})
+
+    def test_written_hints_are_checked(self):
+        with mock.patch('math_agent.utils.hinter.call_llm', return_value=({'hints': {'0': 'a', '1': 'b'}}, 0.1)), \
+                mock.patch('math_agent.utils.checker.call_llm', return_value=({'valid': True, 'corrected_hints': {'0': 'a', '1': 'c'}}, 0.2)) as check:
+            counts = fill_pending_hints(self.problem.batch_id)
+        self.assertEqual(counts, {'hinted': 1, 'failed': 0})
+        self.assertEqual(check.call_args.args[1][0]['content'], HINT_CHECKER_MESSAGE)
+        self.problem.refresh_from_db()
+        self.assertEqual(self.problem.hints, {'0': 'a', '1': 'c'})
+        self.assertFalse(self.problem.hints_pending)
+        self.assertAlmostEqual(float(self.problem.cost), 0.3)
+
+    def test_rejected_hints_stay_pending(self):
+        with mock.patch('math_agent.utils.hinter.call_llm', return_value=({'hints': {'0': 'a'}}, 0.1)), \
+                mock.patch('math_agent.utils.checker.call_llm', return_value=({'valid': False, 'reason': 'wrong'}, 0.2)):
+            counts = fill_pending_hints(self.problem.batch_id)
+        self.assertEqual(counts, {'hinted': 0, 'failed': 1})
+        self.problem.refresh_from_db()
+        self.assertEqual(self.problem.hints, {})
+        self.assertTrue(self.problem.hints_pending)
+
+
+@mock.patch('math_agent.utils.leases.lease_keeper')
+class LeaseTests(TestCase):
+    """Attempts are claimed by one worker at a time, and re-issued only once their lease expired."""
+
+    def setUp(self):
+        self.batch = Batch.objects.create(name="Batch", taxonomy_json={}, pipeline={}, number_of_valid_needed=1)
+        self.attempt = Attempt.objects.create(batch=self.batch, number=1, subject='S', topic='T')
+
+    def test_attempt_is_claimed_once(self, keeper):
+        claimed = leases.claim_attempt('worker-1', self.batch.id)
+        self.assertEqual(claimed.id, self.attempt.id)
+        self.assertEqual((claimed.status, claimed.lease_owner, claimed.lease_version), ('running', 'worker-1', 1))
+        self.assertIsNone(leases.claim_attempt('worker-2', self.batch.id))
+        keeper.hold.assert_called_once_with(self.attempt.id, 'worker-1')
+
+    def test_expired_lease_is_reissued(self, keeper):
+        leases.claim_attempt('worker-1', self.batch.id)
+        Attempt.objects.filter(id=self.attempt.id).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        claimed = leases.claim_attempt('worker-2', self.batch.id)
+        self.assertEqual((claimed.lease_owner, claimed.lease_version), ('worker-2', 2))
+        # The first worker lost its lease and can no longer finish the attempt
+        self.assertFalse(leases.owns_attempt(self.attempt, 'worker-1'))
+        self.assertFalse(leases.finish_attempt(self.attempt, 'worker-1', 'completed'))
+        self.assertTrue(leases.finish_attempt(self.attempt, 'worker-2', 'completed'))
+
+    def test_attempt_cancelled_after_being_read_is_not_claimed(self, keeper):
+        claimable = leases.claimable_attempts
+        batch = self.batch
+
+        class CancelledAfterRead:
+            """Candidates whose batch is cancelled right after the worker read them."""
+
+            def __init__(self, attempts):
+                self.attempts = attempts
+
+            def values_list(self, *fields):
+                self.fields = fields
+                return self
+
+            def __getitem__(self, key):
+                candidates = list(self.attempts.values_list(*self.fields)[key])
+                batch.attempts.filter(status__in=['pending', 'running']).update(status='cancelled')
+                return candidates
+
+        calls = []
+
+        def claimable_attempts(*args, **kwargs):
+            calls.append(args)
+            attempts = claimable(*args, **kwargs)
+            return CancelledAfterRead(attempts) if len(calls) == 1 else attempts
+
+        with mock.patch('math_agent.utils.leases.claimable_attempts', side_effect=claimable_attempts):
+            self.assertIsNone(leases.claim_attempt('worker-1', self.batch.id))
+        self.attempt.refresh_from_db()
+        self.assertEqual(self.attempt.status, 'cancelled')
+        keeper.hold.assert_not_called()
+
+    def test_released_attempt_can_be_claimed_again(self, keeper):
+        attempt = leases.claim_attempt('worker-1', self.batch.id)
+        leases.release_attempt(attempt, 'worker-1')
+        self.assertEqual(leases.claim_attempt('worker-2', self.batch.id).lease_owner, 'worker-2')
+
+    def test_lease_released_after_commit(self, keeper):
+        attempt = leases.claim_attempt('worker-1', self.batch.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.assertTrue(leases.finish_attempt(attempt, 'worker-1', 'completed'))
+                # Still renewed while the write can roll back
+                keeper.release.assert_not_called()
+        keeper.release.assert_called_once_with(attempt.id)
+
+    def test_lease_kept_when_write_rolls_back(self, keeper):
+        attempt = leases.claim_attempt('worker-1', self.batch.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(ValueError), transaction.atomic():
+                leases.finish_attempt(attempt, 'worker-1', 'completed')
+                raise ValueError("write failed")
+        keeper.release.assert_not_called()
+        self.assertTrue(leases.owns_attempt(attempt, 'worker-1'))
+
+    def test_stopped_batch_is_not_claimed(self, keeper):
+        Batch.objects.filter(id=self.batch.id).update(status='stopped')
+        self.assertIsNone(leases.claim_attempt('worker-1', self.batch.id))
+
+
+class DispatchTests(SimpleTestCase):
+    """Attempts in flight are sized from the smoothed valid yield."""
+
+    def test_prior_before_any_result(self):
+        self.assertEqual(estimate_valid_yield(0, 0), DEFAULT_PRIOR_YIELD)
+        # 10 valid needed at the prior's 20% yield
+        self.assertEqual(plan_dispatch(0, 0, 0, 10, 100), (50, 50, DEFAULT_PRIOR_YIELD))
+
+    def test_observed_yield_takes_over(self):
+        self.assertAlmostEqual(estimate_valid_yield(50, 95), (50 + 1) / 100)
+        new_tasks, desired, _ = plan_dispatch(50, 95, 3, 60, 100)
+        self.assertEqual((new_tasks, desired), (17, 20))
+
+    def test_yield_never_below_minimum(self):
+        self.assertEqual(estimate_valid_yield(0, 1000), MIN_YIELD)
+
+    def test_in_flight_is_capped(self):
+        self.assertEqual(plan_dispatch(0, 0, 0, 1000, 20)[:2], (20, 20))
+        self.assertEqual(plan_dispatch(0, 0, 25, 1000, 20)[:2], (0, 20))
+
+    def test_nothing_dispatched_at_target(self):
+        self.assertEqual(plan_dispatch(10, 30, 5, 10, 100)[:2], (0, 0))
+        self.assertEqual(plan_dispatch(12, 30, 5, 10, 100)[:2], (0, 0))
+
+
+@mock.patch('math_agent.utils.budget.estimate_call_cost', return_value=0.4)
+class BudgetTests(TestCase):
+    """LLM calls reserve their estimated cost and are refused once a cap would be exceeded."""
+
+    MESSAGES = [{'role': 'user', 'content': 'Q'}]
+
+    def batch(self, **caps):
+        return Batch.objects.create(name="Batch", taxonomy_json={}, pipeline={}, number_of_valid_needed=2, **caps)
+
+    def reserve(self, batch):
+        with charge_to_batch(batch.id) as scope:
+            try:
+                return reserve_call('openai', 'model', self.MESSAGES)
+            finally:
+                self.refused = scope['refused']
+
+    def test_no_reservation_outside_a_batch(self, estimate):
+        self.assertIsNone(reserve_call('openai', 'model', self.MESSAGES))
+
+    def test_budget_limit(self, estimate):
+        batch = self.batch(budget_limit=1)
+        self.assertEqual(self.reserve(batch), 0.4)
+        self.assertEqual(self.reserve(batch), 0.4)
+        with self.assertRaises(BudgetExceeded):
+            self.reserve(batch)
+        self.assertTrue(self.refused)
+        batch.refresh_from_db()
+        self.assertEqual(float(batch.reserved_cost), 0.8)
+        self.assertEqual(batch.status, 'stopped')
+
+    def test_cost_per_valid_cap(self, estimate):
+        # 0.5 per valid problem for 2 needed: 1.0 in total
+        batch = self.batch(max_cost_per_valid=0.5)
+        Batch.objects.filter(id=batch.id).update(batch_cost=0.5)
+        self.assertEqual(self.reserve(batch), 0.4)
+        with self.assertRaises(BudgetExceeded):
+            self.reserve(batch)
+
+    def test_settled_calls_free_their_reservation(self, estimate):
+        batch = self.batch(budget_limit=1)
+        with charge_to_batch(batch.id):
+            reserved = reserve_call('openai', 'model', self.MESSAGES)
+            settle_call(reserved, 0.1)
+        batch.refresh_from_db()
+        self.assertEqual((float(batch.reserved_cost), float(batch.batch_cost)), (0, 0.1))
+        self.assertEqual(self.reserve(batch), 0.4)
+
+    @mock.patch('math_agent.utils.batch_runner._run_batch')
+    def test_resume_keeps_reservations_of_live_leases(self, run_batch, estimate):
+        batch = self.batch(budget_limit=1)
+        Batch.objects.filter(id=batch.id).update(reserved_cost=0.8)
+        attempt = Attempt.objects.create(
+            batch=batch, number=1, subject='S', topic='T', status='running',
+            lease_owner='worker-1', lease_expires_at=timezone.now() + timedelta(seconds=60)
+        )
+        resume_batch(batch, force=True)
+        batch.refresh_from_db()
+        self.assertEqual(float(batch.reserved_cost), 0.8)
+
+        # Once the lease expired its worker is gone, and so are its calls
+        Attempt.objects.filter(id=attempt.id).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        resume_batch(batch)
+        batch.refresh_from_db()
+        self.assertEqual(float(batch.reserved_cost), 0)
+
+
+    def run_until_status(self, batch, status):
+        """Run the coordinator loop of a batch whose status another process changes to status."""
+        def counters(batch_id):
+            Batch.objects.filter(id=batch_id).update(status=status)
+            return real_counters(batch_id)
+
+        real_counters = batch_runner.batch_counters
+        out = io.StringIO()
+        with mock.patch.object(batch_runner, 'batch_counters', side_effect=counters), contextlib.redirect_stdout(out):
+            batch_runner._run_batch(batch, 'node-a', num_workers=0, max_in_flight=1)
+        batch.refresh_from_db()
+        return out.getvalue()
+
+    def test_stop_message_follows_status(self, estimate):
+        batch = self.batch(budget_limit=1)
+        output = self.run_until_status(batch, 'stopped')
+        self.assertIn("Budget cap reached", output)
+        self.assertEqual(batch.status, 'stopped')
+
+        output = self.run_until_status(batch, 'interrupted')
+        self.assertNotIn("Budget cap", output)
+        self.assertIn(f"Batch {batch.id} was marked interrupted", output)
+        self.assertEqual(batch.status, 'interrupted')
+
+
+class BatchCoordinatorTests(TestCase):
+    """Only one process coordinates a batch at a time, whichever node it runs on."""
+
+    def setUp(self):
+        self.batch = Batch.objects.create(name="Batch", taxonomy_json={}, pipeline={}, number_of_valid_needed=1)
+
+    def test_one_coordinator_at_a_time(self):
+        self.assertTrue(leases.claim_batch(self.batch.id, 'node-a'))
+        self.assertFalse(leases.claim_batch(self.batch.id, 'node-b'))
+        self.assertFalse(leases.renew_batch(self.batch.id, 'node-b'))
+        self.assertTrue(leases.renew_batch(self.batch.id, 'node-a'))
+
+        leases.release_batch(self.batch.id, 'node-b')
+        self.assertFalse(leases.claim_batch(self.batch.id, 'node-b'))
+        leases.release_batch(self.batch.id, 'node-a')
+        self.assertTrue(leases.claim_batch(self.batch.id, 'node-b'))
+
+    def test_expired_coordinator_is_taken_over(self):
+        leases.claim_batch(self.batch.id, 'node-a', lease_seconds=-1)
+        self.assertTrue(leases.claim_batch(self.batch.id, 'node-b'))
+        self.assertFalse(leases.renew_batch(self.batch.id, 'node-a'))
+
+    @mock.patch('math_agent.utils.batch_runner._run_batch', return_value={})
+    def test_run_and_resume_refuse_a_coordinated_batch(self, _run_batch):
+        leases.claim_batch(self.batch.id, 'node-a')
+        attempt = Attempt.objects.create(batch=self.batch, number=1, subject='S', topic='T', status='failed')
+        AttemptStage.objects.create(attempt=attempt, stage='generator', output={}, cost=0.1)
+        with self.assertRaisesMessage(BatchBusy, "node-a"):
+            run_batch(self.batch)
+        with self.assertRaises(BatchBusy):
+            resume_batch(self.batch, force=True)
+        _run_batch.assert_not_called()
+        # The failed attempt wasn't re-queued behind the coordinator's back
+        attempt.refresh_from_db()
+        self.assertEqual(attempt.status, 'failed')
+
+    @mock.patch('math_agent.utils.batch_runner._run_batch', return_value={})
+    def test_resume_skips_live_attempt_leases_unless_forced(self, _run_batch):
+        Attempt.objects.create(
+            batch=self.batch, number=1, subject='S', topic='T', status='running',
+            lease_owner='worker-1', lease_expires_at=timezone.now() + timedelta(seconds=60)
+        )
+        with self.assertRaisesMessage(BatchBusy, "live leases"):
+            resume_batch(self.batch)
+        _run_batch.assert_not_called()
+
+        resume_batch(self.batch, force=True)
+        _run_batch.assert_called_once()
+        # The lease is given up once the run returns
+        self.batch.refresh_from_db()
+        self.assertIsNone(self.batch.coordinator)
+
+    @mock.patch('math_agent.utils.batch_runner._run_batch', return_value={})
+    def test_resume_batches_command_skips_busy_batches(self, _run_batch):
+        other = Batch.objects.create(name="Other", taxonomy_json={}, pipeline={}, number_of_valid_needed=1, status='interrupted')
+        leases.claim_batch(self.batch.id, 'node-a')
+        out = io.StringIO()
+        _run_batch.return_value = {'stats': {'valid': 0}, 'total_cost': 0.0}
+        call_command('resume_batches', stdout=out)
+        self.assertIn(f"Skipping batch {self.batch.id}", out.getvalue())
+        self.assertIn(f"Batch {other.id}", out.getvalue())
+        self.assertEqual(_run_batch.call_count, 1)
+
+    def test_coordinator_stops_when_taken_over(self):
+        attempt = Attempt.objects.create(batch=self.batch, number=1, subject='S', topic='T')
+        # Another node took the batch over after this coordinator's lease expired
+        leases.claim_batch(self.batch.id, 'node-b')
+        with mock.patch.object(batch_runner, 'RENEW_INTERVAL', 0):
+            batch_runner._run_batch(self.batch, 'node-a', num_workers=0, max_in_flight=1)
+        # The batch and its attempts are left to the new coordinator
+        self.assertEqual(Attempt.objects.count(), 1)
+        attempt.refresh_from_db()
+        self.assertEqual(attempt.status, 'pending')
+        self.batch.refresh_from_db()
+        self.assertEqual((self.batch.status, self.batch.coordinator), ('running', 'node-b'))
+
+
+class PassAtKTests(SimpleTestCase):
+    """pass@k sampling draws samples in waves and sends no further wave after a solve."""
+
+    def sampler(self, answers):
+        """Target call returning the answers in order, each a little later than the one before."""
+        lock, self.calls = threading.Lock(), []
+
+        def target_call():
+            with lock:
+                index = len(self.calls)
+                self.calls.append(index)
+            time.sleep(0.05 * (index % 2))
+            return answers[index], 1.0
+        return target_call
+
+    def judge(self, correct):
+        judged = []
+
+        def judge_call(answer):
+            judged.append(answer)
+            return answer == correct, 0.1, 'local'
+        return judge_call, judged
+
+    def test_stops_after_wave_with_solve(self):
+        judge_call, judged = self.judge('right')
+        result, cost = sample_until_solved(self.sampler(['wrong', 'right', 'late', 'later']), judge_call, 4)
+        # The second wave is never sent
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(judged, ['wrong', 'right'])
+        self.assertEqual(
+            {key: result[key] for key in ('answer', 'solved', 'samples', 'samples_solved', 'judged_locally')},
+            {'answer': 'right', 'solved': True, 'samples': 2, 'samples_solved': 1, 'judged_locally': 2}
+        )
+        self.assertAlmostEqual(cost, 2 * 1.0 + 2 * 0.1)
+
+    def test_whole_wave_judged(self):
+        judge_call, judged = self.judge('right')
+        result, cost = sample_until_solved(self.sampler(['right', 'wrong', 'late', 'later']), judge_call, 4)
+        # The sample still running when the first solve came in is paid for, so it's judged too
+        self.assertEqual(judged, ['right', 'wrong'])
+        self.assertEqual((result['answer'], result['samples'], result['samples_solved']), ('right', 2, 1))
+        self.assertAlmostEqual(cost, 2 * 1.0 + 2 * 0.1)
+
+    def test_solve_rate_counts_every_solve_in_the_wave(self):
+        judge_call, _ = self.judge('right')
+        result, _ = sample_until_solved(self.sampler(['wrong', 'wrong', 'right', 'right']), judge_call, 4)
+        self.assertEqual((result['samples'], result['samples_solved']), (4, 2))
+
+    def test_every_sample_judged_when_unsolved(self):
+        judge_call, judged = self.judge('right')
+        result, cost = sample_until_solved(self.sampler(['a', 'b', 'c']), judge_call, 3)
+        self.assertEqual(judged, ['a', 'b', 'c'])
+        self.assertEqual((result['solved'], result['samples'], result['samples_solved']), (False, 3, 0))
+        self.assertAlmostEqual(cost, 3 * 1.0 + 3 * 0.1)
+
+    def test_failed_samples_are_skipped(self):
+        calls = []
+
+        def target_call():
+            calls.append(1)
+            if len(calls) == 1:
+                raise ValueError("timeout")
+            time.sleep(0.05)
+            return 'right', 1.0
+
+        judge_call, judged = self.judge('right')
+        result, _ = sample_until_solved(target_call, judge_call, 2)
+        self.assertTrue(result['solved'])
+        self.assertEqual(result['samples'], 1)
+
+    def test_raises_when_no_sample_returns(self):
+        def target_call():
+            raise ValueError("timeout")
+
+        with self.assertRaisesMessage(ValueError, "timeout"):
+            sample_until_solved(target_call, self.judge('right')[0], 2)
+
+
+class TargetEvaluationTests(SimpleTestCase):
+    """A problem's status follows from which target models solved it, under the batch's rule."""
+
+    def test_unsolved_by_all(self):
+        self.assertEqual(derive_status({'a': False, 'b': False}), 'valid')
+        self.assertEqual(derive_status({'a': False, 'b': True}), 'solved')
+        self.assertEqual(derive_status({'a': True, 'b': True}), 'solved')
+
+    def test_unsolved_by_any(self):
+        self.assertEqual(derive_status({'a': False, 'b': True}, 'unsolved_by_any'), 'valid')
+        self.assertEqual(derive_status({'a': True, 'b': True}, 'unsolved_by_any'), 'solved')
+
+    def test_unsolved_by_majority(self):
+        self.assertEqual(derive_status({'a': False, 'b': False, 'c': True}, 'unsolved_by_majority'), 'valid')
+        self.assertEqual(derive_status({'a': False, 'b': True, 'c': True}, 'unsolved_by_majority'), 'solved')
+        # A tie isn't a majority
+        self.assertEqual(derive_status({'a': False, 'b': True}, 'unsolved_by_majority'), 'solved')
+
+    def test_single_target(self):
+        for rule in ('unsolved_by_all', 'unsolved_by_any', 'unsolved_by_majority'):
+            self.assertEqual(derive_status({'a': False}, rule), 'valid')
+            self.assertEqual(derive_status({'a': True}, rule), 'solved')
+
+    def test_unknown_rule(self):
+        with self.assertRaises(ValueError):
+            derive_status({'a': False}, 'unsolved_by_some')
+
+    def test_pipeline_targets(self):
+        judge = {'provider': 'openai', 'model': 'judge'}
+        targets = [{'provider': 'openai', 'model': 'a'}, {'provider': 'gemini', 'model': 'b'}]
+        self.assertEqual(
+            pipeline_targets({'target': targets, 'judge': judge}),
+            [('openai/a', targets[0], judge), ('gemini/b', targets[1], judge)]
+        )
+        self.assertEqual(pipeline_targets({'target': targets[0], 'judge': judge}), [('openai/a', targets[0], judge)])
+        with self.assertRaises(ValueError):
+            pipeline_targets({'target': targets, 'judge': [judge]})
+        with self.assertRaises(ValueError):
+            pipeline_targets({'target': [targets[0], targets[0]], 'judge': judge})
+
+    def test_fan_out_retries_only_failed_targets(self):
+        calls = []
+
+        def call(label, fail=False):
+            def run():
+                calls.append(label)
+                if fail:
+                    raise ValueError(f"{label} down")
+                return {'answer': label}, 1.0
+            return run
+
+        done = {}
+        with self.assertRaisesMessage(Exception, "b: b down"):
+            fan_out({'a': call('a'), 'b': call('b', fail=True)}, done)
+        self.assertEqual(list(done), ['a'])
+        fan_out({'a': call('a'), 'b': call('b')}, done)
+        self.assertEqual(sorted(calls), ['a', 'b', 'b'])
+        self.assertEqual(done['b'], {'result': {'answer': 'b'}, 'cost': 1.0})
+
+
+@mock.patch('math_agent.utils.generator.find_similar_problems', return_value=({}, [0.0]))
+class MultiProblemGenerationTests(TestCase):
+    """One generator call makes problems for several attempts, each carrying its share of the cost."""
+
+    TAXONOMIES = [{'subject': 'S', 'topic': f'T{i}'} for i in range(3)]
+
+    def response(self, count, hints=True):
+        return {'problems': [
+            {'problem': f'Q{i}', 'answer': f'A{i}', **({'hints': {'0': 'h'}} if hints else {})}
+            for i in range(count)
+        ]}
+
+    def test_cost_split_between_problems(self, similar):
+        with mock.patch('math_agent.utils.generator.call_llm', return_value=(self.response(3), 0.9)) as call:
+            generated = generate_problems({'provider': 'openai', 'model': 'm'}, self.TAXONOMIES)
+        self.assertEqual([problem[0] for problem in generated], ['Q0', 'Q1', 'Q2'])
+        self.assertEqual([round(problem[5], 6) for problem in generated], [0.3, 0.3, 0.3])
+        self.assertIn('exactly 3 objects', call.call_args.args[1][0]['content'])
+        self.assertIn("T2", call.call_args.args[1][1]['content'])
+
+    def test_stops_at_first_unusable_problem(self, similar):
+        response = self.response(3)
+        response['problems'][1]['answer'] = ''
+        with mock.patch('math_agent.utils.generator.call_llm', return_value=(response, 0.9)):
+            generated = generate_problems({'provider': 'openai', 'model': 'm'}, self.TAXONOMIES)
+        # Q2 would no longer match its topic
+        self.assertEqual([(problem[0], problem[5]) for problem in generated], [('Q0', 0.9)])
+
+    def test_no_usable_problem(self, similar):
+        with mock.patch('math_agent.utils.generator.call_llm', return_value=(self.response(3, hints=False), 0.9)):
+            with self.assertRaises(Exception):
+                generate_problems({'provider': 'openai', 'model': 'm'}, self.TAXONOMIES)
+            self.assertEqual(len(generate_problems({'provider': 'openai', 'model': 'm'}, self.TAXONOMIES, with_hints=False)), 3)
+
+    @mock.patch('math_agent.utils.leases.lease_keeper')
+    def test_group_shares_one_call(self, keeper, similar):
+        batch = Batch.objects.create(name="Batch", taxonomy_json={}, pipeline={}, number_of_valid_needed=1)
+        attempts = Attempt.objects.bulk_create([Attempt(batch=batch, number=i + 1, subject='S', topic=f'T{i}') for i in range(3)])
+        attempt = leases.claim_attempt('worker-1', batch.id)
+        with mock.patch('math_agent.utils.generator.call_llm', return_value=(self.response(3), 0.9)) as call:
+            output, cost = generate_for_group(1, 'worker-1', attempt, {'provider': 'openai', 'model': 'm'}, False, 3)
+        call.assert_called_once()
+        self.assertEqual((output['question'], round(cost, 6)), ('Q0', 0.3))
+        # The siblings got their generator stage and are back in the queue for any worker
+        for sibling, question in zip(attempts[1:], ['Q1', 'Q2']):
+            stage = AttemptStage.objects.get(attempt_id=sibling.id, stage='generator')
+            self.assertEqual((stage.output['question'], round(float(stage.cost), 6)), (question, 0.3))
+        self.assertEqual(set(Attempt.objects.filter(id__in=[a.id for a in attempts[1:]]).values_list('status', flat=True)), {'pending'})
+
+
+class LocalJudgeTests(SimpleTestCase):
+    """Obvious verdicts are decided locally; anything the local judge isn't sure of goes to the judge model."""
+
+    MCQ = "What is $f(2)$?\nChoices =>\nA. 6\nB. 8\nC. \\frac{1}{2}\nD. 12\nGTFA: B"
+
+    def test_normalize_answer(self):
+        self.assertEqual(normalize_answer(r'$\boxed{\dfrac{1}{2}}$'), r'\frac{1}{2}')
+        self.assertEqual(normalize_answer(r'\( x = 5 \).'), 'x=5')
+        self.assertEqual(normalize_answer(r'\left( a \cdot b \right)'), '(a*b)')
+        self.assertEqual(normalize_answer(' 2 \\, \\pi '), '2\\pi')
+
+    def test_parse_number(self):
+        self.assertEqual(parse_number('1,000,000'), 1000000)
+        self.assertEqual(parse_number('0.25'), Fraction(1, 4))
+        self.assertEqual(parse_number('-3/6'), Fraction(-1, 2))
+        self.assertEqual(parse_number(r'-\frac{2}{8}'), Fraction(-1, 4))
+        self.assertEqual(parse_number('1e-3'), Fraction(1, 1000))
+        self.assertIsNone(parse_number('1/0'))
+        self.assertIsNone(parse_number(r'\pi'))
+        self.assertIsNone(parse_number('nan'))
+
+    def test_numeric_verdicts(self):
+        self.assertTrue(local_verdict('0.5', r'\frac{1}{2}'))
+        self.assertTrue(local_verdict('x = 2/4', 'x=0.5'))
+        self.assertTrue(local_verdict('1.0000000000001', '1'))
+        self.assertFalse(local_verdict('3', '4'))
+        # Close enough that rounding could explain it
+        self.assertIsNone(local_verdict('3.1416', '3.14159265'))
+
+    def test_variable_names(self):
+        self.assertEqual(split_assignment('x=5'), ('x', '5'))
+        self.assertEqual(split_assignment('5'), (None, '5'))
+        self.assertFalse(local_verdict('x = 4', 'x = 5'))
+        # The value of another variable, or of an unnamed one, is left to the judge model
+        self.assertIsNone(local_verdict('y = 5', 'x = 5'))
+        self.assertIsNone(local_verdict('x = 5', '5'))
+        self.assertIsNone(local_verdict('5', 'x = 5'))
+
+    def test_unsure_verdicts(self):
+        self.assertTrue(local_verdict(r'$2\pi$', r'\boxed{2\pi}'))
+        self.assertIsNone(local_verdict(r'2\pi', r'\pi*2'))
+        self.assertIsNone(local_verdict('', '1'))
+        # Placeholders for a missing value are never a confident match
+        self.assertIsNone(local_verdict('nan', 'nan'))
+        self.assertIsNone(local_verdict('None', 'None'))
+
+    def test_mcq_letters(self):
+        self.assertTrue(mcq_verdict('B', 'B', self.MCQ))
+        self.assertTrue(mcq_verdict('(b)', 'B', self.MCQ))
+        self.assertTrue(mcq_verdict('The answer is: B.', 'B', self.MCQ))
+        self.assertFalse(mcq_verdict('A', 'B', self.MCQ))
+        self.assertTrue(mcq_verdict('B. 8', 'B', self.MCQ))
+        self.assertTrue(mcq_verdict(r'C) \frac{1}{2}', 'C', self.MCQ))
+        # A value that doesn't match the option it comes with is left to the judge model
+        self.assertIsNone(mcq_verdict('B. 6', 'B', self.MCQ))
+        self.assertIsNone(mcq_verdict('8', 'B', self.MCQ))
+        self.assertIsNone(mcq_verdict('B', 'not a letter', self.MCQ))
+
+    def test_choices_on_one_line(self):
+        expected = {'A': '6', 'B': '8', 'C': '10', 'D': '12'}
+        self.assertEqual(parse_choices("Let A. be a set. Choices =>\nA. 6\nB. 8\nC. 10\nD. 12\nGTFA: A"), expected)
+        self.assertEqual(parse_choices("What is $f(2)$? (A) 6 (B) 8 (C) 10 (D) 12"), expected)
+        self.assertEqual(parse_choices("Choices => A. 6, B. 8, C. 10, D. 12 GTFA: B"), expected)
+        self.assertEqual(parse_choices("Let $f(A) = 2$ and $B = 3$."), {})
+        self.assertTrue(mcq_verdict('D) 12', 'D', "Pick one: (A) 6 (B) 8 (C) 10 (D) 12"))
+
+    @mock.patch('math_agent.utils.local_judge.judge_solution', return_value=(True, 0.02))
+    def test_escalates_when_unsure(self, judge_solution):
+        config = {'provider': 'openai', 'model': 'judge'}
+        self.assertEqual(judge_answer('0.5', '1/2', config), (True, 0.0, 'local'))
+        self.assertEqual(judge_answer('3', '4', config), (False, 0.0, 'local'))
+        judge_solution.assert_not_called()
+
+        self.assertEqual(judge_answer(r'2\pi', r'\pi*2', config), (True, 0.02, 'llm'))
+        self.assertEqual(judge_answer('nan', 'nan', config), (True, 0.02, 'llm'))
+        self.assertEqual(judge_answer('B. 6', 'B', config, mcq_mode=True, problem_text=self.MCQ), (True, 0.02, 'llm'))
+        # Local judging switched off
+        self.assertEqual(judge_answer('0.5', '1/2', config, use_local=False), (True, 0.02, 'llm'))
+        self.assertEqual(judge_solution.call_count, 4)
+
+
+class RunWorkersCommandTests(SimpleTestCase):
+
+    @mock.patch('math_agent.management.commands.run_workers.result_writer')
+    @mock.patch('math_agent.management.commands.run_workers.time.sleep', side_effect=KeyboardInterrupt)
+    @mock.patch('math_agent.management.commands.run_workers.start_workers')
+    def test_queued_results_are_written_on_ctrl_c(self, start_workers, sleep, writer):
+        worker = mock.Mock()
+        worker.is_alive.return_value = True
+        start_workers.return_value = [worker]
+        call_command('run_workers', workers=1, stdout=io.StringIO())
+        self.assertTrue(start_workers.call_args.args[2].is_set())
+        worker.join.assert_called_once()
+        writer.flush.assert_called_once()
+
+
+class ImportProblemsTests(TestCase):
+    """Imports are written chunk by chunk and resume per file after an interruption."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write_file(self, folder, name, count, start=0):
+        os.makedirs(os.path.join(self.directory.name, folder), exist_ok=True)
+        path = os.path.join(self.directory.name, folder, name)
+        with open(path, 'w') as f:
+            for i in range(start, start + count):
+                # Orthogonal embeddings, so no problem is similar to another
+                embedding = [0.0] * 16
+                embedding[i] = 1.0
+                f.write(json.dumps({'subject': 'S', 'topic': 'T', 'question': f'Q{i}', 'answer': '1', 'embedding': embedding}) + '\n')
+        return path
+
+    def test_same_file_name_in_two_folders(self):
+        paths = [self.write_file('a', 'bank.jsonl', 3), self.write_file('b', 'bank.jsonl', 4, start=3)]
+        batch = import_batch("Import")
+        totals = import_problems(paths, batch, chunk_size=2, log=lambda message: None)
+        self.assertEqual(totals, {'imported': 7, 'skipped': 0})
+        self.assertEqual(batch.options['import']['files'], {os.path.realpath(paths[0]): 3, os.path.realpath(paths[1]): 4})
+
+        # Run again into the same batch: both files are done
+        batch = import_batch("Import", batch.id)
+        self.assertEqual(import_problems(paths, batch, log=lambda message: None), {})
+        self.assertEqual(Problem.objects.filter(batch=batch).count(), 7)
+
+    def test_resumes_after_last_written_chunk(self):
+        path = self.write_file('a', 'bank.jsonl', 5)
+        batch = import_batch("Import")
+        batch.options['import']['files'][os.path.realpath(path)] = 2
+        batch.save()
+        import_problems([path], batch, chunk_size=2, log=lambda message: None)
+        self.assertEqual(list(Problem.objects.filter(batch=batch).order_by('id').values_list('question', flat=True)), ['Q2', 'Q3', 'Q4'])
+
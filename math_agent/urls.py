@@ -7,8 +7,14 @@ urlpatterns = [
     path('', views.BatchListView.as_view(), name='batch_list'),
     path('generate/', views.GenerateView.as_view(), name='generate'),
     path('batch/<int:pk>/', views.BatchDetailView.as_view(), name='batch_detail'),
+    path('batch/<int:pk>/telemetry/', views.BatchTelemetryView.as_view(), name='batch_telemetry'),
+    path('batch/<int:pk>/profile/', views.BatchProfileView.as_view(), name='batch_profile'),
+    path('batch/<int:pk>/resume/', views.ResumeBatchView.as_view(), name='resume_batch'),
     path('batch/<int:batch_id>/problems/', views.ProblemListView.as_view(), name='problems'),
     path('problem/<int:pk>/', views.ProblemDetailView.as_view(), name='problem_detail'),
+    path('problem/<int:pk>/similar/', views.SimilarProblemsView.as_view(), name='similar_problems'),
     path('problems/', views.AllProblemsView.as_view(), name='all_problems'),
-    path('export/problems/', views.export_problems_csv, name='export_problems'),
+    path('search/', views.ProblemSearchView.as_view(), name='search'),
+    path('export/problems/', views.export_problems, name='export_problems'),
+    path('metrics', views.metrics, name='metrics'),
 ] 
\ No newline at end of file
@@ -0,0 +1,745 @@
+import threading
+import time
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Exists, OuterRef, Q
+from django.utils import timezone
+from math_agent.models import Batch, Problem, Attempt, AttemptStage, TargetResult
+from .generator import generate_problem, generate_problems
+from .checker import check_problem
+from .target import test_with_target
+from .local_judge import judge_answer
+from .dispatch import plan_dispatch, AttemptCancelled
+from .leases import claim_attempt, release_attempt, owns_attempt, finish_attempt, worker_name, lease_keeper
+from .leases import claim_batch, renew_batch, release_batch, RENEW_INTERVAL
+from .topic_sampler import make_sampler, record_topic_outcome
+from .hinter import start_hint_worker
+from .evaluation import pipeline_targets, derive_status, fan_out, sample_until_solved, DEFAULT_STATUS_RULE
+from .budget import BudgetExceeded, charge_to_batch, current_scope, budget_refused, budget_cap, affordable_attempts
+from .result_writer import result_writer
+from .batch_stats import count_outcomes, batch_stats
+from .metrics import attempt_claims, attempts_in_flight, attempts_finished, attempt_seconds, timed_write
+from .profiling import profile_batch, profiling, span
+
+NUM_WORKERS = 10
+MAX_IN_FLIGHT = getattr(settings, 'MAX_IN_FLIGHT_ATTEMPTS', NUM_WORKERS * 2)  # Pending + running attempts across all nodes
+STAGE_MAX_RETRIES = 2  # Extra tries for a failed stage before the attempt is marked failed
+SAFETY_FACTOR = 25  # Stop a batch after this many attempts per valid problem needed
+POLL_INTERVAL = 1  # Seconds between progress checks by the batch coordinator
+CLAIM_POLL_INTERVAL = 1  # Seconds an idle worker waits before trying to claim again
+
+
+class BatchBusy(ValueError):
+    """Raised when a batch can't be run because another process may still be running it."""
+
+
+class StageFailed(Exception):
+    """Raised when a pipeline stage keeps failing after its retries."""
+
+    def __init__(self, stage, error):
+        self.stage = stage
+        super().__init__(f"{stage} failed: {error}")
+
+
+def check_cancelled(owner, attempt, next_stage):
+    """Raise AttemptCancelled if the attempt was cancelled or its lease lost before the next stage starts."""
+    if not owns_attempt(attempt, owner):
+        raise AttemptCancelled(f"Attempt {attempt.number} cancelled before {next_stage}: batch finished or lease lost")
+
+
+def run_stage(worker_id, attempt, stage, func, spend):
+    """
+    Run one pipeline stage for an attempt, reusing its persisted output if it already ran.
+
+    Args:
+        worker_id: Identifier of the worker running the attempt (for logging)
+        attempt (Attempt): The attempt the stage belongs to
+        stage (str): Stage name ('generator', 'checker', 'target' or 'judge')
+        func (callable): Runs the stage and returns (output, cost); output must be JSON-serializable
+        spend (dict): Running {'cost': float} of money spent by this run of the attempt
+
+    Returns:
+        tuple: (output, cost) where cost is what the stage cost when it originally ran
+    """
+    existing = AttemptStage.objects.filter(attempt=attempt, stage=stage).first()
+    if existing is not None:
+        print(f"[Worker {worker_id}] Reusing persisted {stage} result for attempt {attempt.number}")
+        return existing.output, float(existing.cost)
+
+    last_error = None
+    for retry in range(STAGE_MAX_RETRIES + 1):
+        scope = current_scope()
+        if scope is not None:
+            scope['retry'] = retry  # Tags the stage's LLM call telemetry
+        try:
+            with span(stage, retry=retry):
+                output, cost = func()
+        except Exception as e:
+            if budget_refused():
+                # Retrying can't help: the batch has no budget left
+                raise BudgetExceeded(f"{stage} refused: {str(e)}")
+            last_error = e
+            print(f"[Worker {worker_id}] {stage} failed for attempt {attempt.number} (try {retry + 1}/{STAGE_MAX_RETRIES + 1}): {str(e)}")
+            continue
+
+        spend['cost'] += cost
+        with timed_write('stage'):
+            AttemptStage.objects.create(attempt=attempt, stage=stage, output=output, cost=cost, retries=retry)
+        return output, cost
+
+    raise StageFailed(stage, last_error)
+
+
+def generator_output(question, answer, hints, embedding, similar_problems):
+    """Persisted form of a generator result."""
+    return {
+        'question': question,
+        'answer': answer,
+        'hints': hints,
+        'embedding': embedding,
+        'similar_problems': {str(sim_id): score for sim_id, score in similar_problems.items()}
+    }
+
+
+def generate_for_group(worker_id, owner, attempt, pipeline_config, mcq_mode, group_size, with_hints=True):
+    """
+    Generate problems for an attempt and up to group_size - 1 other queued attempts in one call.
+
+    The other attempts are claimed for the duration of the call, get their generator
+    stage persisted with their share of the cost, and are then handed back to the queue
+    so any worker carries them through the remaining stages.
+
+    Returns:
+        tuple: (output, cost) of the generator stage for `attempt`
+    """
+    siblings = []
+    for _ in range(group_size - 1):
+        sibling = claim_attempt(owner, attempt.batch_id, without_stage='generator')
+        if sibling is None:
+            break
+        siblings.append(sibling)
+
+    try:
+        group = [attempt] + siblings
+        results = generate_problems(
+            pipeline_config,
+            [{"subject": member.subject, "topic": member.topic} for member in group],
+            mcq_mode=mcq_mode,
+            with_hints=with_hints
+        )
+        print(f"[Worker {worker_id}] Generated {len(results)}/{len(group)} problems in one call")
+
+        for sibling, result in zip(siblings, results[1:]):
+            question, answer, hints, embedding, similar_problems, cost = result
+            AttemptStage.objects.get_or_create(
+                attempt=sibling, stage='generator',
+                defaults={'output': generator_output(question, answer, hints, embedding, similar_problems), 'cost': cost}
+            )
+
+        question, answer, hints, embedding, similar_problems, cost = results[0]
+        return generator_output(question, answer, hints, embedding, similar_problems), cost
+    finally:
+        for sibling in siblings:
+            release_attempt(sibling, owner)
+
+
+def problem_result(owner, attempt, status, generated, hints, cost, rejection_reason=None, target_results=None, hints_pending=False):
+    """
+    Build the finished problem of an attempt, to be saved by the result writer.
+
+    target_results, if given, is a list of {provider, model, answer, solved, judge, cost,
+    samples, samples_solved} dicts stored as TargetResult rows; the problem's solve_rate
+    is the share of judged target samples that solved it (with pass@k sampling, of the
+    samples drawn until the first solve, see sample_until_solved). hints_pending marks a valid
+    problem whose hints are left to the background hinter.
+
+    The writer only keeps the problem if the worker still holds the attempt's lease, so an
+    attempt re-issued to another worker can never produce two problems.
+
+    Returns:
+        dict: Result for result_writer.add_result, with the unsaved problem under 'problem'
+    """
+    solve_rate = None
+    if target_results:
+        solve_rate = sum(result['samples_solved'] for result in target_results) / sum(result['samples'] for result in target_results)
+
+    problem = Problem(
+        subject=attempt.subject,
+        topic=attempt.topic,
+        question=generated['question'],
+        answer=generated['answer'],
+        hints=hints,
+        hints_pending=hints_pending and status == 'valid',
+        rejection_reason=rejection_reason,
+        status=status,
+        batch_id=attempt.batch_id,
+        problem_embedding=generated['embedding'],
+        similar_problems=generated['similar_problems'],
+        cost=cost,
+        solve_rate=solve_rate
+    )
+    return {
+        'attempt': attempt,
+        'owner': owner,
+        'problem': problem,
+        'target_results': [TargetResult(problem=problem, **result) for result in target_results or []]
+    }
+
+
+def process_attempt(worker_id, owner, attempt, spend):
+    """
+    Run a claimed attempt through the pipeline, skipping stages that already have persisted results.
+
+    Returns:
+        dict: The attempt's result, as built by problem_result (the problem's status is the attempt outcome)
+    """
+    pipeline = attempt.batch.pipeline
+    mcq_mode = attempt.batch.mcq_mode
+    problems_per_call = int((attempt.batch.options or {}).get('problems_per_call', 1))
+    defer_hints = bool((attempt.batch.options or {}).get('defer_hints', False))
+    subject, topic = attempt.subject, attempt.topic
+    taxonomy = {
+        "subject": subject,
+        "topic": topic
+    }
+
+    def generator_stage():
+        if problems_per_call > 1:
+            return generate_for_group(worker_id, owner, attempt, pipeline['generator'], mcq_mode, problems_per_call, with_hints=not defer_hints)
+        question, answer, hints, embedding, similar_problems, cost = generate_problem(pipeline['generator'], taxonomy=taxonomy, mcq_mode=mcq_mode, with_hints=not defer_hints)
+        return generator_output(question, answer, hints, embedding, similar_problems), cost
+
+    # Generate problem
+    check_cancelled(owner, attempt, 'generator')
+    print(f"[Worker {worker_id}] Calling generator for {subject} - {topic}... (MCQ: {mcq_mode})")
+    generated, generator_cost = run_stage(worker_id, attempt, 'generator', generator_stage, spend)
+    question, answer, hints = generated['question'], generated['answer'], generated['hints']
+    print(f"[Worker {worker_id}] Generator result:\nQuestion: {question}\nAnswer: {answer}\nCost: ${generator_cost}")
+
+    # Check problem validity
+    def checker_stage():
+        is_valid, rejection_reason, corrected_hints, cost = check_problem(question, answer, hints, pipeline['checker'], with_hints=not defer_hints)
+        return {'valid': is_valid, 'reason': rejection_reason, 'corrected_hints': corrected_hints}, cost
+
+    check_cancelled(owner, attempt, 'checker')
+    print(f"[Worker {worker_id}] Calling checker...")
+    checked, checker_cost = run_stage(worker_id, attempt, 'checker', checker_stage, spend)
+    print(f"[Worker {worker_id}] Checker result: {'Valid' if checked['valid'] else 'Invalid'}\nCost: ${checker_cost}")
+
+    if not checked['valid']:
+        print(f"[Worker {worker_id}] Rejection reason: {checked['reason']}")
+        return problem_result(owner, attempt, 'discarded', generated, hints, generator_cost + checker_cost, rejection_reason=checked['reason'])
+
+    # Use corrected hints if provided (with deferred hints there were none to correct)
+    if checked['corrected_hints'] and not defer_hints:
+        print(f"[Worker {worker_id}] Using corrected hints from checker")
+        hints = checked['corrected_hints']
+
+    # Test with every target model concurrently; on retry only the targets that failed are called again
+    targets = pipeline_targets(pipeline)
+    target_samples = int((attempt.batch.options or {}).get('target_samples', 1))
+    use_local_judge = (attempt.batch.options or {}).get('local_judge', True)
+    answered = {}
+
+    def answer_once(target_config):
+        target_answer, cost = test_with_target(question, target_config, mcq_mode)
+        return {'answer': target_answer}, cost
+
+    def answer_pass_at_k(target_config, judge_config):
+        # Samples are judged as they arrive, so the judge stage below has nothing left to do
+        return sample_until_solved(
+            lambda: test_with_target(question, target_config, mcq_mode),
+            lambda target_answer: judge_answer(target_answer, answer, judge_config, mcq_mode, question, use_local_judge),
+            target_samples
+        )
+
+    def target_stage():
+        fan_out({
+            label: (
+                (lambda target_config=target_config, judge_config=judge_config: answer_pass_at_k(target_config, judge_config))
+                if target_samples > 1 else
+                (lambda target_config=target_config: answer_once(target_config))
+            )
+            for label, target_config, judge_config in targets
+        }, answered)
+        output = {label: {**done['result'], 'cost': done['cost']} for label, done in answered.items()}
+        return output, sum(done['cost'] for done in answered.values())
+
+    check_cancelled(owner, attempt, 'target')
+    print(f"[Worker {worker_id}] Calling {len(targets)} target(s)..." + (f" (pass@{target_samples})" if target_samples > 1 else ""))
+    target_output, target_cost = run_stage(worker_id, attempt, 'target', target_stage, spend)
+    if isinstance(target_output.get('answer'), str):
+        # Saved before batches could have several targets
+        target_output = {targets[0][0]: {'answer': target_output['answer'], 'cost': target_cost}}
+    for label, result in target_output.items():
+        print(f"[Worker {worker_id}] Target {label} result:\n{result['answer']}\nCost: ${result['cost']}")
+        if 'samples' in result:
+            print(f"[Worker {worker_id}] Target {label} solved {result['samples_solved']}/{result['samples']} judged samples")
+
+    # Judge each target's solution, unless pass@k sampling already did;
+    # obvious matches and mismatches are decided locally without calling the judge model
+    graded = {
+        label: {'result': {'solved': result['solved'], 'judged_locally': result.get('judged_locally', 0)}, 'cost': 0.0}
+        for label, result in target_output.items() if 'solved' in result
+    }
+
+    def judge_once(label, judge_config):
+        solved, cost, method = judge_answer(target_output[label]['answer'], answer, judge_config, mcq_mode, question, use_local_judge)
+        return {'solved': solved, 'method': method, 'judged_locally': int(method == 'local')}, cost
+
+    def judge_stage():
+        fan_out({
+            label: (lambda label=label, judge_config=judge_config: judge_once(label, judge_config))
+            for label, _, judge_config in targets
+        }, graded)
+        output = {label: {**done['result'], 'cost': done['cost']} for label, done in graded.items()}
+        return output, sum(done['cost'] for done in graded.values())
+
+    check_cancelled(owner, attempt, 'judge')
+    print(f"[Worker {worker_id}] Calling judge...")
+    judged, judge_cost = run_stage(worker_id, attempt, 'judge', judge_stage, spend)
+    if isinstance(judged.get('solved'), bool):
+        judged = {targets[0][0]: {'solved': judged['solved'], 'cost': judge_cost}}
+    for label, result in judged.items():
+        method = f" ({result['method']})" if 'method' in result else ""
+        print(f"[Worker {worker_id}] Judge result for {label}: {'Solved' if result['solved'] else 'Not Solved'}{method}\nCost: ${result['cost']}")
+
+    target_results = []
+    for label, target_config, judge_config in targets:
+        target_results.append({
+            'provider': target_config['provider'],
+            'model': target_config['model'],
+            'answer': target_output[label]['answer'],
+            'solved': bool(judged[label]['solved']),
+            'judge': f"{judge_config['provider']}/{judge_config['model']}",
+            'cost': target_output[label]['cost'] + judged[label]['cost'],
+            'samples': target_output[label].get('samples', 1),
+            'samples_solved': target_output[label].get('samples_solved', int(bool(judged[label]['solved']))),
+            'judged_locally': judged[label].get('judged_locally', 0)
+        })
+
+    status_rule = (attempt.batch.options or {}).get('status_rule', DEFAULT_STATUS_RULE)
+    status = derive_status({label: result['solved'] for label, result in judged.items()}, status_rule)
+    return problem_result(
+        owner, attempt, status, generated, hints, generator_cost + checker_cost + target_cost + judge_cost,
+        target_results=target_results, hints_pending=defer_hints
+    )
+
+
+def execute_attempt(worker_id, owner, attempt):
+    """
+    Process a claimed attempt and record how it finished.
+
+    Returns:
+        str: 'valid', 'solved', 'discarded', 'cancelled' or 'error'
+    """
+    started = time.time()
+    attempts_in_flight.inc()
+    outcome = 'error'
+    try:
+        with profiling(attempt.batch_id, attempt.number), span(f"Attempt {attempt.number}", 'attempt', subject=attempt.subject, topic=attempt.topic):
+            outcome = _execute_attempt(worker_id, owner, attempt)
+        return outcome
+    finally:
+        attempts_in_flight.dec()
+        attempts_finished.inc(outcome=outcome)
+        attempt_seconds.observe(time.time() - started, outcome=outcome)
+
+
+def _execute_attempt(worker_id, owner, attempt):
+    print(f"\n[Worker {worker_id}] Starting attempt {attempt.number} of batch {attempt.batch_id}")
+    print("=" * 50)
+
+    spend = {'cost': 0.0}
+    started = time.time()
+    try:
+        with charge_to_batch(attempt.batch_id, attempt.id):
+            result = process_attempt(worker_id, owner, attempt, spend)
+        # Saved in bulk by the result writer; the attempt's lease is renewed until then
+        result['topic_outcome'] = (spend['cost'], time.time() - started)
+        result_writer.add_result(result)
+        status = result['problem'].status
+        print(f"✅ [Worker {worker_id}] Completed {status} problem (Attempt {attempt.number}, Cost: ${spend['cost']:.4f})")
+        return status
+
+    except AttemptCancelled as e:
+        # The coordinator already marked the attempt cancelled, or another worker took it over
+        lease_keeper.release(attempt.id)
+        print(f"[Worker {worker_id}] {str(e)}")
+        return 'cancelled'
+
+    except BudgetExceeded as e:
+        # Kept as cancelled so its persisted stages are reused if the batch is resumed with more budget
+        print(f"💸 [Worker {worker_id}] {str(e)}")
+        finish_attempt(attempt, owner, 'cancelled', error=str(e))
+        return 'cancelled'
+
+    except Exception as e:
+        print(f"❌ [Worker {worker_id}] Error in attempt {attempt.number}: {str(e)}")
+        print(f"[Worker {worker_id}] Persisted stages are kept; the attempt can be retried on resume")
+        if finish_attempt(
+            attempt, owner, 'failed',
+            failed_stage=e.stage if isinstance(e, StageFailed) else None,
+            error=str(e)
+        ):
+            count_outcomes(attempt.batch_id, {'error': 1})
+        record_topic_outcome(attempt.subject, attempt.topic, 'error', spend['cost'], time.time() - started)
+        return 'error'
+
+
+def attempt_worker(worker_id, batch_id=None, stop_event=None):
+    """
+    Worker loop claiming attempts from the database and running them through the pipeline.
+
+    Any number of these can run, in any process on any node sharing the database.
+
+    Args:
+        worker_id: Identifier for this worker, unique within the process
+        batch_id (int, optional): Only work on this batch; otherwise take work from every running batch
+        stop_event (threading.Event, optional): Set to stop the worker after its current attempt
+    """
+    owner = worker_name(worker_id)
+    try:
+        while stop_event is None or not stop_event.is_set():
+            try:
+                with profiling(batch_id):
+                    attempt = claim_attempt(owner, batch_id)
+                attempt_claims.inc(result='empty' if attempt is None else 'claimed')
+            except Exception as e:
+                print(f"[Worker {worker_id}] Claim failed: {str(e)}")
+                attempt_claims.inc(result='error')
+                attempt = None
+
+            if attempt is None:
+                time.sleep(CLAIM_POLL_INTERVAL)
+                continue
+
+            execute_attempt(worker_id, owner, attempt)
+    finally:
+        connection.close()
+
+
+def start_workers(num_workers, batch_id=None, stop_event=None):
+    """Start worker threads and return them."""
+    workers = []
+    for i in range(num_workers):
+        worker = threading.Thread(
+            target=attempt_worker,
+            args=(i + 1, batch_id, stop_event),
+            daemon=True
+        )
+        worker.start()
+        workers.append(worker)
+        print(f"Started worker {i + 1}")
+    return workers
+
+
+def batch_counters(batch_id):
+    """
+    Aggregate a batch's progress from its attempt rows, so every node sees the same numbers.
+
+    Returns:
+        dict: valid, solved, discarded, errors, attempts (finished), cancelled, pending,
+        running, in_flight, total_cost (spent so far) and reserved_cost (estimated cost of
+        LLM calls in flight)
+    """
+    counters = Attempt.objects.filter(batch_id=batch_id).aggregate(
+        valid=Count('id', filter=Q(status='completed', outcome='valid')),
+        solved=Count('id', filter=Q(status='completed', outcome='solved')),
+        discarded=Count('id', filter=Q(status='completed', outcome='discarded')),
+        errors=Count('id', filter=Q(status='failed')),
+        cancelled=Count('id', filter=Q(status='cancelled')),
+        pending=Count('id', filter=Q(status='pending')),
+        running=Count('id', filter=Q(status='running'))
+    )
+    counters['attempts'] = counters['valid'] + counters['solved'] + counters['discarded'] + counters['errors']
+    counters['in_flight'] = counters['pending'] + counters['running']
+    batch_cost, reserved_cost = Batch.objects.values_list('batch_cost', 'reserved_cost').get(id=batch_id)
+    counters['total_cost'] = float(batch_cost)
+    counters['reserved_cost'] = float(reserved_cost)
+    return counters
+
+
+def judging_counters(batch_id):
+    """
+    How many judged target answers of a batch were decided by the local judge.
+
+    Returns:
+        dict: judged, judged_locally and local_rate (None before anything was judged)
+    """
+    stats = batch_stats(Batch.objects.get(id=batch_id))
+    return {key: stats[key] for key in ('judged', 'judged_locally', 'local_rate')}
+
+
+def create_attempts(batch, count, next_number, sampler):
+    """
+    Record new pending attempts for a batch, with subject and topic picked by the topic sampler.
+
+    Returns:
+        list: The created Attempt objects
+    """
+    attempts = [
+        Attempt(batch=batch, number=number, subject=subject, topic=topic)
+        for number, (subject, topic) in enumerate(sampler.choose(count), start=next_number)
+    ]
+    return Attempt.objects.bulk_create(attempts)
+
+
+def run_batch(batch, num_workers=NUM_WORKERS, max_in_flight=MAX_IN_FLIGHT):
+    """
+    Coordinate a batch until it has enough valid problems, picking up any attempts it already recorded.
+
+    Attempts are dispatched as database rows; the local worker threads and any
+    `run_workers` processes on other nodes claim them with expiring leases.
+
+    Args:
+        batch (Batch): The batch to run
+        num_workers (int): Number of local worker threads (0 to rely on external workers)
+        max_in_flight (int): Upper bound on pending + running attempts for the batch
+
+    Returns:
+        dict: Summary with 'stats', 'overshoot', 'judging', 'total_cost' and 'num_workers'
+
+    Raises:
+        BatchBusy: If another process (or thread) is coordinating the batch
+    """
+    coordinator = claim_coordination(batch)
+    try:
+        with profile_batch(batch):
+            return _run_batch(batch, coordinator, num_workers, max_in_flight)
+    finally:
+        release_batch(batch.id, coordinator)
+
+
+def claim_coordination(batch):
+    """
+    Take the batch's coordinator lease, so only one dispatch loop runs per batch across all nodes.
+
+    Returns:
+        str: Coordinator name to renew and release the lease with
+
+    Raises:
+        BatchBusy: If another coordinator holds a live lease on the batch
+    """
+    coordinator = worker_name(f"coordinator-{threading.get_ident()}")
+    if not claim_batch(batch.id, coordinator):
+        holder = Batch.objects.values_list('coordinator', flat=True).get(id=batch.id)
+        raise BatchBusy(f"Batch {batch.id} is already being coordinated by {holder}")
+    return coordinator
+
+
+def resume_batch(batch, num_workers=NUM_WORKERS, max_in_flight=MAX_IN_FLIGHT, force=False):
+    """
+    Resume an interrupted batch from its recorded state.
+
+    Pending attempts and running attempts whose lease expired are picked up again, and
+    failed or cancelled attempts with persisted stage results are retried from the stage
+    where they stopped, so upstream calls that were already paid for are not repeated.
+
+    Args:
+        batch (Batch): The batch to resume
+        num_workers (int): Number of local worker threads
+        max_in_flight (int): Upper bound on pending + running attempts for the batch
+        force (bool): Resume even if attempts of the batch still hold live leases
+
+    Returns:
+        dict: Summary as returned by run_batch
+
+    Raises:
+        BatchBusy: If the batch is being coordinated elsewhere, or (without force) if
+            its attempts still hold live leases, i.e. it may not be interrupted at all
+    """
+    coordinator = claim_coordination(batch)
+    try:
+        if not force and batch.attempts.filter(status='running', lease_expires_at__gte=timezone.now()).exists():
+            raise BatchBusy(f"Batch {batch.id} has attempts with live leases; it may still be running elsewhere")
+        with profile_batch(batch):
+            return _resume_batch(batch, coordinator, num_workers, max_in_flight)
+    finally:
+        release_batch(batch.id, coordinator)
+
+
+def _resume_batch(batch, coordinator, num_workers, max_in_flight):
+    retry = batch.attempts.filter(
+        status__in=['failed', 'cancelled'],
+        id__in=AttemptStage.objects.values('attempt_id')
+    )
+    with transaction.atomic():
+        failed = retry.filter(status='failed').count()
+        retried = retry.update(status='pending', failed_stage=None, error=None, lease_owner=None, lease_expires_at=None)
+        # Failed attempts being retried no longer count as errors
+        count_outcomes(batch.id, {'error': -failed})
+    # Reservations left behind by workers that died mid-call. Reservations aren't tracked
+    # per worker, so they are only cleared when no worker on any node still holds a live
+    # lease on the batch; otherwise they are kept, which errs on the side of the budget
+    live_leases = Attempt.objects.filter(batch_id=OuterRef('id'), status='running', lease_expires_at__gte=timezone.now())
+    if not Batch.objects.filter(id=batch.id).exclude(Exists(live_leases)).update(reserved_cost=0):
+        print(f"⚠️  Batch {batch.id} has attempts with live leases; keeping its reserved cost")
+    pending = batch.attempts.filter(status__in=['pending', 'running']).count()
+    print(f"\n♻️  Resuming batch {batch.id}: {pending} unfinished attempts, {retried} of them with saved stages to retry")
+
+    return _run_batch(batch, coordinator, num_workers, max_in_flight)
+
+
+def _run_batch(batch, coordinator, num_workers, max_in_flight):
+    number_of_valid_needed = batch.number_of_valid_needed
+
+    batch.status = 'running'
+    batch.save(update_fields=['status', 'updated_at'])
+
+    print(f"\n🚀 Starting threaded problem generation with {num_workers} local workers")
+    print(f"Target: {number_of_valid_needed} valid problems")
+    print(f"MCQ Mode: {'Enabled' if batch.mcq_mode else 'Disabled'}")
+    print(f"Topic Sampler: {(batch.options or {}).get('sampler', {}).get('policy', 'uniform')}")
+    cap = budget_cap(batch)
+    if cap is not None:
+        print(f"Budget Cap: ${cap:.4f}")
+    defer_hints = bool((batch.options or {}).get('defer_hints'))
+    print(f"Hints: {'Deferred to the background hinter' if defer_hints else 'From the generator'}")
+    print("=" * 60)
+
+    sampler = make_sampler(batch)
+    if defer_hints:
+        # Hints for valid problems are written off the critical path; the batch doesn't wait for them
+        start_hint_worker(batch.id)
+    stop_event = threading.Event()
+    workers = start_workers(num_workers, batch.id, stop_event)
+    next_number = (batch.attempts.order_by('-number').values_list('number', flat=True).first() or 0) + 1
+
+    # Monitor progress and keep only as many attempts in flight as the
+    # running valid-yield estimate says are needed to finish the batch
+    final_status = 'completed'
+    taken_over = False
+    last_status_time = last_renewal = time.time()
+    status_interval = 10  # Print status every 10 seconds
+
+    while True:
+        try:
+            if time.time() - last_renewal >= RENEW_INTERVAL:
+                if not renew_batch(batch.id, coordinator):
+                    print(f"⚠️  Batch {batch.id} was taken over by another coordinator. Stopping local workers.")
+                    taken_over = True
+                    break
+                last_renewal = time.time()
+
+            stats = batch_counters(batch.id)
+            if stats['valid'] >= number_of_valid_needed:
+                break
+
+            # A worker whose LLM call was refused for lack of budget stops the batch;
+            # any other status was set from outside, e.g. by an admin or another process
+            current_status = Batch.objects.values_list('status', flat=True).get(id=batch.id)
+            if current_status != 'running':
+                if current_status == 'stopped':
+                    print(f"💸 Budget cap reached (${stats['total_cost']:.4f} spent). Stopping generation.")
+                else:
+                    print(f"🛑 Batch {batch.id} was marked {current_status} (${stats['total_cost']:.4f} spent). Stopping generation.")
+                final_status = current_status
+                break
+
+            if batch.max_cost_per_valid is not None and stats['total_cost'] > float(batch.max_cost_per_valid) * (stats['valid'] + 1):
+                print(f"💸 Cost per valid problem is over ${batch.max_cost_per_valid} ({stats['valid']} valid for ${stats['total_cost']:.4f}). Stopping generation.")
+                final_status = 'stopped'
+                break
+
+            # Top up in-flight attempts based on the estimated yield
+            new_tasks, desired_in_flight, yield_estimate = plan_dispatch(
+                stats['valid'], stats['attempts'], stats['in_flight'], number_of_valid_needed, max_in_flight
+            )
+
+            # ...but only as many as the remaining budget pays for at the observed cost per attempt
+            affordable = affordable_attempts(
+                cap,
+                stats['total_cost'] + stats['reserved_cost'],
+                stats['in_flight'],
+                stats['total_cost'] / stats['attempts'] if stats['attempts'] else None
+            )
+            if affordable is not None and new_tasks > affordable:
+                new_tasks = affordable
+                if new_tasks == 0 and stats['in_flight'] == 0:
+                    print(f"💸 Remaining budget doesn't cover another attempt (${stats['total_cost']:.4f} spent). Stopping generation.")
+                    final_status = 'stopped'
+                    break
+            if new_tasks:
+                create_attempts(batch, new_tasks, next_number, sampler)
+                next_number += new_tasks
+                print(f"Dispatched {new_tasks} tasks (In flight: {stats['in_flight'] + new_tasks}/{desired_in_flight}, Estimated yield: {yield_estimate:.1%})")
+
+            # Print periodic status
+            current_time = time.time()
+            if current_time - last_status_time >= status_interval:
+                print(f"\n📊 Status Update:")
+                print(f"   Valid: {stats['valid']}/{number_of_valid_needed}")
+                print(f"   Solved: {stats['solved']}")
+                print(f"   Discarded: {stats['discarded']}")
+                print(f"   Total Attempts: {stats['attempts']}")
+                print(f"   Total Cost: ${stats['total_cost']:.4f}")
+                print(f"   Pending: {stats['pending']}")
+                print(f"   Running: {stats['running']}")
+                print(f"   Active Local Workers: {sum(1 for w in workers if w.is_alive())}")
+                last_status_time = current_time
+
+            # Safety check - prevent infinite loop
+            if stats['attempts'] > number_of_valid_needed * SAFETY_FACTOR:
+                print(f"⚠️  Safety limit reached ({stats['attempts']} attempts). Stopping generation.")
+                final_status = 'stopped'
+                break
+
+            time.sleep(POLL_INTERVAL)
+
+        except KeyboardInterrupt:
+            print("\n🛑 Generation interrupted by user")
+            final_status = 'interrupted'
+            break
+
+    # Stop new claims, save the results already finished, then cancel queued
+    # attempts and in-flight attempts at their next stage boundary; a batch taken
+    # over by another coordinator is left to it
+    if not taken_over:
+        batch.status = final_status
+        batch.save(update_fields=['status', 'updated_at'])
+    result_writer.flush()
+    at_stop = batch_counters(batch.id)
+    if not taken_over:
+        batch.attempts.filter(status__in=['pending', 'running']).update(status='cancelled')
+        # Hold on to the batch while the workers wind down
+        renew_batch(batch.id, coordinator)
+
+    # Shutdown workers
+    print(f"\n🔄 Shutting down workers ({at_stop['in_flight']} attempts in flight)...")
+    stop_event.set()
+    for worker in workers:
+        worker.join(timeout=5)
+
+    # batch_cost was kept up to date by every LLM call
+    result_writer.flush()
+    stats = batch_counters(batch.id)
+    batch.refresh_from_db(fields=['batch_cost', 'reserved_cost'])
+
+    overshoot = {
+        'valid': max(stats['valid'] - number_of_valid_needed, 0),
+        'cost': round(stats['total_cost'] - at_stop['total_cost'], 6),
+        'in_flight_at_completion': at_stop['in_flight'],
+        'completed_after_target': stats['valid'] - at_stop['valid']
+    }
+
+    print(f"\n🎉 Generation Complete!")
+    print(f"   Valid Problems: {stats['valid']}")
+    print(f"   Solved Problems: {stats['solved']}")
+    print(f"   Discarded Problems: {stats['discarded']}")
+    print(f"   Total Attempts: {stats['attempts']}")
+    print(f"   Cancelled Attempts: {stats['cancelled']}")
+    print(f"   Total Cost: ${stats['total_cost']:.4f}")
+    print(f"   Overshoot: {overshoot['valid']} valid problems, ${overshoot['cost']:.4f} spent after target")
+    print(f"   Success Rate: {(stats['valid'] / stats['attempts'] * 100):.1f}%" if stats['attempts'] > 0 else "N/A")
+    judging = judging_counters(batch.id)
+    if judging['judged']:
+        print(f"   Judged Locally: {judging['judged_locally']}/{judging['judged']} ({judging['local_rate']:.1%})")
+
+    return {
+        'stats': stats,
+        'overshoot': overshoot,
+        'judging': judging,
+        'total_cost': stats['total_cost'],
+        'num_workers': num_workers
+    }
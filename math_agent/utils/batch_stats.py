@@ -0,0 +1,112 @@
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from math_agent.models import Batch, Problem, Attempt, TargetResult
+
+OUTCOME_FIELDS = {
+    'valid': 'valid_count',
+    'solved': 'solved_count',
+    'discarded': 'discarded_count',
+    'error': 'error_count'
+}
+COUNTER_FIELDS = list(OUTCOME_FIELDS.values()) + ['attempt_count', 'judged_count', 'judged_locally_count']
+
+
+def count_outcomes(batch_id, outcomes, judged=0, judged_locally=0):
+    """
+    Add finished attempts to a batch's stored counters, in the caller's transaction.
+
+    Args:
+        batch_id (int): The batch
+        outcomes (dict): Attempts per outcome ('valid', 'solved', 'discarded' or 'error'); negative to take them back
+        judged (int): Judged target answer samples of the saved problems
+        judged_locally (int): How many of those the local judge decided
+    """
+    updates = {OUTCOME_FIELDS[outcome]: F(OUTCOME_FIELDS[outcome]) + count for outcome, count in outcomes.items() if count}
+    if sum(outcomes.values()):
+        updates['attempt_count'] = F('attempt_count') + sum(outcomes.values())
+    if judged:
+        updates['judged_count'] = F('judged_count') + judged
+    if judged_locally:
+        updates['judged_locally_count'] = F('judged_locally_count') + judged_locally
+    if updates:
+        Batch.objects.filter(id=batch_id).update(**updates)
+
+
+def batch_stats(batch):
+    """
+    A batch's stored counters, without querying the database.
+
+    Returns:
+        dict: valid, solved, discarded, errors, attempts, judged, judged_locally and
+        local_rate (None before anything was judged)
+    """
+    return {
+        'valid': batch.valid_count,
+        'solved': batch.solved_count,
+        'discarded': batch.discarded_count,
+        'errors': batch.error_count,
+        'attempts': batch.attempt_count,
+        'judged': batch.judged_count,
+        'judged_locally': batch.judged_locally_count,
+        'local_rate': batch.judged_locally_count / batch.judged_count if batch.judged_count else None
+    }
+
+
+def problem_count(batch_id=None, status=None):
+    """
+    Number of problems, of one batch or all, optionally with one status, summed from
+    the batches' stored counters instead of counting problem rows.
+    """
+    if status is None:
+        fields = ['valid_count', 'solved_count', 'discarded_count']
+    elif status in ('valid', 'solved', 'discarded'):
+        fields = [OUTCOME_FIELDS[status]]
+    else:
+        return 0
+    batches = Batch.objects.all() if batch_id is None else Batch.objects.filter(id=batch_id)
+    totals = batches.aggregate(**{field: Sum(field) for field in fields})
+    return sum(total or 0 for total in totals.values())
+
+
+def rebuild_batch_stats(batch_ids=None):
+    """
+    Recompute the stored counters from problems, failed attempts and target results,
+    e.g. after problems were deleted by hand.
+
+    Args:
+        batch_ids (list, optional): Only these batches; all batches otherwise
+
+    Returns:
+        int: Number of batches updated
+    """
+    batches = Batch.objects.only('id', *COUNTER_FIELDS)
+    problems = Problem.objects.values('batch_id').annotate(
+        valid=Count('id', filter=Q(status='valid')),
+        solved=Count('id', filter=Q(status='solved')),
+        discarded=Count('id', filter=Q(status='discarded'))
+    )
+    errors = Attempt.objects.filter(status='failed').values('batch_id').annotate(errors=Count('id'))
+    judging = TargetResult.objects.values('problem__batch_id').annotate(judged=Sum('samples'), judged_locally=Sum('judged_locally'))
+    if batch_ids is not None:
+        batches = batches.filter(id__in=batch_ids)
+        problems = problems.filter(batch_id__in=batch_ids)
+        errors = errors.filter(batch_id__in=batch_ids)
+        judging = judging.filter(problem__batch_id__in=batch_ids)
+
+    # Counted with the batches locked, so increments by a running pipeline can't be lost in between
+    with transaction.atomic():
+        batches = list(batches.select_for_update())
+        problems = {row['batch_id']: row for row in problems}
+        errors = {row['batch_id']: row['errors'] for row in errors}
+        judging = {row['problem__batch_id']: row for row in judging}
+        for batch in batches:
+            counts = problems.get(batch.id, {})
+            batch.valid_count = counts.get('valid', 0)
+            batch.solved_count = counts.get('solved', 0)
+            batch.discarded_count = counts.get('discarded', 0)
+            batch.error_count = errors.get(batch.id, 0)
+            batch.attempt_count = batch.valid_count + batch.solved_count + batch.discarded_count + batch.error_count
+            batch.judged_count = judging.get(batch.id, {}).get('judged') or 0
+            batch.judged_locally_count = judging.get(batch.id, {}).get('judged_locally') or 0
+        Batch.objects.bulk_update(batches, COUNTER_FIELDS, batch_size=500)
+    return len(batches)
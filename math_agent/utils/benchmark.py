@@ -0,0 +1,250 @@
+import contextlib
+import io
+import json
+import math
+import os
+import random
+import re
+import shutil
+import tempfile
+import time
+import uuid
+from django.db import connection
+from unittest import mock
+from math_agent.models import Batch, Problem
+from . import call_llm_clients, similarity_utils
+from .system_messages import (
+    GENERATOR_MESSAGE, GENERATOR_MCQ_MESSAGE, HINT_ONLY_MESSAGE, CHECKER_MESSAGE, CHECKER_NO_HINTS_MESSAGE,
+    HINT_CHECKER_MESSAGE, TARGET_MESSAGE, TARGET_MCQ_MESSAGE, JUDGE_MESSAGE, JUDGE_MCQ_MESSAGE
+)
+from .batch_runner import run_batch
+from .result_writer import result_writer
+from .metrics import db_write_seconds, similarity_seconds
+
+STUB_MODEL = {"provider": "openai", "model": "o3-mini"}  # Priced like the real model so cost accounting runs too
+BENCHMARK_PIPELINE = {stage: dict(STUB_MODEL) for stage in ['generator', 'hinter', 'checker', 'target', 'judge']}
+BENCHMARK_TAXONOMY = {
+    "Algebra": ["Group Theory", "Ring Theory", "Linear Algebra"],
+    "Analysis": ["Measure Theory", "Complex Analysis"],
+    "Number Theory": ["Diophantine Equations", "Analytic Number Theory"]
+}
+DB_WRITE_OPERATIONS = ['stage', 'results', 'telemetry']
+SEED_CHUNK = 5000  # Problems inserted per bulk_create when seeding the corpus
+
+TRUE_ANSWER, WRONG_ANSWER = "42", "41"
+TRUE_CHOICE, WRONG_CHOICE = "B", "C"
+
+
+@contextlib.contextmanager
+def throwaway_database():
+    """
+    Point the default connection at a fresh, migrated database for the duration of
+    the block, then delete it, so benchmarks never touch real data.
+
+    On SQLite the database is a temporary file rather than the test runner's
+    in-memory default, so worker threads use their own connections as in production.
+    """
+    old_name = connection.settings_dict['NAME']
+    old_test_name = connection.settings_dict['TEST'].get('NAME')
+    temp_dir = None
+    if connection.vendor == 'sqlite':
+        temp_dir = tempfile.mkdtemp(prefix='math_agent_benchmark_')
+        connection.settings_dict['TEST']['NAME'] = os.path.join(temp_dir, 'benchmark.sqlite3')
+    try:
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            yield
+        finally:
+            result_writer.flush(close_connection=True)
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+    finally:
+        connection.settings_dict['TEST']['NAME'] = old_test_name
+        if temp_dir:
+            # Also removes WAL files left by connections of threads still running
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+class StubBackend:
+    """
+    Stand-in for the LLM providers and the embedding API, answering every pipeline
+    prompt after a fixed latency, so the orchestration can be benchmarked offline.
+
+    Used as a context manager: while active, call_llm and find_similar_problems go
+    through the stub instead of the network.
+    """
+
+    def __init__(self, llm_latency=0.05, embedding_latency=0.01, dimensions=64, check_pass_rate=0.7, solve_rate=0.5, seed=0):
+        self.llm_latency = llm_latency
+        self.embedding_latency = embedding_latency
+        self.dimensions = dimensions
+        self.check_pass_rate = check_pass_rate
+        self.solve_rate = solve_rate
+        self.random = random.Random(seed)
+        self._patches = []
+
+    def __enter__(self):
+        self._patches = [
+            mock.patch.object(call_llm_clients, 'request_completion', self.request_completion),
+            mock.patch.object(similarity_utils, 'fetch_embedding', self.fetch_embedding)
+        ]
+        for patch in self._patches:
+            patch.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        for patch in reversed(self._patches):
+            patch.stop()
+        self._patches = []
+
+    def random_embedding(self):
+        """A random unit vector, like an embedding of an unrelated problem."""
+        vector = [self.random.gauss(0, 1) for _ in range(self.dimensions)]
+        norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return [round(x / norm, 6) for x in vector]
+
+    def fetch_embedding(self, text, provider='openai', model=similarity_utils.EMBEDDING_MODEL):
+        time.sleep(self.embedding_latency)
+        return self.random_embedding()
+
+    def problem(self, mcq_mode):
+        question = f"Benchmark problem {uuid.uuid4().hex}: evaluate the stub expression."
+        if mcq_mode:
+            question += "\nChoices =>\nA) 40\nB) 42\nC) 41\nD) 43\nGTFA:"
+        return {
+            "problem": question,
+            "answer": TRUE_CHOICE if mcq_mode else TRUE_ANSWER,
+            "hints": {"0": "Stub hint."}
+        }
+
+    def respond(self, messages):
+        """The JSON object a model would return for a pipeline prompt."""
+        system, user = messages[0]['content'], messages[-1]['content']
+
+        if system.startswith(GENERATOR_MCQ_MESSAGE) or system.startswith(GENERATOR_MESSAGE):
+            mcq_mode = system.startswith(GENERATOR_MCQ_MESSAGE)
+            requested = re.match(r'Generate (\d+) math problems', user)
+            if requested:
+                return {"problems": [self.problem(mcq_mode) for _ in range(int(requested.group(1)))]}
+            return self.problem(mcq_mode)
+        if system in (CHECKER_MESSAGE, CHECKER_NO_HINTS_MESSAGE):
+            return {"valid": self.random.random() < self.check_pass_rate, "reason": "Stub checker verdict"}
+        if system == HINT_CHECKER_MESSAGE:
+            return {"valid": True, "reason": "Stub hint check"}
+        if system in (TARGET_MESSAGE, TARGET_MCQ_MESSAGE):
+            solved = self.random.random() < self.solve_rate
+            if system == TARGET_MCQ_MESSAGE:
+                return {"answer": TRUE_CHOICE if solved else WRONG_CHOICE}
+            return {"answer": TRUE_ANSWER if solved else WRONG_ANSWER}
+        if system in (JUDGE_MESSAGE, JUDGE_MCQ_MESSAGE):
+            data = json.loads(user)
+            return {"valid": str(data['model_answer']).strip() == str(data['true_answer']).strip()}
+        if system == HINT_ONLY_MESSAGE:
+            return {"hints": {"0": "Stub hint."}}
+        raise ValueError("Benchmark stub has no response for this prompt")
+
+    def request_completion(self, provider, model, messages):
+        time.sleep(self.llm_latency)
+        raw_response = json.dumps(self.respond(messages))
+        input_tokens = sum(len(message['content']) for message in messages) // 4
+        return raw_response, input_tokens, len(raw_response) // 4 + 1
+
+
+def seed_corpus(size, stub):
+    """
+    Grow the stored problems to `size`, giving each a random embedding, so similarity
+    checks compare against a corpus of that size.
+
+    Returns:
+        int: Number of problems added
+    """
+    missing = size - Problem.objects.count()
+    if missing <= 0:
+        return 0
+
+    corpus_batch = Batch.objects.filter(name='Benchmark corpus').first() or Batch.objects.create(
+        name='Benchmark corpus',
+        taxonomy_json=BENCHMARK_TAXONOMY,
+        pipeline=BENCHMARK_PIPELINE,
+        number_of_valid_needed=1,
+        status='completed'
+    )
+    subjects = [(subject, topic) for subject, topics in BENCHMARK_TAXONOMY.items() for topic in topics]
+    for start in range(0, missing, SEED_CHUNK):
+        Problem.objects.bulk_create([
+            Problem(
+                subject=subjects[i % len(subjects)][0],
+                topic=subjects[i % len(subjects)][1],
+                question=f"Corpus problem {i}",
+                answer=TRUE_ANSWER,
+                hints={"0": "Stub hint."},
+                status='valid',
+                batch=corpus_batch,
+                problem_embedding=stub.random_embedding()
+            )
+            for i in range(start, min(start + SEED_CHUNK, missing))
+        ])
+    return missing
+
+
+def _metric_totals():
+    totals = {f'db_{operation}': db_write_seconds.totals(operation=operation) for operation in DB_WRITE_OPERATIONS}
+    totals['similarity'] = similarity_seconds.totals()
+    return totals
+
+
+def _timing(before, after):
+    count = after[0] - before[0]
+    seconds = after[1] - before[1]
+    return {'count': count, 'mean_ms': round(seconds / count * 1000, 3) if count else None}
+
+
+def run_scenario(workers, corpus_size, mcq_mode, valid_needed, options=None, quiet=True):
+    """
+    Run one benchmark batch through the real batch runner against the active stub backend.
+
+    Args:
+        workers (int): Local worker threads
+        corpus_size (int): Stored problems every similarity check compares against
+        mcq_mode (bool): Generate MCQ problems
+        valid_needed (int): Valid problems the batch asks for
+        options (dict, optional): Batch options, e.g. {"problems_per_call": 3}
+        quiet (bool): Swallow the runner's progress output
+
+    Returns:
+        dict: Throughput (attempts/sec, valid problems/sec), DB write and similarity
+        check latency, cost and the batch's final status
+    """
+    batch = Batch.objects.create(
+        name=f"Benchmark {workers} workers, {corpus_size} problems, {'MCQ' if mcq_mode else 'non-MCQ'}",
+        taxonomy_json=BENCHMARK_TAXONOMY,
+        pipeline=BENCHMARK_PIPELINE,
+        number_of_valid_needed=valid_needed,
+        mcq_mode=mcq_mode,
+        options=options or {}
+    )
+
+    before = _metric_totals()
+    output = io.StringIO() if quiet else None
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(output) if quiet else contextlib.nullcontext():
+        summary = run_batch(batch, num_workers=workers, max_in_flight=workers * 2)
+    seconds = time.perf_counter() - started
+    after = _metric_totals()
+    batch.refresh_from_db(fields=['status'])
+
+    stats = summary['stats']
+    return {
+        'workers': workers,
+        'corpus_size': corpus_size,
+        'mcq_mode': mcq_mode,
+        'valid_needed': valid_needed,
+        'status': batch.status,
+        'seconds': round(seconds, 3),
+        'attempts': stats['attempts'],
+        'valid': stats['valid'],
+        'attempts_per_second': round(stats['attempts'] / seconds, 4),
+        'valid_per_second': round(stats['valid'] / seconds, 4),
+        'cost': stats['total_cost'],
+        'db_writes': {operation: _timing(before[f'db_{operation}'], after[f'db_{operation}']) for operation in DB_WRITE_OPERATIONS},
+        'similarity_check': _timing(before['similarity'], after['similarity'])
+    }
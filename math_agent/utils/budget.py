@@ -0,0 +1,178 @@
+import math
+import threading
+from contextlib import contextmanager
+from decimal import Decimal
+from django.db.models import DecimalField, ExpressionWrapper, F, Q, Value
+from math_agent.models import Batch
+from .LLM_cost import calculate_cost
+from .metrics import budget_refusals
+
+CHARS_PER_TOKEN = 4  # Rough prompt size estimate used before the real token count is known
+ESTIMATED_OUTPUT_TOKENS = 4000  # Output tokens reserved per call; reasoning models often use thousands
+DEFAULT_CALL_ESTIMATE = 0.01  # Reserved for models missing from the pricing table
+
+# Batch (and attempt) the LLM calls of the current thread are charged to
+_context = threading.local()
+
+
+class BudgetExceeded(Exception):
+    """Raised when an LLM call would take a batch over its budget."""
+    pass
+
+
+@contextmanager
+def charge_to_batch(batch_id, attempt_id=None, problem_id=None):
+    """
+    Charge every call_llm made by this thread inside the block to a batch's budget.
+
+    The scope also tags the calls' telemetry with the attempt or problem they were
+    made for and the stage retry (scope['retry'], set by the stage runner).
+    """
+    previous = getattr(_context, 'scope', None)
+    _context.scope = {
+        'batch_id': batch_id,
+        'attempt_id': attempt_id,
+        'problem_id': problem_id,
+        'retry': 0,
+        'refused': False
+    }
+    try:
+        yield _context.scope
+    finally:
+        _context.scope = previous
+
+
+def current_scope():
+    """The budget scope of this thread, or None outside charge_to_batch."""
+    return getattr(_context, 'scope', None)
+
+
+def bind_scope(func):
+    """Wrap func so calls it makes on another thread are charged to this thread's batch."""
+    scope = current_scope()
+
+    def run(*args, **kwargs):
+        previous = getattr(_context, 'scope', None)
+        _context.scope = scope
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _context.scope = previous
+    return run
+
+
+def budget_refused():
+    """Whether a call in this thread's budget scope was refused."""
+    scope = current_scope()
+    return bool(scope and scope['refused'])
+
+
+def estimate_call_cost(provider, model, messages):
+    """
+    Estimate what an LLM call may cost before it is made.
+
+    Returns:
+        float: Cost of the prompt plus ESTIMATED_OUTPUT_TOKENS of output
+    """
+    prompt_chars = sum(len(message['content']) for message in messages)
+    try:
+        return calculate_cost(provider, model, math.ceil(prompt_chars / CHARS_PER_TOKEN), ESTIMATED_OUTPUT_TOKENS)
+    except ValueError:
+        return DEFAULT_CALL_ESTIMATE
+
+
+def _money(amount):
+    return Decimal(str(round(amount, 6)))
+
+
+def reserve_call(provider, model, messages):
+    """
+    Reserve the estimated cost of a call against the budget of this thread's batch.
+
+    The check and the reservation are a single conditional UPDATE, so concurrent calls
+    from any worker or node can never together commit more than the batch's caps.
+    When a call is refused the batch is marked 'stopped', which stops new claims and
+    the batch's dispatch.
+
+    Returns:
+        float or None: The reserved amount, or None when no batch is being charged
+
+    Raises:
+        BudgetExceeded: The call would take the batch over budget_limit or
+            max_cost_per_valid * number_of_valid_needed
+    """
+    scope = current_scope()
+    if scope is None:
+        return None
+
+    estimate = estimate_call_cost(provider, model, messages)
+    committed = ExpressionWrapper(
+        F('batch_cost') + F('reserved_cost') + Value(_money(estimate)), output_field=DecimalField()
+    )
+    per_valid_cap = ExpressionWrapper(
+        F('max_cost_per_valid') * F('number_of_valid_needed'), output_field=DecimalField()
+    )
+    reserved = Batch.objects.filter(id=scope['batch_id']).alias(
+        committed=committed, per_valid_cap=per_valid_cap
+    ).filter(
+        Q(budget_limit__isnull=True) | Q(budget_limit__gte=F('committed')),
+        Q(max_cost_per_valid__isnull=True) | Q(per_valid_cap__gte=F('committed'))
+    ).update(reserved_cost=F('reserved_cost') + _money(estimate))
+
+    if not reserved:
+        scope['refused'] = True
+        budget_refusals.inc()
+        Batch.objects.filter(id=scope['batch_id'], status='running').update(status='stopped')
+        raise BudgetExceeded(f"Budget of batch {scope['batch_id']} exhausted: refusing {provider}/{model} call estimated at ${estimate:.4f}")
+    return estimate
+
+
+def settle_call(reserved, cost):
+    """
+    Replace a call's reservation with what it actually cost.
+
+    Args:
+        reserved (float or None): Amount returned by reserve_call
+        cost (float): Actual cost of the call (0 if it never reached the provider)
+    """
+    scope = current_scope()
+    if scope is None or reserved is None:
+        return
+    Batch.objects.filter(id=scope['batch_id']).update(
+        reserved_cost=F('reserved_cost') - _money(reserved),
+        batch_cost=F('batch_cost') + _money(cost)
+    )
+
+
+def budget_cap(batch):
+    """
+    The tightest spend cap configured for a batch.
+
+    Returns:
+        float or None: The cap in USD, or None if the batch has no budget
+    """
+    caps = []
+    if batch.budget_limit is not None:
+        caps.append(float(batch.budget_limit))
+    if batch.max_cost_per_valid is not None:
+        caps.append(float(batch.max_cost_per_valid) * batch.number_of_valid_needed)
+    return min(caps) if caps else None
+
+
+def affordable_attempts(cap, committed, in_flight, cost_per_attempt):
+    """
+    How many more attempts fit in the budget at the observed cost per attempt.
+
+    Args:
+        cap (float or None): Spend cap from budget_cap
+        committed (float): Money spent plus reserved for calls in flight
+        in_flight (int): Attempts queued or being processed, which will spend more
+        cost_per_attempt (float or None): Average spend of a finished attempt, None if unknown yet
+
+    Returns:
+        int or None: Number of attempts that can still be dispatched, None if unlimited
+    """
+    if cap is None or not cost_per_attempt:
+        return None
+    remaining = cap - committed - in_flight * cost_per_attempt
+    return max(math.floor(remaining / cost_per_attempt), 0)
@@ -3,7 +3,12 @@ import google.generativeai as genai
 from django.conf import settings
 import json
 import re
+import time
+from django.utils import timezone
 from .LLM_cost import calculate_cost
+from .budget import reserve_call, settle_call
+from .telemetry import record_call
+from .metrics import llm_calls, llm_call_seconds, llm_tokens, llm_cost
 
 def safe_json_parse(raw_text):
     """Parse JSON from model response, handling common formatting issues."""
@@ -25,47 +30,70 @@ def safe_json_parse(raw_text):
         print("Offending text:\n", raw_text[e.pos-50:e.pos+50])
         raise ValueError(f"Model output is not valid JSON: {e}")
 
-def call_llm(pipeline_config, messages):
+def request_completion(provider, model, messages):
+    """
+    Send messages to a provider's chat model.
+
+    Returns:
+        tuple: (raw_response, input_tokens, output_tokens)
+    """
+    if provider == 'openai':
+        client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
+        response = client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=1.0
+        )
+        raw_response = response.choices[0].message.content.strip()
+        input_tokens = response.usage.prompt_tokens
+        output_tokens = response.usage.completion_tokens
+        
+    elif provider == 'google':
+        genai.configure(api_key=settings.GOOGLE_API_KEY)
+        model_instance = genai.GenerativeModel(model)
+        # Convert messages to a single prompt for Gemini
+        prompt = "\n".join([msg["content"] for msg in messages])
+        response = model_instance.generate_content(prompt)
+        raw_response = response.text.strip()
+        input_tokens = response.prompt_token_count
+        output_tokens = response.candidates[0].token_count
+        
+    else:
+        raise ValueError(f"Unsupported provider: {provider}")
+
+    return raw_response, input_tokens, output_tokens
+
+def call_llm(pipeline_config, messages, role=None):
     """
     Make a call to the specified LLM provider and model.
+
+    Inside budget.charge_to_batch the call's estimated cost is reserved against the
+    batch budget first, and the actual cost is added to batch_cost as soon as it is
+    known, even if the response turns out not to be valid JSON.
     
     Args:
         pipeline_config (dict): Configuration containing provider and model information
             Example: {"provider": "openai", "model": "o3-mini"}
         messages (list): List of message dictionaries with 'role' and 'content'
+        role (str, optional): Pipeline stage making the call, recorded in its LLMCall telemetry
         
     Returns:
         tuple: (parsed_response, cost)
             - parsed_response (dict): The parsed JSON response from the model
             - cost (float): The calculated cost for this API call
+
+    Raises:
+        BudgetExceeded: The batch being charged has no budget left for this call
     """
+    provider = pipeline_config['provider'].lower()
+    model = pipeline_config['model']
+    reserved = reserve_call(provider, model, messages)
+
+    cost = 0.0
+    input_tokens = output_tokens = error = None
+    started_at, started = timezone.now(), time.perf_counter()
     try:
-        provider = pipeline_config['provider'].lower()
-        model = pipeline_config['model']
-        
-        if provider == 'openai':
-            client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
-            response = client.chat.completions.create(
-                model=model,
-                messages=messages,
-                temperature=1.0
-            )
-            raw_response = response.choices[0].message.content.strip()
-            input_tokens = response.usage.prompt_tokens
-            output_tokens = response.usage.completion_tokens
-            
-        elif provider == 'google':
-            genai.configure(api_key=settings.GOOGLE_API_KEY)
-            model_instance = genai.GenerativeModel(model)
-            # Convert messages to a single prompt for Gemini
-            prompt = "\n".join([msg["content"] for msg in messages])
-            response = model_instance.generate_content(prompt)
-            raw_response = response.text.strip()
-            input_tokens = response.prompt_token_count
-            output_tokens = response.candidates[0].token_count
-            
-        else:
-            raise ValueError(f"Unsupported provider: {provider}")
+        raw_response, input_tokens, output_tokens = request_completion(provider, model, messages)
         
         # Calculate cost using LLM_cost utility
         cost = calculate_cost(
@@ -79,8 +107,19 @@ def call_llm(pipeline_config, messages):
         return safe_json_parse(raw_response), cost
             
     except Exception as e:
+        error = str(e)
         raise Exception(f"Error calling LLM: {str(e)}")
 
+    finally:
+        settle_call(reserved, cost)
+        duration = time.perf_counter() - started
+        record_call(provider, model, role, started_at, duration, input_tokens, output_tokens, cost, error)
+        llm_calls.inc(provider=provider, model=model, role=role or 'other', result='error' if error else 'ok')
+        llm_call_seconds.observe(duration, provider=provider, model=model, role=role or 'other')
+        llm_tokens.inc(input_tokens or 0, provider=provider, model=model, direction='input')
+        llm_tokens.inc(output_tokens or 0, provider=provider, model=model, direction='output')
+        llm_cost.inc(cost, provider=provider, model=model)
+
 # Example usage:
 if __name__ == "__main__":
     # Example messages
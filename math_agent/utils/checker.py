@@ -1,9 +1,9 @@
 import json
 from django.conf import settings
-from .system_messages import CHECKER_MESSAGE
+from .system_messages import CHECKER_MESSAGE, CHECKER_NO_HINTS_MESSAGE, HINT_CHECKER_MESSAGE
 from .call_llm_clients import call_llm
 
-def check_problem(question, answer, hints, pipeline_config):
+def check_problem(question, answer, hints, pipeline_config, with_hints=True):
     """
     Check if a math problem and its hints are valid using the specified model.
     
@@ -13,6 +13,8 @@ def check_problem(question, answer, hints, pipeline_config):
         hints (dict): Dictionary of hints to validate
         pipeline_config (dict): Configuration containing provider and model information
             Example: {"provider": "openai", "model": "o3-mini"}
+        with_hints (bool): Validate the hints too; False for problems generated with
+            deferred hints, which are checked by check_hints once written
         
     Returns:
         tuple: (is_valid, rejection_reason, corrected_hints, cost)
@@ -21,23 +23,60 @@ def check_problem(question, answer, hints, pipeline_config):
         # Prepare the input for the model
         input_data = {
             "problem": question,
-            "answer": answer,
-            "hints": hints
+            "answer": answer
         }
+        if with_hints:
+            input_data["hints"] = hints
         
         messages = [
-            {"role": "system", "content": CHECKER_MESSAGE},
+            {"role": "system", "content": CHECKER_MESSAGE if with_hints else CHECKER_NO_HINTS_MESSAGE},
             {"role": "user", "content": json.dumps(input_data)}
         ]
         
-        data, cost = call_llm(pipeline_config, messages)
+        data, cost = call_llm(pipeline_config, messages, role='checker')
         
         # Extract validation result
         is_valid = data.get('valid', False)
         reason = data.get('reason', '')
-        corrected_hints = data.get('corrected_hints', {})
+        corrected_hints = data.get('corrected_hints', {}) if with_hints else {}
         
         return is_valid, reason, corrected_hints, cost
         
     except Exception as e:
-        raise Exception(f"Error checking problem: {str(e)}") 
\ No newline at end of file
+        raise Exception(f"Error checking problem: {str(e)}")
+
+def check_hints(question, answer, hints, pipeline_config):
+    """
+    Check the hints written for an already validated problem.
+    
+    Args:
+        question (str): The math problem
+        answer (str): The correct answer
+        hints (dict): Dictionary of hints to validate
+        pipeline_config (dict): Configuration containing provider and model information
+        
+    Returns:
+        tuple: (hints, cost) with the hints as corrected by the checker
+        
+    Raises:
+        Exception: If the checker rejects the hints without correcting them
+    """
+    input_data = {
+        "problem": question,
+        "answer": answer,
+        "hints": hints
+    }
+    
+    messages = [
+        {"role": "system", "content": HINT_CHECKER_MESSAGE},
+        {"role": "user", "content": json.dumps(input_data)}
+    ]
+    
+    data, cost = call_llm(pipeline_config, messages, role='checker')
+    
+    corrected_hints = data.get('corrected_hints') or {}
+    if isinstance(corrected_hints, dict) and any(str(h).strip() for h in corrected_hints.values()):
+        return corrected_hints, cost
+    if not data.get('valid', False):
+        raise Exception(f"Hints rejected by checker: {data.get('reason', '')}")
+    return hints, cost
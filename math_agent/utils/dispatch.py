@@ -0,0 +1,56 @@
+import math
+
+# Prior used before a batch has produced enough results to estimate its own yield
+DEFAULT_PRIOR_YIELD = 0.2
+PRIOR_WEIGHT = 5  # Number of "virtual" attempts the prior is worth
+MIN_YIELD = 0.02  # Never assume a yield worse than this when sizing dispatch
+
+
+class AttemptCancelled(Exception):
+    """Raised inside a worker when its attempt is cancelled at a stage boundary."""
+    pass
+
+
+def estimate_valid_yield(valid, completed_attempts, prior_yield=DEFAULT_PRIOR_YIELD, prior_weight=PRIOR_WEIGHT):
+    """
+    Estimate the running valid-yield rate (valid problems per finished attempt).
+
+    The observed rate is smoothed with a prior so the first few results of a batch
+    don't swing the dispatcher between extremes.
+
+    Args:
+        valid (int): Valid problems produced so far
+        completed_attempts (int): Attempts that finished (valid, solved, discarded or error)
+        prior_yield (float): Yield assumed before any attempt has finished
+        prior_weight (int): How many attempts the prior is worth
+
+    Returns:
+        float: Estimated probability that a dispatched attempt ends up valid
+    """
+    estimate = (valid + prior_yield * prior_weight) / (completed_attempts + prior_weight)
+    return max(estimate, MIN_YIELD)
+
+
+def plan_dispatch(valid, completed_attempts, in_flight, target_valid, max_in_flight):
+    """
+    Decide how many new attempts to dispatch so that the attempts in flight are
+    just enough to finish the batch.
+
+    Args:
+        valid (int): Valid problems produced so far
+        completed_attempts (int): Attempts that finished so far
+        in_flight (int): Attempts queued or being processed
+        target_valid (int): Number of valid problems requested for the batch
+        max_in_flight (int): Upper bound on attempts queued or running at once
+
+    Returns:
+        tuple: (new_tasks, desired_in_flight, yield_estimate)
+    """
+    remaining = target_valid - valid
+    yield_estimate = estimate_valid_yield(valid, completed_attempts)
+    if remaining <= 0:
+        return 0, 0, yield_estimate
+
+    desired_in_flight = min(math.ceil(remaining / yield_estimate), max_in_flight)
+    new_tasks = max(desired_in_flight - in_flight, 0)
+    return new_tasks, desired_in_flight, yield_estimate
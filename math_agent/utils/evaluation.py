@@ -0,0 +1,170 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.db import connection
+from .budget import bind_scope
+from .profiling import bind_profiling
+
+# How a problem's status follows from the targets that solved it
+STATUS_RULES = ['unsolved_by_all', 'unsolved_by_any', 'unsolved_by_majority']
+DEFAULT_STATUS_RULE = 'unsolved_by_all'
+SAMPLE_WAVE_SIZE = 2  # Target samples pass@k sampling draws at once before checking for a solve
+
+
+def target_label(config):
+    """Label identifying a model in stage outputs, e.g. 'openai/o3-mini'."""
+    return f"{config['provider']}/{config['model']}"
+
+
+def pipeline_targets(pipeline):
+    """
+    Pair each target model in a pipeline with the judge that grades it.
+
+    pipeline['target'] is a single config or a list of them; pipeline['judge'] is a
+    single config shared by every target, or a list with one judge per target.
+
+    Returns:
+        list: (label, target_config, judge_config) tuples
+    """
+    targets = pipeline['target'] if isinstance(pipeline['target'], list) else [pipeline['target']]
+    judges = pipeline['judge'] if isinstance(pipeline['judge'], list) else [pipeline['judge']] * len(targets)
+    if len(judges) != len(targets):
+        raise ValueError(f"Pipeline has {len(targets)} targets but {len(judges)} judges")
+
+    pairs = [(target_label(target), target, judge) for target, judge in zip(targets, judges)]
+    labels = [label for label, _, _ in pairs]
+    if len(set(labels)) != len(labels):
+        raise ValueError(f"Duplicate target models in pipeline: {', '.join(labels)}")
+    return pairs
+
+
+def in_worker_thread(func):
+    """Wrap a call for a pool thread: keep charging (and profiling) the caller's batch and close the thread's DB connection after."""
+    bound = bind_profiling(bind_scope(func))
+
+    def run():
+        try:
+            return bound()
+        finally:
+            connection.close()
+    return run
+
+
+def derive_status(solved_by, rule=DEFAULT_STATUS_RULE):
+    """
+    Decide a checked problem's status from the per-target judge results.
+
+    Args:
+        solved_by (dict): {label: bool} whether each target solved the problem
+        rule (str): 'unsolved_by_all' (valid only if no target solved it),
+            'unsolved_by_any' (valid if at least one target failed) or
+            'unsolved_by_majority' (valid if most targets failed)
+
+    Returns:
+        str: 'valid' or 'solved'
+    """
+    unsolved = sum(1 for solved in solved_by.values() if not solved)
+    if rule == 'unsolved_by_all':
+        is_valid = unsolved == len(solved_by)
+    elif rule == 'unsolved_by_any':
+        is_valid = unsolved > 0
+    elif rule == 'unsolved_by_majority':
+        is_valid = unsolved * 2 > len(solved_by)
+    else:
+        raise ValueError(f"Unknown status rule '{rule}'. Use one of: {', '.join(STATUS_RULES)}")
+    return 'valid' if is_valid else 'solved'
+
+
+def fan_out(calls, done):
+    """
+    Run one call per target concurrently, keeping results that succeeded.
+
+    Calls already present in `done` are skipped, so when the stage is retried only
+    the targets that failed are called again.
+
+    Args:
+        calls (dict): {label: callable returning (result, cost)}
+        done (dict): {label: {'result': ..., 'cost': ...}} filled in as calls succeed
+
+    Returns:
+        dict: `done`, once every call has succeeded
+
+    Raises:
+        Exception: The first error of a failed call, after all calls have finished
+    """
+    pending = {label: call for label, call in calls.items() if label not in done}
+    if not pending:
+        return done
+
+    errors = []
+    with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+        futures = {label: executor.submit(in_worker_thread(call)) for label, call in pending.items()}
+        for label, future in futures.items():
+            try:
+                result, cost = future.result()
+                done[label] = {'result': result, 'cost': cost}
+            except Exception as e:
+                errors.append(Exception(f"{label}: {str(e)}"))
+
+    if errors:
+        raise errors[0]
+    return done
+
+
+def sample_until_solved(target_call, judge_call, samples, wave_size=SAMPLE_WAVE_SIZE):
+    """
+    pass@k with early exit: ask the target for up to samples solutions, wave_size at a
+    time in parallel, and stop sending waves once a solution is judged correct.
+
+    Every solution of a wave is judged, since it's paid for either way, so samples_solved
+    / samples is the share of the drawn samples that solved the problem. An easy problem
+    costs one wave instead of k target calls.
+
+    Args:
+        target_call (callable): Returns (answer, cost) for one target sample
+        judge_call (callable): Takes an answer, returns (solved, cost, method) where
+            method is 'local' or 'llm'
+        samples (int): Most target samples to draw (k)
+        wave_size (int): Target samples drawn at once
+
+    Returns:
+        tuple: ({answer, solved, samples, samples_solved, judged_locally}, cost) where
+        samples counts the solutions that were judged, answer is a correct one if any
+        was, and cost covers every target and judge call
+
+    Raises:
+        Exception: The first target error, if no sample could be judged
+    """
+    judged, solved_count, judged_locally, cost = 0, 0, 0, 0.0
+    answer, errors = None, []
+
+    drawn = 0
+    with ThreadPoolExecutor(max_workers=min(wave_size, samples)) as executor:
+        while drawn < samples and not solved_count:
+            wave = min(wave_size, samples - drawn)
+            drawn += wave
+            futures = [executor.submit(in_worker_thread(target_call)) for _ in range(wave)]
+            for future in as_completed(futures):
+                try:
+                    sample_answer, target_cost = future.result()
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                cost += target_cost
+
+                solved, judge_cost, method = judge_call(sample_answer)
+                cost += judge_cost
+                judged += 1
+                judged_locally += method == 'local'
+                if not solved_count:
+                    # Keep the first correct answer once there is one
+                    answer = sample_answer
+                solved_count += bool(solved)
+
+    if not judged:
+        raise errors[0]
+    return {
+        'answer': answer,
+        'solved': solved_count > 0,
+        'samples': judged,
+        'samples_solved': solved_count,
+        'judged_locally': judged_locally
+    }, cost
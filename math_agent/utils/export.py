@@ -0,0 +1,308 @@
+import csv
+import json
+import zlib
+from datetime import datetime, time, timedelta
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from math_agent.models import Problem
+from .similarity_utils import similarity_map, LOOKUP_CHUNK
+
+EXPORT_CHUNK = LOOKUP_CHUNK  # Problems read per database round trip; one similarity lookup each
+COLUMNAR_CHUNK = 5000  # Problems per Arrow record batch / Parquet row group
+STREAM_BLOCK = 64 * 1024  # Characters of output collected before a block is sent
+CSV_HEADER = ['ID', 'Subject', 'Topic', 'Question', 'Answer', 'Hints', 'Status', 'Similar Problems']
+EXPORT_COLUMNS = ['id', 'batch_id', 'subject', 'topic', 'question', 'answer', 'hints', 'status', 'created_at']
+EXPORT_FORMATS = {
+    # format: (file extension, content type)
+    'csv': ('csv', 'text/csv; charset=utf-8'),
+    'jsonl': ('jsonl', 'application/x-ndjson'),
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'arrow': ('arrows', 'application/vnd.apache.arrow.stream')
+}
+COLUMNAR_FORMATS = ('parquet', 'arrow')
+EMBEDDING_DIMENSIONS = 1536  # text-embedding-3-small, used when no exported problem has an embedding
+
+
+def parse_export_filters(params):
+    """
+    Read export filters from query parameters.
+
+    Args:
+        params (QueryDict): batch_id, status, subject, topic, and since / until as an
+            ISO date or datetime (since inclusive, until exclusive)
+
+    Returns:
+        dict: Keyword arguments for filter_problems
+
+    Raises:
+        ValueError: For a batch id or date that can't be parsed
+    """
+    filters = {key: params.get(key) for key in ('batch_id', 'status', 'subject', 'topic') if params.get(key)}
+    if 'batch_id' in filters:
+        if not filters['batch_id'].isdigit():
+            raise ValueError(f"Invalid batch_id '{filters['batch_id']}'")
+        filters['batch_id'] = int(filters['batch_id'])
+    for key in ('since', 'until'):
+        value = params.get(key)
+        if not value:
+            continue
+        day = parse_date(value)
+        if day is not None:
+            # A bare date includes the whole day
+            moment = datetime.combine(day + timedelta(days=1) if key == 'until' else day, time.min)
+        else:
+            moment = parse_datetime(value)
+            if moment is None:
+                raise ValueError(f"Invalid {key} date '{value}'")
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        filters[key] = moment
+    return filters
+
+
+def filter_problems(batch_id=None, status=None, subject=None, topic=None, since=None, until=None):
+    """Problems to export; every filter is optional."""
+    problems = Problem.objects.all()
+    if batch_id:
+        problems = problems.filter(batch_id=batch_id)
+    if status:
+        problems = problems.filter(status=status)
+    if subject:
+        problems = problems.filter(subject=subject)
+    if topic:
+        problems = problems.filter(topic=topic)
+    if since:
+        problems = problems.filter(created_at__gte=since)
+    if until:
+        problems = problems.filter(created_at__lt=until)
+    return problems
+
+
+class Echo:
+    """File-like object handing back what is written to it, so csv.writer can feed a generator."""
+
+    def write(self, value):
+        return value
+
+
+def export_chunks(problems, chunk_size=EXPORT_CHUNK, embeddings=False):
+    """
+    Stream problems in lists of up to chunk_size dicts of the exported columns plus
+    'similar_problems' ({str(similar_id): score}), and 'problem_embedding' if asked for.
+
+    Only the exported columns are selected, and the similar problems of each chunk are
+    looked up together, so memory stays flat however many problems are exported.
+    """
+    columns = EXPORT_COLUMNS + ['problem_embedding'] if embeddings else EXPORT_COLUMNS
+    chunk = []
+    for row in problems.order_by('id').values(*columns).iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield _with_similarities(chunk)
+            chunk = []
+    if chunk:
+        yield _with_similarities(chunk)
+
+
+def export_rows(problems, chunk_size=EXPORT_CHUNK, embeddings=False):
+    """The rows of export_chunks one by one."""
+    for chunk in export_chunks(problems, chunk_size, embeddings):
+        yield from chunk
+
+
+def _with_similarities(chunk):
+    similarities = similarity_map(row['id'] for row in chunk)
+    for row in chunk:
+        row['similar_problems'] = similarities[row['id']]
+    return chunk
+
+
+def _hint_order(key):
+    return (0, int(key), '') if str(key).isdigit() else (1, 0, str(key))
+
+
+def export_record(row, embeddings=False):
+    """
+    A typed record of an exported row: hints as a list in hint order, similar
+    problems as a list of {'id', 'score'} edges, best first.
+    """
+    hints = row['hints'] or {}
+    record = {
+        'id': row['id'],
+        'batch_id': row['batch_id'],
+        'subject': row['subject'],
+        'topic': row['topic'],
+        'question': row['question'],
+        'answer': row['answer'],
+        'hints': [str(hints[key]) for key in sorted(hints, key=_hint_order)],
+        'status': row['status'],
+        'created_at': row['created_at'],
+        'similar': [
+            {'id': int(sim_id), 'score': score}
+            for sim_id, score in sorted(row['similar_problems'].items(), key=lambda edge: -edge[1])
+        ]
+    }
+    if embeddings:
+        record['embedding'] = row['problem_embedding']
+    return record
+
+
+def csv_lines(problems):
+    """Lines of the CSV export, header first, formatted the way the frontend shows hints and similar problems."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    for row in export_rows(problems):
+        hints_text = "; ".join(f"Hint {hint_key}: {hint_value}" for hint_key, hint_value in (row['hints'] or {}).items())
+        similar_text = "; ".join(f"ID {sim_id}: {sim_score:.3f}" for sim_id, sim_score in row['similar_problems'].items())
+        yield writer.writerow([
+            row['id'],
+            row['subject'],
+            row['topic'],
+            row['question'],
+            row['answer'],
+            hints_text,
+            row['status'],
+            similar_text
+        ])
+
+
+def jsonl_lines(problems, embeddings=False):
+    """One JSON object per problem, as built by export_record."""
+    for row in export_rows(problems, embeddings=embeddings):
+        record = export_record(row, embeddings)
+        record['created_at'] = record['created_at'].isoformat()
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def import_pyarrow():
+    """
+    pyarrow, an optional dependency only needed for Parquet and Arrow exports.
+
+    Raises:
+        ImportError: If it isn't installed
+    """
+    try:
+        import pyarrow
+        return pyarrow
+    except ImportError:
+        raise ImportError("Parquet and Arrow exports need pyarrow (pip install pyarrow)")
+
+
+def problem_schema(pa, embedding_dimensions=None):
+    """Arrow schema of export_record; with an embedding column of fixed-size float32 arrays if dimensions are given."""
+    fields = [
+        pa.field('id', pa.int64(), nullable=False),
+        pa.field('batch_id', pa.int64()),
+        pa.field('subject', pa.string()),
+        pa.field('topic', pa.string()),
+        pa.field('question', pa.string()),
+        pa.field('answer', pa.string()),
+        pa.field('hints', pa.list_(pa.string())),
+        pa.field('status', pa.string()),
+        pa.field('created_at', pa.timestamp('us', tz='UTC')),
+        pa.field('similar', pa.list_(pa.struct([('id', pa.int64()), ('score', pa.float32())])))
+    ]
+    if embedding_dimensions:
+        fields.append(pa.field('embedding', pa.list_(pa.float32(), embedding_dimensions)))
+    return pa.schema(fields)
+
+
+class StreamSink:
+    """Write-only file collecting what a pyarrow writer writes, handed out with take() as the export goes."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self):
+        return True
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def columnar_stream(problems, fmt, embeddings=False):
+    """
+    Stream problems as Parquet or as an Arrow IPC stream, one row group / record batch
+    per COLUMNAR_CHUNK problems.
+
+    Args:
+        problems (QuerySet): Problems to export
+        fmt (str): 'parquet' or 'arrow'
+        embeddings (bool): Add the embeddings as fixed-size float32 arrays
+
+    Returns:
+        generator: Bytes of the file
+
+    Raises:
+        ImportError: If pyarrow isn't installed, before anything is streamed
+    """
+    pa = import_pyarrow()
+    dimensions = None
+    if embeddings:
+        first = problems.exclude(problem_embedding=None).order_by('id').values_list('problem_embedding', flat=True).first()
+        dimensions = len(first) if first else EMBEDDING_DIMENSIONS
+    return _columnar_chunks(pa, problems, fmt, problem_schema(pa, dimensions), embeddings)
+
+
+def _columnar_chunks(pa, problems, fmt, schema, embeddings):
+    sink = StreamSink()
+    out = pa.PythonFile(sink, mode='w')
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(out, schema)
+    else:
+        writer = pa.ipc.new_stream(out, schema)
+
+    for chunk in export_chunks(problems, COLUMNAR_CHUNK, embeddings):
+        records = [export_record(row, embeddings) for row in chunk]
+        columns = {name: [record[name] for record in records] for name in schema.names}
+        writer.write_batch(pa.RecordBatch.from_pydict(columns, schema=schema))
+        yield sink.take()
+    writer.close()
+    yield sink.take()
+
+
+def text_stream(lines, block=STREAM_BLOCK):
+    """
+    Encode lines to UTF-8 in blocks of about `block` characters. The first line is
+    sent on its own so the download starts before the first query returns.
+    """
+    buffer, size = [], 0
+    for i, line in enumerate(lines):
+        buffer.append(line)
+        size += len(line)
+        if i == 0 or size >= block:
+            yield ''.join(buffer).encode('utf-8')
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def gzip_stream(chunks, level=6):
+    """Gzip a stream of byte chunks on the fly, flushing after the first one so it is sent right away."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for i, chunk in enumerate(chunks):
+        data = compressor.compress(chunk)
+        if i == 0:
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
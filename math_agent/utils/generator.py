@@ -1,10 +1,10 @@
 import json
 from django.conf import settings
-from .system_messages import GENERATOR_MESSAGE, GENERATOR_MCQ_MESSAGE
+from .system_messages import GENERATOR_MESSAGE, GENERATOR_MCQ_MESSAGE, GENERATOR_MULTI_SUFFIX, GENERATOR_NO_HINTS_SUFFIX
 from .call_llm_clients import call_llm
 from .similarity_utils import find_similar_problems
 
-def generate_problem(pipeline_config, taxonomy=None, mcq_mode=False):
+def generate_problem(pipeline_config, taxonomy=None, mcq_mode=False, with_hints=True):
     """
     Generate a math problem using the specified model.
     
@@ -12,6 +12,8 @@ def generate_problem(pipeline_config, taxonomy=None, mcq_mode=False):
         pipeline_config (dict): Configuration containing provider and model information
             Example: {"provider": "openai", "model": "o3-mini"}
         taxonomy (dict, optional): Dictionary containing subject and topic
+        with_hints (bool): Ask for hints too; otherwise hints is {} and they are
+            written later by the hinter
         
     Returns:
         tuple: (question, answer, hints, embedding, similar_problems, cost)
@@ -26,6 +28,8 @@ def generate_problem(pipeline_config, taxonomy=None, mcq_mode=False):
         
         # Choose system message based on MCQ mode
         system_message = GENERATOR_MCQ_MESSAGE if mcq_mode else GENERATOR_MESSAGE
+        if not with_hints:
+            system_message += GENERATOR_NO_HINTS_SUFFIX
         
         messages = [
             {"role": "system", "content": system_message},
@@ -33,14 +37,17 @@ def generate_problem(pipeline_config, taxonomy=None, mcq_mode=False):
         ]
         
         # Call the model using our centralized client
-        data, cost = call_llm(pipeline_config, messages)
+        data, cost = call_llm(pipeline_config, messages, role='generator')
         
         # Extract question, answer, and hints
         question = data.get('problem', '')
         answer = data.get('answer', '')
         hints = data.get('hints', {})
         
-        if not question or not answer or not hints:
+        if not with_hints:
+            hints = {}
+        
+        if not question or not answer or (with_hints and not hints):
             raise ValueError("Invalid response: missing problem, answer, or hints")
         
         # Similarity check
@@ -49,4 +56,60 @@ def generate_problem(pipeline_config, taxonomy=None, mcq_mode=False):
         return question, answer, hints, embedding, similar_problems, cost
         
     except Exception as e:
-        raise Exception(f"Error generating problem: {str(e)}") 
\ No newline at end of file
+        raise Exception(f"Error generating problem: {str(e)}")
+
+def generate_problems(pipeline_config, taxonomies, mcq_mode=False, with_hints=True):
+    """
+    Generate several math problems with a single model call, sharing one system prompt.
+    
+    Args:
+        pipeline_config (dict): Configuration containing provider and model information
+        taxonomies (list): One {'subject': ..., 'topic': ...} dict per problem wanted
+        mcq_mode (bool): Generate MCQ problems
+        with_hints (bool): Ask for hints too, as in generate_problem
+        
+    Returns:
+        list: (question, answer, hints, embedding, similar_problems, cost) tuples, in the
+        order of `taxonomies`; the call cost is split evenly between the problems. The
+        list is shorter than `taxonomies` if the model returned fewer usable problems.
+    """
+    try:
+        base_message = GENERATOR_MCQ_MESSAGE if mcq_mode else GENERATOR_MESSAGE
+        system_message = base_message + GENERATOR_MULTI_SUFFIX.format(count=len(taxonomies))
+        if not with_hints:
+            system_message += GENERATOR_NO_HINTS_SUFFIX
+        requested = "\n".join(
+            f"{i + 1}. {taxonomy.get('subject', '')} - topic '{taxonomy.get('topic', '')}'"
+            for i, taxonomy in enumerate(taxonomies)
+        )
+        user_prompt = f"Generate {len(taxonomies)} math problems, one for each of:\n{requested}"
+        
+        messages = [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": user_prompt}
+        ]
+        
+        data, cost = call_llm(pipeline_config, messages, role='generator')
+        
+        # Keep problems in order up to the first unusable one, so each stays matched to its topic
+        results = []
+        for item in (data.get('problems') or [])[:len(taxonomies)]:
+            question = item.get('problem', '')
+            answer = item.get('answer', '')
+            hints = item.get('hints', {}) if with_hints else {}
+            if not question or not answer or (with_hints and not hints):
+                break
+            results.append((question, answer, hints))
+        
+        if not results:
+            raise ValueError("Invalid response: no complete problems returned")
+        
+        cost_per_problem = cost / len(results)
+        generated = []
+        for question, answer, hints in results:
+            similar_problems, embedding = find_similar_problems(question)
+            generated.append((question, answer, hints, embedding, similar_problems, cost_per_problem))
+        return generated
+        
+    except Exception as e:
+        raise Exception(f"Error generating problems: {str(e)}")
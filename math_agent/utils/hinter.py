@@ -1,7 +1,17 @@
 import json
+import threading
+import time
 from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from math_agent.models import Batch, Problem
 from .system_messages import HINT_ONLY_MESSAGE
 from .call_llm_clients import call_llm
+from .checker import check_hints
+from .budget import BudgetExceeded, charge_to_batch
+
+HINT_MAX_TRIES = 3
+HINT_POLL_INTERVAL = 2  # Seconds the background hinter waits for new valid problems
 
 def dictify_hints(hints):
     """Convert list of hints to dictionary if needed."""
@@ -20,7 +30,9 @@ def generate_hints(question, answer, pipeline_config):
             Example: {"provider": "openai", "model": "o3-mini"}
         
     Returns:
-        dict: Dictionary of hints
+        tuple: (hints, cost)
+            - hints (dict): Dictionary of hints
+            - cost (float): Cost of all the calls made, including retries
     """
     try:
         # Prepare the input for the model
@@ -34,26 +46,120 @@ def generate_hints(question, answer, pipeline_config):
             {"role": "user", "content": json.dumps(input_data)}
         ]
         
-        retries = 0
-        while True:
-            retries += 1
+        total_cost = 0.0
+        last_error = "empty or malformed hints"
+        for retries in range(1, HINT_MAX_TRIES + 1):
             try:
-                result = call_llm(pipeline_config, messages)
-                hints = result.get("hints", {})
+                data, cost = call_llm(pipeline_config, messages, role='hinter')
+                total_cost += cost
+                hints = data.get("hints", {})
 
                 if isinstance(hints, list):  # sanitize if needed
                     hints = dictify_hints(hints)
 
                 print(f"\n🧾 Model response (attempt {retries}):", hints)
-                if isinstance(hints, dict) and any(h.strip() for h in hints.values()):
+                if isinstance(hints, dict) and any(str(h).strip() for h in hints.values()):
                     print(f"✅ Non-empty hint dict received on attempt {retries}")
-                    return hints
-                else:
-                    print(f"❌ Empty or malformed hints on attempt {retries}. Retrying...")
+                    return hints, total_cost
+                print(f"❌ Empty or malformed hints on attempt {retries}. Retrying...")
+            except BudgetExceeded:
+                raise
             except Exception as e:
+                last_error = str(e)
                 print(f"⚠️ Hint parsing failed (attempt {retries}): {e}")
-                if retries >= 3:  # Limit retries
-                    raise Exception(f"Failed to generate valid hints after {retries} attempts: {str(e)}")
         
+        raise Exception(f"Failed to generate valid hints after {HINT_MAX_TRIES} attempts: {last_error}")
+        
+    except BudgetExceeded:
+        raise
     except Exception as e:
-        raise Exception(f"Error generating hints: {str(e)}") 
\ No newline at end of file
+        raise Exception(f"Error generating hints: {str(e)}")
+
+def hint_problem(problem, pipeline_config, checker_config=None):
+    """
+    Write the deferred hints of a valid problem.
+
+    The problem is claimed by clearing hints_pending, so concurrent hinters never
+    both pay for the same problem; it is put back in the queue if hinting fails.
+    With a checker_config the hints go through the checker's hint validation, which
+    the problem skipped when it was checked without hints; hints the checker rejects
+    without correcting them count as a failure.
+
+    Returns:
+        bool: Whether this call wrote the hints
+    """
+    if not Problem.objects.filter(id=problem.id, hints_pending=True).update(hints_pending=False):
+        return False
+
+    try:
+        with charge_to_batch(problem.batch_id, problem_id=problem.id):
+            hints, cost = generate_hints(problem.question, problem.answer, pipeline_config)
+            if checker_config:
+                hints, check_cost = check_hints(problem.question, problem.answer, hints, checker_config)
+                cost += check_cost
+    except Exception:
+        Problem.objects.filter(id=problem.id).update(hints_pending=True)
+        raise
+
+    Problem.objects.filter(id=problem.id).update(hints=hints, cost=F('cost') + cost)
+    return True
+
+def fill_pending_hints(batch_id=None, limit=None):
+    """
+    Write hints for valid problems generated with deferred hints.
+
+    Args:
+        batch_id (int, optional): Only this batch's problems
+        limit (int, optional): Stop after this many problems
+
+    Returns:
+        dict: Counts of 'hinted' and 'failed' problems
+    """
+    counts = {'hinted': 0, 'failed': 0}
+    pending = Problem.objects.filter(status='valid', hints_pending=True).select_related('batch').order_by('id')
+    if batch_id is not None:
+        pending = pending.filter(batch_id=batch_id)
+
+    for problem in pending[:limit] if limit else pending:
+        pipeline = problem.batch.pipeline
+        try:
+            if hint_problem(problem, pipeline.get('hinter') or pipeline['generator'], pipeline.get('checker')):
+                counts['hinted'] += 1
+        except BudgetExceeded as e:
+            print(f"💸 {str(e)}. Leaving the remaining hints pending.")
+            counts['failed'] += 1
+            break
+        except Exception as e:
+            print(f"❌ Hints failed for problem {problem.id}: {str(e)}")
+            counts['failed'] += 1
+    return counts
+
+def start_hint_worker(batch_id):
+    """
+    Hint a batch's valid problems in the background as they are produced.
+
+    The thread keeps going after the batch finishes until every valid problem has its
+    hints, so hinting never holds up the batch itself.
+
+    Returns:
+        threading.Thread: The started daemon thread
+    """
+    def run():
+        try:
+            while True:
+                counts = fill_pending_hints(batch_id)
+                if counts['hinted']:
+                    print(f"🧾 Wrote hints for {counts['hinted']} problems of batch {batch_id}")
+                if counts['failed'] and not counts['hinted']:
+                    break  # Nothing is getting through; the rest can be retried with fill_hints
+                batch_running = Batch.objects.filter(id=batch_id, status='running').exists()
+                still_pending = Problem.objects.filter(batch_id=batch_id, status='valid', hints_pending=True).exists()
+                if not batch_running and not still_pending:
+                    break
+                time.sleep(HINT_POLL_INTERVAL)
+        finally:
+            connection.close()
+
+    worker = threading.Thread(target=run, name=f'hinter-{batch_id}', daemon=True)
+    worker.start()
+    return worker
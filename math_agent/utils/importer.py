@@ -0,0 +1,262 @@
+import csv
+import gzip
+import json
+import os
+import re
+import time
+from collections import Counter
+from itertools import islice
+import numpy as np
+from math_agent.models import Batch, Problem
+from .similarity_utils import fetch_embeddings, link_similar_problems, normalize, SIMILARITY_THRESHOLD
+from .hinter import dictify_hints
+from .batch_stats import count_outcomes
+from .profiling import db_block
+
+IMPORT_CHUNK = 1000  # Problems written per transaction; progress is recorded after each
+EMBED_BATCH = 256  # Questions embedded per request
+LOAD_CHUNK = 2000  # Stored embeddings read per database round trip when loading the index
+SCORE_BLOCK = 1 << 24  # Similarity scores computed at once (64 MB of float32)
+IMPORT_STATUSES = [status for status, _ in Problem.STATUS_CHOICES]
+HINT_PATTERN = re.compile(r'(?:^|; )Hint ([^:;]+): ')  # Hints as written by the CSV export
+
+
+class EmbeddingIndex:
+    """
+    Normalized float32 matrix of problem embeddings held in memory, so a chunk of
+    imported problems is compared to every stored problem with a few matrix products
+    instead of one Python comparison per pair.
+    """
+
+    def __init__(self, dimensions=None):
+        self.dimensions = dimensions
+        self.size = 0
+        self.ids = np.empty(0, dtype=np.int64)
+        self.matrix = np.empty((0, dimensions or 0), dtype=np.float32)
+
+    @classmethod
+    def load(cls, chunk_size=LOAD_CHUNK):
+        """Index of every stored problem that has an embedding."""
+        index = cls()
+        embeddings = Problem.objects.exclude(problem_embedding=None).order_by().values_list('id', 'problem_embedding')
+        ids, vectors = [], []
+        for problem_id, embedding in embeddings.iterator(chunk_size=chunk_size):
+            ids.append(problem_id)
+            vectors.append(embedding)
+            if len(ids) >= chunk_size:
+                index.add(ids, normalize(np.array(vectors, dtype=np.float32)))
+                ids, vectors = [], []
+        if ids:
+            index.add(ids, normalize(np.array(vectors, dtype=np.float32)))
+        return index
+
+    def add(self, ids, vectors):
+        """Add normalized vectors, growing the matrix by doubling so adding chunk by chunk stays cheap."""
+        if self.dimensions is None:
+            self.dimensions = vectors.shape[1]
+            self.matrix = np.empty((0, self.dimensions), dtype=np.float32)
+        if vectors.shape[1] != self.dimensions:
+            raise ValueError(f"Embeddings have {vectors.shape[1]} dimensions, the stored ones {self.dimensions}")
+        needed = self.size + len(ids)
+        if needed > len(self.ids):
+            capacity = max(needed, 2 * len(self.ids))
+            matrix = np.empty((capacity, self.dimensions), dtype=np.float32)
+            matrix[:self.size] = self.matrix[:self.size]
+            self.matrix = matrix
+            self.ids = np.resize(self.ids, capacity)
+        self.matrix[self.size:needed] = vectors
+        self.ids[self.size:needed] = ids
+        self.size = needed
+
+    def search(self, vectors, threshold=SIMILARITY_THRESHOLD):
+        """
+        Returns:
+            list: For each normalized vector, {problem_id: similarity_score} of the indexed
+            problems at or above threshold
+        """
+        matches = [{} for _ in range(len(vectors))]
+        if not self.size:
+            return matches
+        if vectors.shape[1] != self.dimensions:
+            raise ValueError(f"Embeddings have {vectors.shape[1]} dimensions, the stored ones {self.dimensions}")
+        step = max(1, SCORE_BLOCK // self.size)
+        for start in range(0, len(vectors), step):
+            scores = vectors[start:start + step] @ self.matrix[:self.size].T
+            for row, col in zip(*np.nonzero(scores >= threshold)):
+                matches[start + row][int(self.ids[col])] = float(scores[row, col])
+        return matches
+
+
+def read_records(path):
+    """
+    Stream the records of a JSONL or CSV file, optionally gzipped, as dicts. CSV
+    column names are matched case-insensitively, so the CSV export reads back.
+    """
+    name = path[:-3] if path.endswith('.gz') else path
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8', newline='') as f:
+        if name.endswith('.csv'):
+            csv.field_size_limit(1 << 30)
+            for row in csv.DictReader(f):
+                yield {key.strip().lower().replace(' ', '_'): value for key, value in row.items() if key}
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def check_import_file(path):
+    """
+    Raises:
+        ValueError: If the file isn't a .jsonl, .ndjson or .csv file (optionally .gz) that exists
+    """
+    name = path[:-3] if path.endswith('.gz') else path
+    if not name.endswith(('.jsonl', '.ndjson', '.csv')):
+        raise ValueError(f"Unsupported file type: {path} (use .jsonl, .ndjson or .csv, optionally gzipped)")
+    if not os.path.isfile(path):
+        raise ValueError(f"File not found: {path}")
+
+
+def parse_hints(value):
+    """Hints as stored on Problem, from a list, a dict, JSON text or the CSV export's "Hint k: ..." text."""
+    if isinstance(value, str):
+        text = value.strip()
+        if text.startswith(('[', '{')):
+            value = json.loads(text)
+        elif HINT_PATTERN.match(text):
+            parts = HINT_PATTERN.split(text)[1:]
+            return {key: hint for key, hint in zip(parts[::2], parts[1::2])}
+        else:
+            return {'0': text} if text else {}
+    return dictify_hints(value) if value else {}
+
+
+def problem_from_record(record, batch):
+    """
+    Unsaved Problem for an imported record.
+
+    Returns:
+        Problem: Or None for a record without question or answer, or with an unknown status
+    """
+    question = str(record.get('question') or '').strip()
+    answer = str(record.get('answer') or '').strip()
+    status = record.get('status') or 'valid'
+    if not question or not answer or status not in IMPORT_STATUSES:
+        return None
+    embedding = record.get('embedding') or record.get('problem_embedding')
+    if isinstance(embedding, str):
+        embedding = json.loads(embedding) if embedding.strip() else None
+    return Problem(
+        subject=str(record.get('subject') or '')[:100],
+        topic=str(record.get('topic') or '')[:100],
+        question=question,
+        answer=answer,
+        hints=parse_hints(record.get('hints')),
+        status=status,
+        batch=batch,
+        problem_embedding=embedding or None
+    )
+
+
+def import_batch(name, batch_id=None):
+    """
+    The batch imported problems go to: an existing one (to resume an import into it) or
+    a new one. Import batches are created completed so the pipeline never resumes them.
+    """
+    if batch_id is not None:
+        return Batch.objects.get(id=batch_id)
+    return Batch.objects.create(
+        name=name,
+        taxonomy_json={},
+        pipeline={},
+        number_of_valid_needed=1,
+        status='completed',
+        options={'import': {'files': {}}}
+    )
+
+
+def import_problems(paths, batch, chunk_size=IMPORT_CHUNK, embed_batch=EMBED_BATCH, threshold=SIMILARITY_THRESHOLD, link=True, log=print):
+    """
+    Import problems from JSONL/CSV files into a batch, chunk by chunk.
+
+    Each chunk's questions without an embedding are embedded in requests of embed_batch,
+    compared to every stored and already imported problem through an in-memory
+    EmbeddingIndex, and written in one transaction with bulk_create, together with
+    their similarity links, the batch's counters and the import progress. An interrupted
+    import run again into the same batch skips the rows already written.
+
+    Args:
+        paths (list): Files to import
+        batch (Batch): Batch from import_batch
+        chunk_size (int): Problems per transaction
+        embed_batch (int): Questions per embedding request
+        threshold (float): Similarity threshold for linking problems
+        link (bool): Compare the problems and link the similar ones
+
+    Returns:
+        dict: Rows 'imported' and 'skipped' (invalid) in this run
+    """
+    for path in paths:
+        check_import_file(path)
+    index = EmbeddingIndex.load() if link else None
+    if index is not None:
+        log(f"🧮 Loaded {index.size} stored embeddings")
+
+    progress = batch.options.setdefault('import', {}).setdefault('files', {})
+    totals = Counter()
+    for path in paths:
+        # Files are told apart by their resolved path, so a/bank.jsonl and b/bank.jsonl keep separate offsets
+        key = os.path.realpath(path)
+        done = progress.get(key, 0)
+        if done:
+            log(f"⏩ {key}: resuming after row {done}")
+        started = time.perf_counter()
+        imported = 0
+        records = islice(read_records(path), done, None)
+        while True:
+            rows = list(islice(records, chunk_size))
+            if not rows:
+                break
+            problems = [problem for problem in (problem_from_record(record, batch) for record in rows) if problem]
+            _import_chunk(problems, batch, index, threshold, embed_batch, progress, key, done + len(rows))
+            done += len(rows)
+            imported += len(problems)
+            totals['imported'] += len(problems)
+            totals['skipped'] += len(rows) - len(problems)
+            rate = imported / max(time.perf_counter() - started, 1e-9)
+            log(f"   📦 {key}: {done} rows done, {imported} problems imported this run ({rate:.0f}/s)")
+        log(f"✅ {key}: {done} rows")
+    return dict(totals)
+
+
+def _import_chunk(problems, batch, index, threshold, embed_batch, progress, key, done):
+    missing = [problem for problem in problems if problem.problem_embedding is None]
+    for start in range(0, len(missing), embed_batch):
+        group = missing[start:start + embed_batch]
+        for problem, embedding in zip(group, fetch_embeddings([problem.question for problem in group])):
+            problem.problem_embedding = embedding
+
+    vectors = None
+    if index is not None and problems:
+        vectors = normalize(np.array([problem.problem_embedding for problem in problems], dtype=np.float32))
+        for problem, matches in zip(problems, index.search(vectors, threshold)):
+            problem.similar_problems = {str(sim_id): score for sim_id, score in matches.items()}
+
+    progress[key] = done
+    with db_block('import_problems'):
+        Problem.objects.bulk_create(problems)
+        if vectors is not None:
+            # Near-duplicates within the chunk link the later problem to the earlier one
+            within = vectors @ vectors.T
+            updated = set()
+            for i, j in zip(*np.nonzero(np.tril(within, -1) >= threshold)):
+                problems[i].similar_problems[str(problems[j].id)] = float(within[i, j])
+                updated.add(i)
+            if updated:
+                Problem.objects.bulk_update([problems[i] for i in updated], ['similar_problems'])
+            link_similar_problems(problems)
+        count_outcomes(batch.id, Counter(problem.status for problem in problems))
+        batch.save(update_fields=['options', 'updated_at'])
+
+    if vectors is not None:
+        index.add([problem.id for problem in problems], vectors)
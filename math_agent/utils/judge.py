@@ -35,7 +35,7 @@ def judge_solution(target_solution, true_answer, pipeline_config, mcq_mode=False
             {"role": "user", "content": json.dumps(input_data)}
         ]
         
-        data, cost = call_llm(pipeline_config, messages)
+        data, cost = call_llm(pipeline_config, messages, role='judge')
         
         # Extract validation result
         is_valid = data.get('valid', False)
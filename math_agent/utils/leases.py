@@ -0,0 +1,194 @@
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from math_agent.models import Attempt, Batch
+from .profiling import db_block
+
+LEASE_SECONDS = 60  # A claimed attempt is re-issued if its lease isn't renewed within this time
+RENEW_INTERVAL = LEASE_SECONDS / 3
+CLAIM_CANDIDATES = 10  # Rows tried per compare-and-set claim round on databases without SKIP LOCKED
+
+
+def worker_name(worker_id):
+    """Name identifying a worker thread across every node working on the database."""
+    return f"{socket.gethostname()}:{os.getpid()}:{worker_id}"
+
+
+def claimable_attempts(batch_id=None, without_stage=None):
+    """Pending attempts, plus running attempts whose worker stopped renewing its lease."""
+    attempts = Attempt.objects.filter(batch__status='running').filter(
+        Q(status='pending') | Q(status='running', lease_expires_at__lt=timezone.now())
+    )
+    if batch_id is not None:
+        attempts = attempts.filter(batch_id=batch_id)
+    if without_stage is not None:
+        attempts = attempts.exclude(stages__stage=without_stage)
+    return attempts.order_by('id')
+
+
+def claim_attempt(owner, batch_id=None, lease_seconds=LEASE_SECONDS, without_stage=None):
+    """
+    Atomically claim the next available attempt for a worker.
+
+    Uses SELECT ... FOR UPDATE SKIP LOCKED where the database supports it (PostgreSQL),
+    and a compare-and-set on lease_version otherwise (SQLite).
+
+    Args:
+        owner (str): Worker name, see worker_name()
+        batch_id (int, optional): Only claim attempts from this batch
+        lease_seconds (int): How long the lease lasts without renewal
+        without_stage (str, optional): Skip attempts that already have this stage persisted
+
+    Returns:
+        Attempt or None: The claimed attempt, or None if nothing is available
+    """
+    if connection.features.has_select_for_update_skip_locked:
+        with db_block('claim'):
+            attempt = claimable_attempts(batch_id, without_stage).select_for_update(skip_locked=True, of=('self',)).first()
+            if attempt is None:
+                return None
+            attempt.status = 'running'
+            attempt.lease_owner = owner
+            attempt.lease_expires_at = timezone.now() + timedelta(seconds=lease_seconds)
+            attempt.lease_version += 1
+            attempt.save(update_fields=['status', 'lease_owner', 'lease_expires_at', 'lease_version', 'updated_at'])
+        lease_keeper.hold(attempt.id, owner)
+        return attempt
+
+    with db_block('claim', atomic=False):
+        candidates = claimable_attempts(batch_id, without_stage).values_list('id', 'lease_version')[:CLAIM_CANDIDATES]
+        for attempt_id, version in candidates:
+            # Cancelling or releasing an attempt doesn't bump lease_version, so the update
+            # checks again that the attempt is still claimable, not only unchanged
+            claimed = claimable_attempts(batch_id, without_stage).filter(id=attempt_id, lease_version=version).update(
+                status='running',
+                lease_owner=owner,
+                lease_expires_at=timezone.now() + timedelta(seconds=lease_seconds),
+                lease_version=F('lease_version') + 1,
+                updated_at=timezone.now()
+            )
+            if claimed:
+                lease_keeper.hold(attempt_id, owner)
+                return Attempt.objects.get(id=attempt_id)
+    return None
+
+
+def owns_attempt(attempt, owner):
+    """Whether the worker still holds a live lease on a running attempt."""
+    return Attempt.objects.filter(id=attempt.id, lease_owner=owner, status='running').exists()
+
+
+def finish_attempt(attempt, owner, status, **fields):
+    """
+    Move an attempt out of 'running' if the worker still holds its lease.
+
+    The lease keeps being renewed until the transaction this runs in commits, so a
+    rolled back write (e.g. of the result writer) never leaves the lease to expire.
+
+    Returns:
+        bool: False if the lease was lost or the attempt was cancelled meanwhile
+    """
+    transaction.on_commit(lambda: lease_keeper.release(attempt.id))
+    updated = Attempt.objects.filter(id=attempt.id, lease_owner=owner, status='running').update(
+        status=status,
+        lease_owner=None,
+        lease_expires_at=None,
+        updated_at=timezone.now(),
+        **fields
+    )
+    return bool(updated)
+
+
+def release_attempt(attempt, owner):
+    """Hand a claimed attempt back to the queue so any worker can pick it up."""
+    lease_keeper.release(attempt.id)
+    Attempt.objects.filter(id=attempt.id, lease_owner=owner, status='running').update(
+        status='pending',
+        lease_owner=None,
+        lease_expires_at=None,
+        updated_at=timezone.now()
+    )
+
+
+def claim_batch(batch_id, owner, lease_seconds=LEASE_SECONDS):
+    """
+    Atomically become the coordinator of a batch, the one process that dispatches its
+    attempts and decides when it stops; workers on any node still claim its attempts.
+
+    Returns:
+        bool: False if another coordinator holds a live lease on the batch
+    """
+    now = timezone.now()
+    return bool(
+        Batch.objects.filter(id=batch_id)
+        .filter(Q(coordinator__isnull=True) | Q(coordinator_expires_at__lt=now))
+        .update(coordinator=owner, coordinator_expires_at=now + timedelta(seconds=lease_seconds))
+    )
+
+
+def renew_batch(batch_id, owner, lease_seconds=LEASE_SECONDS):
+    """
+    Extend the coordinator lease of a batch.
+
+    Returns:
+        bool: False if the lease expired and another coordinator took the batch over
+    """
+    return bool(Batch.objects.filter(id=batch_id, coordinator=owner).update(
+        coordinator_expires_at=timezone.now() + timedelta(seconds=lease_seconds)
+    ))
+
+
+def release_batch(batch_id, owner):
+    """Give up the coordinator lease of a batch, if still held."""
+    Batch.objects.filter(id=batch_id, coordinator=owner).update(coordinator=None, coordinator_expires_at=None)
+
+
+class LeaseKeeper:
+    """Background thread renewing the leases held by this process's workers."""
+
+    def __init__(self, lease_seconds=LEASE_SECONDS, interval=RENEW_INTERVAL):
+        self.lease_seconds = lease_seconds
+        self.interval = interval
+        self._held = {}  # attempt_id -> owner
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def hold(self, attempt_id, owner):
+        with self._lock:
+            self._held[attempt_id] = owner
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='lease-keeper', daemon=True)
+                self._thread.start()
+
+    def release(self, attempt_id):
+        with self._lock:
+            self._held.pop(attempt_id, None)
+
+    def renew(self):
+        """Extend every held lease; leases taken over by another worker are dropped."""
+        with self._lock:
+            held = dict(self._held)
+
+        by_owner = {}
+        for attempt_id, owner in held.items():
+            by_owner.setdefault(owner, []).append(attempt_id)
+
+        expires_at = timezone.now() + timedelta(seconds=self.lease_seconds)
+        for owner, attempt_ids in by_owner.items():
+            Attempt.objects.filter(id__in=attempt_ids, lease_owner=owner, status='running').update(lease_expires_at=expires_at)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.renew()
+            except Exception as e:
+                print(f"⚠️ Lease renewal failed: {str(e)}")
+
+
+lease_keeper = LeaseKeeper()
@@ -0,0 +1,206 @@
+import re
+from fractions import Fraction
+from .judge import judge_solution
+
+MCQ_LETTERS = 'ABCD'
+NUMERIC_TOLERANCE = 1e-9  # Relative difference treated as the same number
+NUMERIC_MISMATCH = 1e-2  # Relative difference beyond which the answers are clearly different
+
+# LaTeX wrappers and spacing that don't change an answer's value
+LATEX_NOISE = [r'\left', r'\right', r'\displaystyle', r'\!', r'\,', r'\;', r'\:', r'\quad', '$']
+LATEX_ALIASES = {r'\dfrac': r'\frac', r'\tfrac': r'\frac', r'\cdot': '*', r'\times': '*'}
+
+NUMBER_PATTERN = re.compile(r'^[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$')
+FRACTION_PATTERN = re.compile(r'^([-+]?)\\frac\{([^{}]+)\}\{([^{}]+)\}$')
+# An option marker, "A." / "A)" / "(A)", at the start of a line or after a space, so choices
+# written on one line ("(A) 6 (B) 8 ...") are found as well as one per line
+CHOICE_PATTERN = re.compile(r'(?:^|(?<=\s))(?:\(([A-D])\)|([A-D])[.)])\s*', re.MULTILINE)
+# Normalized answers that stand for a missing or undefined value rather than an answer
+NON_ANSWERS = {'nan', '+nan', '-nan', 'none', 'null'}
+# A normalized answer given as a variable's value, e.g. "x=5"
+ASSIGNMENT_PATTERN = re.compile(r'^([A-Za-z]\w*)=(.+)$')
+
+
+def normalize_answer(text):
+    """
+    Reduce an answer to a canonical string: strips LaTeX delimiters and spacing,
+    \\boxed{...} and trailing periods. An "x =" prefix is kept, see split_assignment.
+    """
+    text = str(text).strip()
+    boxed = re.search(r'\\boxed\{(.*)\}', text)
+    if boxed:
+        text = boxed.group(1)
+    for delimiter in [r'\(', r'\)', r'\[', r'\]']:
+        text = text.replace(delimiter, '')
+    for noise in LATEX_NOISE:
+        text = text.replace(noise, '')
+    for alias, canonical in LATEX_ALIASES.items():
+        text = text.replace(alias, canonical)
+    text = re.sub(r'\s+', '', text)
+    text = text.rstrip('.')
+    return text
+
+
+def split_assignment(text):
+    """
+    Split a normalized answer like "x=5" into the variable and its value.
+
+    Returns:
+        tuple: (name, value), with name None if the answer isn't an assignment
+    """
+    match = ASSIGNMENT_PATTERN.match(text)
+    if match:
+        return match.group(1), match.group(2)
+    return None, text
+
+
+def parse_number(text):
+    """
+    Parse a normalized answer as an exact number (integer, decimal, a/b or \\frac{a}{b}).
+
+    Returns:
+        Fraction or None
+    """
+    text = text.replace(',', '') if re.fullmatch(r'[-+]?\d{1,3}(,\d{3})+(\.\d+)?', text) else text
+    try:
+        if NUMBER_PATTERN.match(text):
+            return Fraction(text)
+        fraction = FRACTION_PATTERN.match(text)
+        if fraction:
+            sign, numerator, denominator = fraction.groups()
+            value = Fraction(parse_number(numerator)) / Fraction(parse_number(denominator))
+            return -value if sign == '-' else value
+        if text.count('/') == 1:
+            numerator, denominator = text.split('/')
+            return parse_number(numerator) / parse_number(denominator)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    return None
+
+
+def compare_numbers(a, b):
+    """True if equal, False if clearly different, None if close enough that rounding could explain it."""
+    if a == b:
+        return True
+    scale = max(abs(a), abs(b))
+    difference = float(abs(a - b) / scale)
+    if difference <= NUMERIC_TOLERANCE:
+        return True
+    if difference >= NUMERIC_MISMATCH:
+        return False
+    return None
+
+
+def parse_choices(problem_text):
+    """
+    Read the options of an MCQ problem, one per line or several on a line.
+
+    The last run of markers going A, B, C... in order is taken as the choices, so
+    a stray "A." earlier in the problem isn't mistaken for an option.
+
+    Returns:
+        dict: {letter: option text}
+    """
+    markers = [
+        (match.start(), match.end(), match.group(1) or match.group(2))
+        for match in CHOICE_PATTERN.finditer(problem_text or '')
+    ]
+    chain = []
+    for i, (_, _, letter) in enumerate(markers):
+        if letter != 'A':
+            continue
+        run = [markers[i]]
+        for marker in markers[i + 1:]:
+            if marker[2] != MCQ_LETTERS[len(run)]:
+                break
+            run.append(marker)
+            if len(run) == len(MCQ_LETTERS):
+                break
+        if len(run) >= 2:
+            chain = run
+
+    choices = {}
+    for i, (_, end, letter) in enumerate(chain):
+        if i + 1 < len(chain):
+            text = problem_text[end:chain[i + 1][0]]
+        else:
+            text = problem_text[end:].split('\n')[0]
+            text = re.split(r'\s+GTFA\s*:', text)[0]
+        choices[letter] = text.strip().rstrip(',;').strip()
+    return choices
+
+
+def mcq_verdict(target_answer, true_answer, problem_text=""):
+    """
+    Decide an MCQ answer from its option letter.
+
+    A bare letter ("B", "(B)", "B.") is decided directly. A letter followed by a value
+    ("B. 23") is only decided if the value matches that option in the problem text,
+    since the LLM judge would otherwise weigh the value too.
+
+    Returns:
+        bool or None: None when the answer has no clear option letter
+    """
+    true_letter = str(true_answer).strip().strip('().').upper()
+    if len(true_letter) != 1 or true_letter not in MCQ_LETTERS:
+        return None
+
+    answer = str(target_answer).strip()
+    answer = re.sub(r'^(the\s+)?(final\s+)?(answer|option|choice)\s*(is)?\s*:?\s*', '', answer, flags=re.IGNORECASE)
+    match = re.match(r'^\(?([A-Da-d])\)?(?:[.):]\s*(.*))?$', answer, flags=re.DOTALL)
+    if not match:
+        return None
+    letter, value = match.group(1).upper(), (match.group(2) or '').strip()
+
+    if value:
+        choices = parse_choices(problem_text)
+        if letter not in choices or normalize_answer(choices[letter]) != normalize_answer(value):
+            return None
+    return letter == true_letter
+
+
+def local_verdict(target_answer, true_answer, mcq_mode=False, problem_text=""):
+    """
+    Judge obvious cases without calling a model.
+
+    Args:
+        target_answer (str): The target model's answer
+        true_answer (str): The correct answer that passed the checker
+        mcq_mode (bool): Whether the problem is an MCQ
+        problem_text (str): The problem, used to read MCQ choices
+
+    Returns:
+        bool or None: Whether the target solved the problem, or None if unsure
+    """
+    if mcq_mode:
+        return mcq_verdict(target_answer, true_answer, problem_text)
+
+    target_name, target = split_assignment(normalize_answer(target_answer))
+    truth_name, truth = split_assignment(normalize_answer(true_answer))
+    if target_name != truth_name:
+        # "y = 5" for "x = 5", or a variable named on one side only, may answer the wrong unknown
+        return None
+    if not target or not truth or target.lower() in NON_ANSWERS or truth.lower() in NON_ANSWERS:
+        return None
+    if target == truth:
+        return True
+
+    target_number, true_number = parse_number(target), parse_number(truth)
+    if target_number is not None and true_number is not None:
+        return compare_numbers(target_number, true_number)
+    return None
+
+
+def judge_answer(target_answer, true_answer, pipeline_config, mcq_mode=False, problem_text="", use_local=True):
+    """
+    Judge a target answer locally when the verdict is obvious, escalating to the judge model otherwise.
+
+    Returns:
+        tuple: (solved, cost, method) where method is 'local' or 'llm'
+    """
+    if use_local:
+        verdict = local_verdict(target_answer, true_answer, mcq_mode, problem_text)
+        if verdict is not None:
+            return verdict, 0.0, 'local'
+    solved, cost = judge_solution(target_answer, true_answer, pipeline_config, mcq_mode, problem_text)
+    return solved, cost, 'llm'
@@ -0,0 +1,293 @@
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300]
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = [
+        (name, str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"'))
+        for name, value in pairs
+    ]
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+class Metric:
+    """Base of the registry's metrics: a value per combination of label values."""
+
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """(suffix, label values, extra labels, value) tuples for the exposition."""
+        with self._lock:
+            return [('', key, (), value) for key, value in sorted(self._values.items())]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labelnames, key, extra)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    """Monotonically increasing count, e.g. LLM calls made."""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """
+    Value that goes up and down, e.g. attempts in flight.
+
+    A gauge created with `collect` is read when scraped instead: collect() returns
+    {label values tuple: value}, so values that live in the database cost nothing
+    until someone asks for them.
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), collect=None):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        if self.collect is None:
+            return super().samples()
+        values = self.collect()
+        return [('', tuple(str(v) for v in key), (), value) for key, value in sorted(values.items())]
+
+
+class Histogram(Metric):
+    """Distribution of observed values (cumulative buckets, sum and count), e.g. call latency."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = sorted(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0}
+            series['counts'][index] += 1
+            series['sum'] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe how long the block takes, in seconds."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def totals(self, **labels):
+        """
+        Count and sum of the observations whose labels match the given ones.
+
+        Returns:
+            tuple: (count, sum) over every series matching `labels` (all series if none given)
+        """
+        wanted = {self.labelnames.index(name): str(value) for name, value in labels.items()}
+        count, total = 0, 0.0
+        with self._lock:
+            for key, series in self._values.items():
+                if all(key[index] == value for index, value in wanted.items()):
+                    count += sum(series['counts'])
+                    total += series['sum']
+        return count, total
+
+    def samples(self):
+        with self._lock:
+            series = [(key, list(value['counts']), value['sum']) for key, value in sorted(self._values.items())]
+
+        samples = []
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + [math.inf], counts):
+                cumulative += count
+                samples.append(('_bucket', key, [('le', _format_value(bound))], cumulative))
+            samples.append(('_sum', key, (), total))
+            samples.append(('_count', key, (), cumulative))
+        return samples
+
+
+class Registry:
+    """The metrics of this process, rendered in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), collect=None):
+        return self.register(Gauge(name, documentation, labelnames, collect))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """
+        Render every metric for a Prometheus scrape.
+
+        A metric whose collection fails is skipped with a comment, so one broken
+        gauge never hides the others.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                lines.append(f"# {metric.name} unavailable: {str(e)}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def _attempts_by_status():
+    from math_agent.models import Attempt
+    from django.db.models import Count
+    rows = Attempt.objects.filter(batch__status='running').values('status').annotate(total=Count('id'))
+    return {(row['status'],): row['total'] for row in rows}
+
+
+# LLM calls (call_llm_clients.py)
+llm_calls = registry.counter(
+    'math_agent_llm_calls_total', 'LLM calls by provider, model, pipeline role and result.',
+    ['provider', 'model', 'role', 'result']
+)
+llm_call_seconds = registry.histogram(
+    'math_agent_llm_call_duration_seconds', 'Latency of LLM calls.', ['provider', 'model', 'role']
+)
+llm_tokens = registry.counter(
+    'math_agent_llm_tokens_total', 'Tokens sent to and received from LLMs.', ['provider', 'model', 'direction']
+)
+llm_cost = registry.counter(
+    'math_agent_llm_cost_dollars_total', 'Money spent on LLM calls.', ['provider', 'model']
+)
+budget_refusals = registry.counter(
+    'math_agent_budget_refusals_total', 'LLM calls refused because the batch budget was exhausted.'
+)
+
+# Similarity search (similarity_utils.py)
+embedding_requests = registry.counter(
+    'math_agent_embedding_requests_total', 'Embedding requests by provider and result.', ['provider', 'result']
+)
+embedding_seconds = registry.histogram(
+    'math_agent_embedding_duration_seconds', 'Latency of embedding requests.', ['provider']
+)
+similarity_seconds = registry.histogram(
+    'math_agent_similarity_search_duration_seconds', 'Time spent comparing a new problem with stored problems, excluding the embedding request.'
+)
+similarity_comparisons = registry.counter(
+    'math_agent_similarity_comparisons_total', 'Stored problems compared against new problems.'
+)
+
+# Attempt queue (leases.py, batch_runner.py)
+attempt_claims = registry.counter(
+    'math_agent_attempt_claims_total', 'Claim rounds by workers: claimed, empty (nothing to claim) or error.', ['result']
+)
+attempts_in_flight = registry.gauge(
+    'math_agent_attempts_in_flight', 'Attempts being processed by the workers of this process.'
+)
+attempts_finished = registry.counter(
+    'math_agent_attempts_finished_total', 'Attempts processed by this process, by outcome.', ['outcome']
+)
+attempt_seconds = registry.histogram(
+    'math_agent_attempt_duration_seconds', 'Time from claiming an attempt to finishing it.', ['outcome']
+)
+attempt_queue = registry.gauge(
+    'math_agent_attempts', 'Attempts of running batches by status (pending is the queue depth), across all nodes.',
+    ['status'], collect=_attempts_by_status
+)
+
+def _result_writer_pending():
+    from math_agent.utils.result_writer import result_writer
+    return {(): result_writer.pending()}
+
+
+# Database writes (batch_runner.py, result_writer.py)
+result_writer_queue = registry.gauge(
+    'math_agent_result_writer_queue', 'Finished attempts and LLM call records waiting for the result writer.',
+    collect=_result_writer_pending
+)
+db_write_seconds = registry.histogram(
+    'math_agent_db_write_duration_seconds', 'Latency of pipeline database writes.', ['operation']
+)
+db_write_errors = registry.counter(
+    'math_agent_db_write_errors_total', 'Failed pipeline database writes.', ['operation']
+)
+
+
+@contextmanager
+def timed_write(operation):
+    """Time a database write into db_write_seconds, counting it in db_write_errors if it raises."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        db_write_errors.inc(operation=operation)
+        raise
+    finally:
+        db_write_seconds.observe(time.perf_counter() - started, operation=operation)
@@ -0,0 +1,107 @@
+import base64
+import json
+from datetime import datetime
+from django.conf import settings
+from django.db.models import Q
+
+PAGE_SIZE = getattr(settings, 'PROBLEMS_PAGE_SIZE', 50)
+MAX_PAGE_SIZE = 500
+
+
+class InvalidCursor(ValueError):
+    """Raised for a page cursor that wasn't produced by encode_cursor."""
+
+
+def encode_key(*values):
+    """Opaque URL-safe cursor holding a sort key's values."""
+    raw = json.dumps(list(values))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_key(cursor, *types):
+    """
+    Returns:
+        tuple: The values of a cursor from encode_key, converted with types
+
+    Raises:
+        InvalidCursor: If the cursor can't be decoded
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if len(values) != len(types):
+            raise ValueError(f"expected {len(types)} values")
+        return tuple(convert(value) for convert, value in zip(types, values))
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f"Invalid page cursor: {str(e)}")
+
+
+def encode_cursor(obj):
+    """Opaque cursor pointing at an object's (created_at, id) position."""
+    return encode_key(obj.created_at.isoformat(), obj.id)
+
+
+def decode_cursor(cursor):
+    """
+    Returns:
+        tuple: (created_at, id) the cursor points at
+    """
+    return decode_key(cursor, datetime.fromisoformat, int)
+
+
+class KeysetPage:
+    """A page of objects, with cursors to the pages before and after it (None at either end)."""
+
+    def __init__(self, items, next_cursor=None, previous_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+def keyset_page(queryset, after=None, before=None, page_size=PAGE_SIZE):
+    """
+    One page of a queryset, newest first, located by a (created_at, id) cursor instead
+    of an OFFSET, so every page costs the same however deep it is.
+
+    Args:
+        queryset (QuerySet): Objects with created_at and id; its ordering is replaced
+        after (str, optional): Cursor of the last object of the previous page (next page)
+        before (str, optional): Cursor of the first object of the following page (previous page)
+        page_size (int): Objects per page
+
+    Returns:
+        KeysetPage: The page
+
+    Raises:
+        InvalidCursor: If a cursor can't be decoded
+    """
+    if before:
+        created_at, obj_id = decode_cursor(before)
+        rows = list(
+            queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=obj_id))
+            .order_by('created_at', 'id')[:page_size + 1]
+        )
+        if len(rows) <= page_size:
+            # Back at the newest objects: show a full first page
+            return keyset_page(queryset, page_size=page_size)
+        items = rows[:page_size][::-1]
+        return KeysetPage(items, next_cursor=encode_cursor(items[-1]), previous_cursor=encode_cursor(items[0]))
+
+    if after:
+        created_at, obj_id = decode_cursor(after)
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=obj_id))
+    rows = list(queryset.order_by('-created_at', '-id')[:page_size + 1])
+    items = rows[:page_size]
+    return KeysetPage(
+        items,
+        next_cursor=encode_cursor(items[-1]) if len(rows) > page_size else None,
+        previous_cursor=encode_cursor(items[0]) if after and items else None
+    )
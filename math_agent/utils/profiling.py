@@ -0,0 +1,321 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from math_agent.models import Batch, Attempt, LLMCall
+
+SAMPLE_INTERVAL = 0.01  # Seconds between stack samples of the profiled threads
+TOP_STACKS = 50  # Most frequent stacks kept in the exported profile
+MAX_STACK_DEPTH = 40
+LANES_PER_ATTEMPT = 10  # Trace rows per attempt: one for its stages, the rest for concurrent LLM calls
+
+# Where a sampled thread is spending its time, decided by the innermost matching frame
+SAMPLE_CATEGORIES = [
+    ('llm_wait', lambda name, path: name == 'request_completion'),
+    ('embedding_wait', lambda name, path: name == 'fetch_embedding'),
+    ('json_parse', lambda name, path: name == 'safe_json_parse'),
+    ('database', lambda name, path: f'django{os.sep}db{os.sep}backends' in path),
+    ('similarity', lambda name, path: name in ('similar_to_embedding', 'find_similar_problems')),
+    ('idle', lambda name, path: name in ('sleep', 'wait') or path.endswith(f'{os.sep}threading.py')),
+]
+
+# Profilers of the batches being profiled in this process, by batch id
+_active = {}
+_active_lock = threading.Lock()
+# Profiler (and attempt being traced) of the current thread
+_context = threading.local()
+
+
+class BatchProfiler:
+    """
+    Profile of one batch run: stack samples of the threads working on it, time spent in
+    database blocks, and a wall-clock span per attempt and stage for the trace timeline.
+    """
+
+    def __init__(self, batch_id, interval=SAMPLE_INTERVAL):
+        self.batch_id = batch_id
+        self.interval = interval
+        self.started = time.time()
+        self.stacks = Counter()
+        self.categories = Counter()
+        self.samples = 0
+        self.db_blocks = {}
+        self.spans = []
+        self._threads = Counter()  # Thread ident -> number of active activations
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def start(self):
+        self._sampler = threading.Thread(target=self._sample_loop, name=f'profiler-{self.batch_id}', daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join(timeout=5)
+
+    def enter_thread(self):
+        with self._lock:
+            self._threads[threading.get_ident()] += 1
+
+    def exit_thread(self):
+        ident = threading.get_ident()
+        with self._lock:
+            self._threads[ident] -= 1
+            if self._threads[ident] <= 0:
+                del self._threads[ident]
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                threads = set(self._threads)
+            frames = sys._current_frames()
+            for ident in threads:
+                frame = frames.get(ident)
+                if frame is not None:
+                    self._record_sample(frame)
+
+    def _record_sample(self, frame):
+        stack, category = [], None
+        depth = 0
+        while frame is not None and depth < MAX_STACK_DEPTH:
+            code = frame.f_code
+            if category is None:
+                category = next((name for name, matches in SAMPLE_CATEGORIES if matches(code.co_name, code.co_filename)), None)
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+            depth += 1
+        with self._lock:
+            self.samples += 1
+            self.categories[category or 'other'] += 1
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def record_span(self, name, category, started, duration, attempt=None, **args):
+        """Add a span of wall-clock time to the trace, on the row of the given attempt."""
+        with self._lock:
+            self.spans.append({
+                'name': name, 'cat': category, 'started': started, 'duration': duration,
+                'attempt': attempt, 'args': args
+            })
+
+    def record_db_block(self, name, duration, sql_seconds, statements):
+        with self._lock:
+            totals = self.db_blocks.setdefault(name, {'count': 0, 'seconds': 0.0, 'sql_seconds': 0.0, 'statements': 0, 'max_seconds': 0.0})
+            totals['count'] += 1
+            totals['seconds'] += duration
+            totals['sql_seconds'] += sql_seconds
+            totals['statements'] += statements
+            totals['max_seconds'] = max(totals['max_seconds'], duration)
+
+    def summary(self):
+        """Sampling profile and database block totals, as stored in the trace's otherData."""
+        with self._lock:
+            return {
+                'batch_id': self.batch_id,
+                'seconds': round(time.time() - self.started, 3),
+                'sample_interval_ms': self.interval * 1000,
+                'samples': self.samples,
+                'categories': {
+                    category: {'samples': count, 'share': round(count / self.samples, 4)}
+                    for category, count in self.categories.most_common()
+                },
+                'top_stacks': [{'stack': stack, 'samples': count} for stack, count in self.stacks.most_common(TOP_STACKS)],
+                'db_blocks': {
+                    name: {
+                        'count': totals['count'],
+                        'total_ms': round(totals['seconds'] * 1000, 3),
+                        'sql_wait_ms': round(totals['sql_seconds'] * 1000, 3),
+                        'max_ms': round(totals['max_seconds'] * 1000, 3),
+                        'statements': totals['statements']
+                    }
+                    for name, totals in self.db_blocks.items()
+                }
+            }
+
+    def trace(self):
+        """
+        The batch's timeline in the Chrome trace event format (chrome://tracing, Perfetto).
+
+        Each attempt gets LANES_PER_ATTEMPT rows: its stages and database blocks on the
+        first, its LLM calls (from the LLMCall telemetry) spread over the others so
+        concurrent calls don't overlap.
+        """
+        numbers = dict(Attempt.objects.filter(batch_id=self.batch_id).values_list('id', 'number'))
+        events = []
+
+        def tid(number, lane=0):
+            return (number or 0) * LANES_PER_ATTEMPT + lane
+
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            events.append({
+                'name': span['name'], 'cat': span['cat'], 'ph': 'X', 'pid': self.batch_id, 'tid': tid(span['attempt']),
+                'ts': int(span['started'] * 1e6), 'dur': int(span['duration'] * 1e6), 'args': span['args']
+            })
+
+        lanes = {}  # attempt number -> end time of the last call on each lane
+        calls = LLMCall.objects.filter(batch_id=self.batch_id, started_at__gte=datetime.fromtimestamp(self.started, tz=timezone.utc)).order_by('started_at')
+        for call in calls:
+            number = numbers.get(call.attempt_id)
+            started = call.started_at.timestamp()
+            ends = lanes.setdefault(number, [])
+            lane = next((i for i, end in enumerate(ends) if end <= started), None)
+            if lane is None:
+                ends.append(0.0)
+                lane = len(ends) - 1
+            ends[lane] = started + call.duration
+            events.append({
+                'name': f"{call.role}: {call.provider}/{call.model}", 'cat': 'llm', 'ph': 'X', 'pid': self.batch_id,
+                'tid': tid(number, min(lane, LANES_PER_ATTEMPT - 2) + 1),
+                'ts': int(started * 1e6), 'dur': int(call.duration * 1e6),
+                'args': {'retry': call.retry, 'input_tokens': call.input_tokens, 'output_tokens': call.output_tokens,
+                         'cost': float(call.cost), 'error': call.error}
+            })
+
+        events.append({'name': 'process_name', 'ph': 'M', 'pid': self.batch_id, 'args': {'name': f"Batch {self.batch_id}"}})
+        named = {event['tid'] for event in events if 'tid' in event}
+        for row in sorted(named):
+            number, lane = divmod(row, LANES_PER_ATTEMPT)
+            label = f"Attempt {number}" if number else "Workers"
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': self.batch_id, 'tid': row,
+                           'args': {'name': label if lane == 0 else f"{label} LLM calls"}})
+            events.append({'name': 'thread_sort_index', 'ph': 'M', 'pid': self.batch_id, 'tid': row, 'args': {'sort_index': row}})
+
+        return {'traceEvents': events, 'displayTimeUnit': 'ms', 'otherData': self.summary()}
+
+
+@contextmanager
+def profile_batch(batch):
+    """
+    Profile a batch run if batch.options['profile'] is set, saving the Chrome trace to
+    batch.profile_trace when the block ends. Does nothing otherwise.
+    """
+    if not (batch.options or {}).get('profile'):
+        yield None
+        return
+
+    profiler = BatchProfiler(batch.id)
+    with _active_lock:
+        _active[batch.id] = profiler
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        with _active_lock:
+            _active.pop(batch.id, None)
+        save_trace(batch, profiler)
+
+
+def save_trace(batch, profiler):
+    """Attach the profiler's trace to the batch as a JSON file."""
+    try:
+        content = ContentFile(json.dumps(profiler.trace()).encode('utf-8'))
+        batch.profile_trace.save(f"batch_{batch.id}_{int(profiler.started)}.json", content, save=False)
+        Batch.objects.filter(id=batch.id).update(profile_trace=batch.profile_trace.name)
+        summary = profiler.summary()
+        top = ', '.join(f"{category} {stats['share']:.0%}" for category, stats in list(summary['categories'].items())[:4])
+        print(f"🔬 Profile of batch {batch.id} saved to {batch.profile_trace.name} ({summary['samples']} samples: {top})")
+    except Exception as e:
+        print(f"⚠️ Could not save the profile of batch {batch.id}: {str(e)}")
+
+
+def current_profiler():
+    """Profiler of the batch this thread is working on, or None."""
+    return getattr(_context, 'profiler', None)
+
+
+@contextmanager
+def profiling(batch_id, attempt=None):
+    """
+    Mark the current thread as working on a batch (and attempt), so it is sampled and its
+    stages and database blocks are traced while the batch is being profiled.
+    """
+    profiler = _active.get(batch_id)
+    if profiler is None:
+        yield None
+        return
+
+    previous = (getattr(_context, 'profiler', None), getattr(_context, 'attempt', None))
+    _context.profiler, _context.attempt = profiler, attempt
+    profiler.enter_thread()
+    try:
+        yield profiler
+    finally:
+        profiler.exit_thread()
+        _context.profiler, _context.attempt = previous
+
+
+def bind_profiling(func):
+    """Wrap func so another thread running it is profiled like the current one."""
+    profiler, attempt = current_profiler(), getattr(_context, 'attempt', None)
+    if profiler is None:
+        return func
+
+    def run(*args, **kwargs):
+        with profiling(profiler.batch_id, attempt):
+            return func(*args, **kwargs)
+    return run
+
+
+@contextmanager
+def span(name, category='stage', **args):
+    """Trace a block of the current attempt as a span on the batch timeline."""
+    profiler = current_profiler()
+    if profiler is None:
+        yield
+        return
+    started = time.time()
+    try:
+        yield
+    finally:
+        profiler.record_span(name, category, started, time.time() - started, getattr(_context, 'attempt', None), **args)
+
+
+@contextmanager
+def db_block(name, atomic=True):
+    """
+    A database block (transaction.atomic() unless atomic=False) whose time is recorded while profiling.
+
+    Time spent inside SQL statements includes waiting for locks (SQLite's busy timeout,
+    row locks taken by select_for_update), so it is recorded as the block's SQL wait.
+    """
+    profiler = current_profiler()
+    if profiler is None:
+        with transaction.atomic() if atomic else nullcontext():
+            yield
+        return
+
+    sql = {'seconds': 0.0, 'statements': 0}
+
+    def timed_execute(execute, query, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(query, params, many, context)
+        finally:
+            sql['seconds'] += time.perf_counter() - started
+            sql['statements'] += 1
+
+    started = time.time()
+    try:
+        with connection.execute_wrapper(timed_execute):
+            with transaction.atomic() if atomic else nullcontext():
+                yield
+    finally:
+        duration = time.time() - started
+        profiler.record_db_block(name, duration, sql['seconds'], sql['statements'])
+        attempt = getattr(_context, 'attempt', None)
+        if attempt is not None:
+            # Blocks outside an attempt (idle workers claiming) only count towards the totals
+            profiler.record_span(
+                f"db: {name}", 'db', started, duration, attempt,
+                sql_wait_ms=round(sql['seconds'] * 1000, 3), statements=sql['statements']
+            )
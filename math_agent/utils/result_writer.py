@@ -0,0 +1,195 @@
+import queue
+from collections import Counter
+import threading
+import time
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, When, Value
+from math_agent.models import Problem, TargetResult, LLMCall
+from .leases import finish_attempt
+from .similarity_utils import link_similar_problems
+from .topic_sampler import record_topic_outcome
+from .batch_stats import count_outcomes
+from .metrics import timed_write
+from .profiling import db_block
+
+BATCH_SIZE = getattr(settings, 'RESULT_WRITER_BATCH_SIZE', 50)  # Write as soon as this many results or call records are queued
+MAX_LATENCY = getattr(settings, 'RESULT_WRITER_MAX_LATENCY', 0.5)  # Seconds the oldest queued item waits at most
+IDLE_TIMEOUT = 30  # Seconds without anything to write before the writer closes its database connection
+
+
+class ResultWriter:
+    """
+    Background thread writing finished attempts and LLM call telemetry in bulk, so
+    worker threads never write them to the database themselves.
+
+    Queued items are written once batch_size of a kind are waiting or the oldest has
+    waited max_latency seconds. Each write of results is one transaction creating the
+    problems, their similarity links and target results, completing their attempts and
+    adding them to their batches' counters.
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE, max_latency=MAX_LATENCY):
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _ensure_running(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='result-writer', daemon=True)
+                self._thread.start()
+
+    def pending(self):
+        """Number of items waiting to be written."""
+        return self._queue.qsize()
+
+    def add_call(self, call):
+        """Queue an unsaved LLMCall for writing."""
+        self._ensure_running()
+        self._queue.put(('call', call))
+
+    def add_result(self, result):
+        """
+        Queue a finished attempt for saving.
+
+        Args:
+            result (dict): 'attempt' and 'owner' (the worker holding its lease, which keeps
+                being renewed until the result is written), the unsaved 'problem', its unsaved
+                'target_results' and optionally 'topic_outcome' as (cost, seconds) for the
+                topic statistics
+        """
+        self._ensure_running()
+        self._queue.put(('result', result))
+
+    def flush(self, timeout=10, close_connection=False):
+        """
+        Block until everything queued so far has been written.
+
+        close_connection also closes the writer's database connection, e.g. before
+        the database it was using is dropped.
+        """
+        self._ensure_running()
+        done = threading.Event()
+        self._queue.put(('flush', (done, close_connection)))
+        done.wait(timeout)
+
+    def _write_calls(self, calls):
+        try:
+            with timed_write('telemetry'):
+                LLMCall.objects.bulk_create(calls)
+        except Exception as e:
+            print(f"⚠️ Dropped {len(calls)} telemetry records: {str(e)}")
+
+    def _save_results(self, results):
+        """Save a group of results in one transaction. Returns (saved, lost) results."""
+        saved, lost = [], []
+        with timed_write('results'), db_block('write_results'):
+            Problem.objects.bulk_create([result['problem'] for result in results])
+            for result in results:
+                problem = result['problem']
+                if finish_attempt(result['attempt'], result['owner'], 'completed', outcome=problem.status, problem=problem):
+                    saved.append(result)
+                else:
+                    lost.append(result)
+
+            # An attempt re-issued to another worker, or cancelled when its batch finished, keeps no problem
+            if lost:
+                Problem.objects.filter(id__in=[result['problem'].id for result in lost]).delete()
+
+            link_similar_problems([result['problem'] for result in saved])
+            TargetResult.objects.bulk_create([target for result in saved for target in result['target_results']])
+
+            batches = {}
+            for result in saved:
+                batches.setdefault(result['attempt'].batch_id, []).append(result)
+            for batch_id, group in batches.items():
+                targets = [target for result in group for target in result['target_results']]
+                count_outcomes(
+                    batch_id,
+                    Counter(result['problem'].status for result in group),
+                    judged=sum(target.samples for target in targets),
+                    judged_locally=sum(target.judged_locally for target in targets)
+                )
+
+            # Attach the attempts' LLM calls to the problems they produced
+            links = {result['attempt'].id: result['problem'].id for result in saved}
+            if links:
+                LLMCall.objects.filter(attempt_id__in=list(links), problem__isnull=True).update(
+                    problem_id=Case(*[When(attempt_id=attempt_id, then=Value(problem_id)) for attempt_id, problem_id in links.items()])
+                )
+        return saved, lost
+
+    def _write_results(self, results):
+        try:
+            saved, lost = self._save_results(results)
+        except Exception as e:
+            for result in results:
+                # Drop the ids assigned by the rolled back insert
+                result['problem'].pk = None
+                for target in result['target_results']:
+                    target.problem = result['problem']
+            if len(results) == 1:
+                attempt = results[0]['attempt']
+                print(f"❌ Could not save the problem of attempt {attempt.number}: {str(e)}")
+                # Its stages are persisted, so resuming the batch saves it without new LLM calls
+                if finish_attempt(attempt, results[0]['owner'], 'failed', error=f"Saving the problem failed: {str(e)}"):
+                    count_outcomes(attempt.batch_id, {'error': 1})
+                return
+            print(f"⚠️ Saving {len(results)} results together failed ({str(e)}), saving them one by one")
+            for result in results:
+                self._write_results([result])
+            return
+
+        for result in lost:
+            print(f"Attempt {result['attempt'].number} cancelled before saving: batch finished or lease lost")
+        for result in saved:
+            if result.get('topic_outcome'):
+                attempt = result['attempt']
+                cost, seconds = result['topic_outcome']
+                record_topic_outcome(attempt.subject, attempt.topic, result['problem'].status, cost, seconds)
+
+    def _run(self):
+        while True:
+            calls, results, waiters = [], [], []
+            try:
+                kind, item = self._queue.get(timeout=IDLE_TIMEOUT)
+            except queue.Empty:
+                # Don't hold a database connection while there is nothing to write
+                connection.close()
+                continue
+
+            # Collect until enough is queued, the oldest item is due, or someone waits for a flush
+            deadline = time.monotonic() + self.max_latency
+            while True:
+                if kind == 'call':
+                    calls.append(item)
+                elif kind == 'result':
+                    results.append(item)
+                else:
+                    waiters.append(item)
+                    break
+                if len(calls) >= self.batch_size or len(results) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    kind, item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+            # Calls first, so the results written after them can link them to their problems
+            if calls:
+                self._write_calls(calls)
+            if results:
+                self._write_results(results)
+            if any(close_connection for _, close_connection in waiters):
+                connection.close()
+            for done, _ in waiters:
+                done.set()
+
+
+result_writer = ResultWriter()
@@ -0,0 +1,183 @@
+import re
+from django.db import connection, connections
+from math_agent.models import Problem
+
+SEARCH_PAGE_SIZE = 20
+PROBLEM_TABLE = Problem._meta.db_table
+SEARCH_TABLE = f'{PROBLEM_TABLE}_fts'  # SQLite FTS5 table
+SEARCH_COLUMN = 'search_vector'  # PostgreSQL generated tsvector column
+SEARCH_LANGUAGE = 'english'
+# bm25 weights of question, answer and hints on SQLite; tsvector weights A, B and C on PostgreSQL
+SQLITE_WEIGHTS = (4.0, 2.0, 1.0)
+
+# Hint texts without the JSON keys and quoting, for the SQLite index
+SQLITE_HINTS_TEXT = "(SELECT group_concat(value, ' ') FROM json_each({row}.hints))"
+
+SQLITE_SEARCH_SQL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE}
+        USING fts5(question, answer, hints, tokenize='porter unicode61')""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_insert AFTER INSERT ON {PROBLEM_TABLE} BEGIN
+        INSERT INTO {SEARCH_TABLE}(rowid, question, answer, hints)
+        VALUES (new.id, new.question, new.answer, {SQLITE_HINTS_TEXT.format(row='new')});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_update AFTER UPDATE OF question, answer, hints ON {PROBLEM_TABLE} BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id;
+        INSERT INTO {SEARCH_TABLE}(rowid, question, answer, hints)
+        VALUES (new.id, new.question, new.answer, {SQLITE_HINTS_TEXT.format(row='new')});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_delete AFTER DELETE ON {PROBLEM_TABLE} BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id;
+    END"""
+]
+SQLITE_DROP_SQL = [
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_insert",
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_update",
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_delete",
+    f"DROP TABLE IF EXISTS {SEARCH_TABLE}"
+]
+SQLITE_FILL_SQL = f"""INSERT INTO {SEARCH_TABLE}(rowid, question, answer, hints)
+    SELECT id, question, answer, {SQLITE_HINTS_TEXT.format(row=PROBLEM_TABLE)} FROM {PROBLEM_TABLE}"""
+
+POSTGRES_SEARCH_SQL = [
+    f"""ALTER TABLE {PROBLEM_TABLE} ADD COLUMN IF NOT EXISTS {SEARCH_COLUMN} tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('{SEARCH_LANGUAGE}', coalesce(question, '')), 'A') ||
+        setweight(to_tsvector('{SEARCH_LANGUAGE}', coalesce(answer, '')), 'B') ||
+        setweight(jsonb_to_tsvector('{SEARCH_LANGUAGE}', coalesce(hints, '{{}}'::jsonb), '["string"]'), 'C')
+    ) STORED""",
+    f"CREATE INDEX IF NOT EXISTS problem_search_idx ON {PROBLEM_TABLE} USING GIN ({SEARCH_COLUMN})"
+]
+POSTGRES_DROP_SQL = [
+    "DROP INDEX IF EXISTS problem_search_idx",
+    f"ALTER TABLE {PROBLEM_TABLE} DROP COLUMN IF EXISTS {SEARCH_COLUMN}"
+]
+
+
+def install_search_index(conn=connection, fill=True):
+    """
+    Create the full-text index over question, answer and hints: an FTS5 table kept in
+    sync by triggers on SQLite, a generated tsvector column with a GIN index on
+    PostgreSQL. Statements are idempotent, so it also restores SQLite's triggers after
+    a migration rebuilt the problem table.
+
+    Args:
+        conn: Database connection
+        fill (bool): On SQLite, index the existing problems when the FTS table is new
+    """
+    with conn.cursor() as cursor:
+        if conn.vendor == 'postgresql':
+            for statement in POSTGRES_SEARCH_SQL:
+                cursor.execute(statement)
+        elif conn.vendor == 'sqlite':
+            new = SEARCH_TABLE not in conn.introspection.table_names(cursor)
+            for statement in SQLITE_SEARCH_SQL:
+                cursor.execute(statement)
+            if new and fill:
+                cursor.execute(SQLITE_FILL_SQL)
+
+
+def drop_search_index(conn=connection):
+    """Remove the full-text index."""
+    with conn.cursor() as cursor:
+        for statement in POSTGRES_DROP_SQL if conn.vendor == 'postgresql' else SQLITE_DROP_SQL if conn.vendor == 'sqlite' else []:
+            cursor.execute(statement)
+
+
+def restore_search_triggers(sender, using='default', **kwargs):
+    """
+    post_migrate handler: SQLite migrations that rebuild the problem table drop its
+    triggers, so put them back whenever the FTS table exists.
+    """
+    conn = connections[using]
+    if conn.vendor == 'sqlite' and SEARCH_TABLE in conn.introspection.table_names():
+        install_search_index(conn)
+
+
+def rebuild_search_index(conn=connection):
+    """Drop and rebuild the full-text index from the problems."""
+    drop_search_index(conn)
+    install_search_index(conn)
+
+
+def fts_query(text):
+    """
+    FTS5 query matching every word of a user's search text, so quotes and operators
+    typed by the user can't make the query invalid.
+    """
+    return ' '.join(f'"{word}"' for word in re.findall(r'\w+', text))
+
+
+class SearchPage:
+    """One page of ranked search results."""
+
+    def __init__(self, items, number, has_next):
+        self.items = items
+        self.number = number
+        self.has_next = has_next
+        self.next_url = None
+        self.previous_url = None
+
+    @property
+    def has_previous(self):
+        return self.number > 1
+
+
+def search_problems(text, batch_id=None, status=None, page=1, page_size=SEARCH_PAGE_SIZE, queryset=None):
+    """
+    Rank problems matching search text in their question, answer or hints; matches in
+    the question count most, then the answer, then the hints.
+
+    Args:
+        text (str): Search text; every word has to match (PostgreSQL also understands
+            "quoted phrases", OR and -excluded words)
+        batch_id (int, optional): Only this batch's problems
+        status (str, optional): Only problems with this status
+        page (int): Page number, from 1
+        page_size (int): Results per page
+        queryset (QuerySet, optional): Loads the page's problems, e.g. with deferred fields
+
+    Returns:
+        SearchPage: Problems of the page, best first, each with a search_rank (higher is better)
+    """
+    offset = (page - 1) * page_size
+    filters, params = [], []
+    if batch_id:
+        filters.append('p.batch_id = %s')
+        params.append(batch_id)
+    if status:
+        filters.append('p.status = %s')
+        params.append(status)
+    where = ''.join(f' AND {condition}' for condition in filters)
+
+    if connection.vendor == 'postgresql':
+        sql = (
+            f"SELECT p.id, ts_rank_cd(p.{SEARCH_COLUMN}, tsq) AS score "
+            f"FROM {PROBLEM_TABLE} p, websearch_to_tsquery('{SEARCH_LANGUAGE}', %s) tsq "
+            f"WHERE p.{SEARCH_COLUMN} @@ tsq{where} "
+            f"ORDER BY score DESC, p.id LIMIT %s OFFSET %s"
+        )
+        params = [text] + params
+    else:
+        match = fts_query(text)
+        if not match:
+            return SearchPage([], page, False)
+        # bm25 is lower for better matches
+        sql = (
+            f"SELECT p.id, -bm25({SEARCH_TABLE}, {', '.join(str(weight) for weight in SQLITE_WEIGHTS)}) AS score "
+            f"FROM {SEARCH_TABLE} JOIN {PROBLEM_TABLE} p ON p.id = {SEARCH_TABLE}.rowid "
+            f"WHERE {SEARCH_TABLE} MATCH %s{where} "
+            f"ORDER BY score DESC, p.id LIMIT %s OFFSET %s"
+        )
+        params = [match] + params
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + [page_size + 1, offset])
+        ranks = dict(cursor.fetchall())
+    ids = list(ranks)[:page_size]
+    problems = (queryset if queryset is not None else Problem.objects.all()).in_bulk(ids)
+    items = []
+    for problem_id in ids:
+        if problem_id in problems:
+            problem = problems[problem_id]
+            problem.search_rank = ranks[problem_id]
+            items.append(problem)
+    return SearchPage(items, page, len(ranks) > page_size)
@@ -0,0 +1,268 @@
+import time
+import tracemalloc
+import numpy as np
+from math_agent.models import Batch, Problem
+from .similarity_utils import similar_to_embedding, normalize, SIMILARITY_THRESHOLD
+from .telemetry import percentile
+
+EMBEDDING_DIMENSIONS = 1536  # text-embedding-3-small
+SEED_CHUNK = 2000  # Problems inserted per bulk_create
+LSH_TABLES = 16  # Hash tables of the random-projection index
+LSH_BITS = 12  # Hyperplanes (bits) per table
+
+
+class ScanBackend:
+    """What production does today: decode every stored embedding and compare it in Python."""
+
+    name = 'scan'
+
+    def build(self):
+        pass
+
+    def query(self, embedding, threshold):
+        return similar_to_embedding(embedding, threshold=threshold)
+
+
+class MatrixBackend:
+    """All embeddings normalized into one float32 matrix in memory; a query is one matrix-vector product."""
+
+    name = 'matrix'
+
+    def build(self):
+        ids, vectors = [], []
+        for problem_id, embedding in Problem.objects.exclude(problem_embedding=None).values_list('id', 'problem_embedding').iterator(chunk_size=SEED_CHUNK):
+            ids.append(problem_id)
+            vectors.append(embedding)
+        self.ids = np.array(ids)
+        self.matrix = normalize(np.array(vectors, dtype=np.float32))
+
+    def scores(self, embedding, rows=None):
+        query = normalize(np.asarray(embedding, dtype=np.float32))
+        matrix = self.matrix if rows is None else self.matrix[rows]
+        return matrix @ query
+
+    def query(self, embedding, threshold):
+        scores = self.scores(embedding)
+        hits = np.nonzero(scores >= threshold)[0]
+        return {int(self.ids[i]): float(scores[i]) for i in hits}
+
+
+class LSHBackend(MatrixBackend):
+    """
+    Approximate: random-hyperplane hashing (SimHash) picks candidates sharing a bucket
+    with the query in any of LSH_TABLES tables, and only those are scored exactly.
+    Faster on large corpora, at the price of missing some pairs near the threshold.
+    """
+
+    name = 'lsh'
+
+    def __init__(self, tables=LSH_TABLES, bits=LSH_BITS, seed=0):
+        self.tables = tables
+        self.bits = bits
+        self.seed = seed
+
+    def hash(self, vectors):
+        bits = (vectors @ self.planes) > 0
+        bits = bits.reshape(len(vectors), self.tables, self.bits)
+        return bits.astype(np.int64) @ (1 << np.arange(self.bits, dtype=np.int64))
+
+    def build(self):
+        super().build()
+        rng = np.random.default_rng(self.seed)
+        self.planes = rng.standard_normal((self.matrix.shape[1], self.tables * self.bits)).astype(np.float32)
+        keys = self.hash(self.matrix)
+        # Per table, rows sorted by bucket key so a bucket is a contiguous slice
+        self.order = np.argsort(keys, axis=0, kind='stable')
+        self.sorted_keys = np.take_along_axis(keys, self.order, axis=0)
+
+    def query(self, embedding, threshold):
+        query = normalize(np.asarray(embedding, dtype=np.float32))
+        keys = self.hash(query[None, :])[0]
+        candidates = []
+        for table, key in enumerate(keys):
+            start, end = np.searchsorted(self.sorted_keys[:, table], [key, key + 1])
+            candidates.append(self.order[start:end, table])
+        rows = np.unique(np.concatenate(candidates))
+        if not len(rows):
+            return {}
+        scores = self.matrix[rows] @ query
+        hits = np.nonzero(scores >= threshold)[0]
+        return {int(self.ids[rows[i]]): float(scores[i]) for i in hits}
+
+
+class FaissBackend(MatrixBackend):
+    """Exact inner-product search with faiss (IndexFlatIP), if it is installed."""
+
+    name = 'faiss'
+
+    def build(self):
+        import faiss
+        super().build()
+        self.index = faiss.IndexFlatIP(self.matrix.shape[1])
+        self.index.add(self.matrix)
+        del self.matrix
+
+    def query(self, embedding, threshold):
+        query = normalize(np.asarray(embedding, dtype=np.float32))[None, :]
+        limits, scores, rows = self.index.range_search(query, threshold)
+        return {int(self.ids[row]): float(score) for row, score in zip(rows[limits[0]:limits[1]], scores[limits[0]:limits[1]])}
+
+
+SIMILARITY_BACKENDS = {backend.name: backend for backend in [ScanBackend, MatrixBackend, LSHBackend, FaissBackend]}
+
+
+class SyntheticCorpus:
+    """
+    Random unit embeddings where a share of the corpus comes in clusters of near-duplicates,
+    each a noisy copy of a cluster center. Noise levels spread the duplicates' similarity to
+    their center on both sides of the threshold, which is where approximate indexes lose recall.
+    """
+
+    def __init__(self, dimensions=EMBEDDING_DIMENSIONS, duplicate_rate=0.1, cluster_size=5, noise=(0.1, 0.9), seed=0):
+        self.dimensions = dimensions
+        self.duplicate_rate = duplicate_rate
+        self.cluster_size = cluster_size
+        self.noise = noise
+        self.rng = np.random.default_rng(seed)
+        self.centers = []
+
+    def random_vectors(self, count):
+        return normalize(self.rng.standard_normal((count, self.dimensions)))
+
+    def near_duplicate(self, center):
+        noise = self.rng.uniform(*self.noise)
+        return normalize(center + noise * self.random_vectors(1)[0])
+
+    def chunk(self, count):
+        """`count` embeddings, about duplicate_rate of them in near-duplicate clusters."""
+        vectors = []
+        while len(vectors) < count:
+            if self.rng.random() < self.duplicate_rate / self.cluster_size:
+                center = self.random_vectors(1)[0]
+                self.centers.append(center)
+                vectors.extend(self.near_duplicate(center) for _ in range(self.cluster_size))
+            else:
+                vectors.append(self.random_vectors(1)[0])
+        return np.round(np.array(vectors[:count]), 6)
+
+    def queries(self, count):
+        """Half near-duplicates of stored clusters (which should find matches), half unrelated vectors."""
+        duplicates = count // 2 if self.centers else 0
+        picks = self.rng.integers(len(self.centers), size=duplicates) if duplicates else []
+        queries = [self.near_duplicate(self.centers[i]) for i in picks]
+        queries.extend(self.random_vectors(count - duplicates))
+        return queries
+
+
+def seed_embeddings(size, corpus):
+    """
+    Grow the stored problems to `size` with the corpus' synthetic embeddings.
+
+    Returns:
+        int: Number of problems added
+    """
+    missing = size - Problem.objects.count()
+    if missing <= 0:
+        return 0
+
+    batch = Batch.objects.filter(name='Similarity benchmark').first() or Batch.objects.create(
+        name='Similarity benchmark',
+        taxonomy_json={},
+        pipeline={},
+        number_of_valid_needed=1,
+        status='completed'
+    )
+    for start in range(0, missing, SEED_CHUNK):
+        vectors = corpus.chunk(min(SEED_CHUNK, missing - start))
+        Problem.objects.bulk_create([
+            Problem(
+                subject='Benchmark',
+                topic='Similarity',
+                question=f"Synthetic problem {start + i}",
+                answer='0',
+                hints={},
+                status='valid',
+                batch=batch,
+                problem_embedding=vector.tolist()
+            )
+            for i, vector in enumerate(vectors)
+        ])
+    return missing
+
+
+def exact_matches(queries, threshold):
+    """Ground truth for recall: every stored problem at or above the threshold, by exact float64 search."""
+    truth = [set() for _ in queries]
+    query_matrix = normalize(np.array(queries, dtype=np.float64))
+    ids, vectors = [], []
+
+    def scan(ids, vectors):
+        scores = normalize(np.array(vectors, dtype=np.float64)) @ query_matrix.T
+        for row, column in zip(*np.nonzero(scores >= threshold)):
+            truth[column].add(ids[row])
+
+    for problem_id, embedding in Problem.objects.exclude(problem_embedding=None).values_list('id', 'problem_embedding').iterator(chunk_size=SEED_CHUNK):
+        ids.append(problem_id)
+        vectors.append(embedding)
+        if len(ids) == SEED_CHUNK:
+            scan(ids, vectors)
+            ids, vectors = [], []
+    if ids:
+        scan(ids, vectors)
+    return truth
+
+
+def _milliseconds(seconds):
+    return round(seconds * 1000, 3) if seconds is not None else None
+
+
+def benchmark_backend(backend, queries, truth, threshold=SIMILARITY_THRESHOLD):
+    """
+    Measure one similarity backend on the stored corpus.
+
+    The build and one query are repeated under tracemalloc to measure memory, so
+    the timed runs are not slowed down by it.
+
+    Returns:
+        dict: build_ms, query latency (mean/p50/p95/p99 ms), index_bytes (memory the
+        built index keeps), query_peak_bytes, recall and false_positives at the threshold
+    """
+    started = time.perf_counter()
+    backend.build()
+    build_seconds = time.perf_counter() - started
+
+    latencies, found = [], []
+    for query in queries:
+        started = time.perf_counter()
+        found.append(backend.query(query, threshold))
+        latencies.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        backend.build()
+        index_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        before_query = tracemalloc.get_traced_memory()[0]
+        backend.query(queries[0], threshold)
+        query_peak_bytes = tracemalloc.get_traced_memory()[1] - before_query
+    finally:
+        tracemalloc.stop()
+
+    expected = sum(len(matches) for matches in truth)
+    hits = sum(len(matches & set(result)) for matches, result in zip(truth, found))
+    latencies.sort()
+    return {
+        'backend': backend.name,
+        'build_ms': _milliseconds(build_seconds),
+        'query_ms': {
+            'mean': _milliseconds(sum(latencies) / len(latencies)),
+            'p50': _milliseconds(percentile(latencies, 50)),
+            'p95': _milliseconds(percentile(latencies, 95)),
+            'p99': _milliseconds(percentile(latencies, 99))
+        },
+        'index_bytes': index_bytes,
+        'query_peak_bytes': query_peak_bytes,
+        'expected_matches': expected,
+        'recall': round(hits / expected, 4) if expected else None,
+        'false_positives': sum(len(set(result) - matches) for matches, result in zip(truth, found))
+    }
@@ -1,11 +1,19 @@
+import time
 import numpy as np
 import requests
 from django.conf import settings
-from .call_llm_clients import call_llm
-from math_agent.models import Problem
+from django.db import connection
+from django.db.models import Q, F, Count
+from django.db.models.functions import Substr
+from math_agent.models import Problem, ProblemSimilarity, ProblemNeighbor
+from .pagination import KeysetPage, encode_key, decode_key
+from .metrics import embedding_requests, embedding_seconds, similarity_seconds, similarity_comparisons
 
 EMBEDDING_MODEL = 'text-embedding-3-small'  # or make configurable
 SIMILARITY_THRESHOLD = 0.82
+LOOKUP_CHUNK = 500  # Problem ids per query, below SQLite's limit on query parameters
+NEIGHBOR_LIMIT = getattr(settings, 'SIMILAR_PROBLEMS_TOP_K', 20)  # Most similar problems kept per problem for its page
+EXCERPT_LENGTH = 200  # Characters of a similar problem's question shown in lists
 
 
 def fetch_embedding(text, provider='openai', model=EMBEDDING_MODEL):
@@ -15,16 +23,50 @@ def fetch_embedding(text, provider='openai', model=EMBEDDING_MODEL):
     """
     if provider == 'openai':
         import openai
-        client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
-        response = client.embeddings.create(
-            input=text,
-            model=model
-        )
+        started = time.perf_counter()
+        try:
+            client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
+            response = client.embeddings.create(
+                input=text,
+                model=model
+            )
+        except Exception:
+            embedding_requests.inc(provider=provider, result='error')
+            raise
+        finally:
+            embedding_seconds.observe(time.perf_counter() - started, provider=provider)
+        embedding_requests.inc(provider=provider, result='ok')
         return response.data[0].embedding
     # Add other providers if needed
     raise NotImplementedError(f"Embedding provider {provider} not implemented.")
 
 
+def fetch_embeddings(texts, provider='openai', model=EMBEDDING_MODEL):
+    """
+    Fetch the embeddings of several texts with one request.
+
+    Returns:
+        list: One embedding per text, in the order of texts
+    """
+    if provider == 'openai':
+        import openai
+        started = time.perf_counter()
+        try:
+            client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
+            response = client.embeddings.create(
+                input=list(texts),
+                model=model
+            )
+        except Exception:
+            embedding_requests.inc(provider=provider, result='error')
+            raise
+        finally:
+            embedding_seconds.observe(time.perf_counter() - started, provider=provider)
+        embedding_requests.inc(provider=provider, result='ok')
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+    raise NotImplementedError(f"Embedding provider {provider} not implemented.")
+
+
 def cosine_similarity(vec1, vec2):
     v1 = np.array(vec1)
     v2 = np.array(vec2)
@@ -33,17 +75,187 @@ def cosine_similarity(vec1, vec2):
     return float(np.dot(v1, v2) / (np.linalg.norm(v1) * np.linalg.norm(v2)))
 
 
+def normalize(vectors):
+    """Scale vectors (the last axis) to unit length, leaving zero vectors as they are."""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
 def find_similar_problems(problem_text, exclude_ids=None, threshold=SIMILARITY_THRESHOLD):
     """
     Given a problem text, fetch its embedding and compare to all existing problems.
     Returns a dict: {problem_id: similarity_score, ...} for all above threshold.
     """
+    embedding = fetch_embedding(problem_text)
+    return similar_to_embedding(embedding, exclude_ids, threshold), embedding
+
+
+def similar_to_embedding(embedding, exclude_ids=None, threshold=SIMILARITY_THRESHOLD):
+    """
+    Compare an embedding to every stored problem's embedding.
+    Returns a dict: {problem_id: similarity_score, ...} for all above threshold.
+    """
     if exclude_ids is None:
         exclude_ids = []
-    embedding = fetch_embedding(problem_text)
     similars = {}
-    for prob in Problem.objects.exclude(id__in=exclude_ids).exclude(problem_embedding=None):
-        sim = cosine_similarity(embedding, prob.problem_embedding)
-        if sim >= threshold:
-            similars[prob.id] = sim
-    return similars, embedding 
\ No newline at end of file
+    compared = 0
+    with similarity_seconds.time():
+        for prob in Problem.objects.exclude(id__in=exclude_ids).exclude(problem_embedding=None):
+            sim = cosine_similarity(embedding, prob.problem_embedding)
+            compared += 1
+            if sim >= threshold:
+                similars[prob.id] = sim
+    similarity_comparisons.inc(compared)
+    return similars 
+
+
+def link_similar_problems(problems):
+    """
+    Record the similar problems of newly saved problems (their similar_problems field)
+    as ProblemSimilarity rows.
+
+    Only inserts rows, so concurrent saves never lock (or deadlock on) the older
+    problems they resemble. Problems deleted in the meantime are skipped.
+    """
+    ids = list({int(sim_id) for problem in problems for sim_id in problem.similar_problems})
+    existing = set()
+    for start in range(0, len(ids), LOOKUP_CHUNK):
+        existing.update(Problem.objects.filter(id__in=ids[start:start + LOOKUP_CHUNK]).values_list('id', flat=True))
+    links = [
+        ProblemSimilarity(problem=problem, similar_id=int(sim_id), score=score)
+        for problem in problems
+        for sim_id, score in problem.similar_problems.items() if int(sim_id) in existing and int(sim_id) != problem.id
+    ]
+    ProblemSimilarity.objects.bulk_create(links, ignore_conflicts=True)
+    add_neighbors([(link.problem_id, link.similar_id, link.score) for link in links])
+
+
+def add_neighbors(links):
+    """
+    Add new similarity links to both problems' top neighbour lists, then cut every
+    list that grew past NEIGHBOR_LIMIT back to its best NEIGHBOR_LIMIT.
+
+    Args:
+        links (list): (problem_id, similar_id, score) tuples
+    """
+    ProblemNeighbor.objects.bulk_create([
+        ProblemNeighbor(problem_id=a, neighbor_id=b, score=score)
+        for problem_id, similar_id, score in links
+        for a, b in ((problem_id, similar_id), (similar_id, problem_id))
+    ], ignore_conflicts=True)
+
+    ids = list({problem_id for link in links for problem_id in link[:2]})
+    for start in range(0, len(ids), LOOKUP_CHUNK):
+        full = (
+            ProblemNeighbor.objects.filter(problem_id__in=ids[start:start + LOOKUP_CHUNK])
+            .values('problem_id').annotate(neighbors=Count('id')).filter(neighbors__gt=NEIGHBOR_LIMIT)
+        )
+        for row in full:
+            neighbors = ProblemNeighbor.objects.filter(problem_id=row['problem_id'])
+            keep = list(neighbors.order_by('-score', 'neighbor_id').values_list('id', flat=True)[:NEIGHBOR_LIMIT])
+            neighbors.exclude(id__in=keep).delete()
+
+
+def rebuild_neighbors():
+    """
+    Recompute every problem's top neighbour list from the similarity links, e.g. after
+    problems were deleted or NEIGHBOR_LIMIT changed.
+
+    Returns:
+        int: Number of neighbour rows written
+    """
+    neighbors = ProblemNeighbor._meta.db_table
+    similarities = ProblemSimilarity._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {neighbors}")
+        cursor.execute(
+            f"""INSERT INTO {neighbors} (problem_id, neighbor_id, score)
+            SELECT problem_id, neighbor_id, score FROM (
+                SELECT problem_id, neighbor_id, score,
+                    ROW_NUMBER() OVER (PARTITION BY problem_id ORDER BY score DESC, neighbor_id) AS position
+                FROM (
+                    SELECT problem_id, similar_id AS neighbor_id, score FROM {similarities}
+                    UNION ALL
+                    SELECT similar_id, problem_id, score FROM {similarities}
+                ) links
+            ) ranked
+            WHERE position <= %s""",
+            [NEIGHBOR_LIMIT]
+        )
+        return cursor.rowcount
+
+
+def top_neighbors(problem_id):
+    """
+    A problem's most similar problems, best first, read from its capped neighbour list
+    with one query and without loading the neighbours' full rows.
+
+    Returns:
+        list: Dicts with neighbor_id, score, subject, topic, status and excerpt (start of the question)
+    """
+    return list(
+        ProblemNeighbor.objects.filter(problem_id=problem_id)
+        .order_by('-score', 'neighbor_id')
+        .values(
+            'neighbor_id',
+            'score',
+            subject=F('neighbor__subject'),
+            topic=F('neighbor__topic'),
+            status=F('neighbor__status'),
+            excerpt=Substr('neighbor__question', 1, EXCERPT_LENGTH)
+        )
+    )
+
+
+def similar_problems_page(problem_id, after=None, page_size=NEIGHBOR_LIMIT):
+    """
+    One page of all of a problem's similar problems, best first, located by a
+    (score, id) cursor, for problems with more than their top NEIGHBOR_LIMIT.
+
+    Args:
+        problem_id (int): The problem
+        after (str, optional): Cursor of the last similar problem of the previous page
+        page_size (int): Similar problems per page
+
+    Returns:
+        KeysetPage: Items are dicts like top_neighbors' (previous_cursor is always None)
+
+    Raises:
+        InvalidCursor: If the cursor can't be decoded
+    """
+    sides = []
+    for own, other in (('problem', 'similar'), ('similar', 'problem')):
+        links = ProblemSimilarity.objects.filter(**{f'{own}_id': problem_id})
+        if after:
+            score, other_id = decode_key(after, float, int)
+            links = links.filter(Q(score__lt=score) | Q(score=score, **{f'{other}_id__gt': other_id}))
+        sides.append(links.order_by().values(
+            'score',
+            neighbor_id=F(f'{other}_id'),
+            subject=F(f'{other}__subject'),
+            topic=F(f'{other}__topic'),
+            status=F(f'{other}__status'),
+            excerpt=Substr(f'{other}__question', 1, EXCERPT_LENGTH)
+        ))
+    rows = list(sides[0].union(sides[1], all=True).order_by('-score', 'neighbor_id')[:page_size + 1])
+    items = rows[:page_size]
+    next_cursor = encode_key(items[-1]['score'], items[-1]['neighbor_id']) if len(rows) > page_size else None
+    return KeysetPage(items, next_cursor=next_cursor)
+
+
+def similarity_map(problem_ids):
+    """
+    Look up the similar problems of several problems, in both directions.
+    Returns a dict: {problem_id: {str(similar_id): similarity_score, ...}, ...}
+    """
+    ids = list(problem_ids)
+    scores = {problem_id: {} for problem_id in ids}
+    for start in range(0, len(ids), LOOKUP_CHUNK):
+        chunk = ids[start:start + LOOKUP_CHUNK]
+        links = ProblemSimilarity.objects.filter(Q(problem_id__in=chunk) | Q(similar_id__in=chunk))
+        for problem_id, similar_id, score in links.values_list('problem_id', 'similar_id', 'score'):
+            if problem_id in scores:
+                scores[problem_id][str(similar_id)] = score
+            if similar_id in scores:
+                scores[similar_id][str(problem_id)] = score
+    return scores
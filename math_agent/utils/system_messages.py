@@ -188,6 +188,29 @@ Instructions:
 - Focus on graduate-level complexity and novel MCQ problem construction
 """
 
+GENERATOR_MULTI_SUFFIX = """
+MULTIPLE PROBLEMS:
+You will be asked for {count} problems at once, each for its own subject and topic. Apply every requirement above to each problem independently; the problems must be unrelated to each other.
+
+Instead of a single object, return strictly valid JSON of the form:
+{{
+  "problems": [
+    {{ "subject": "string", "topic": "string", "problem": "string", "answer": "string", "hints": {{ "0": "First hint goes here.", ... }} }},
+    ...
+  ]
+}}
+
+Instructions:
+- The "problems" list MUST contain exactly {count} objects, in the same order as the requested subjects and topics
+- Each object uses the same fields and rules as the single-problem format above
+- Do NOT include markdown syntax (e.g., ```), code blocks, or non-JSON commentary
+"""
+
+GENERATOR_NO_HINTS_SUFFIX = """
+HINTS:
+Do NOT write hints; they are written separately once the problem has been validated. Ignore every instruction above about hints and omit the "hints" field from the JSON.
+"""
+
 HINT_ONLY_MESSAGE = """
 You are an expert tutor for graduate-level mathematics. Given a math problem and its correct answer, your task is to generate a helpful, logically sound, step-by-step dictionary of hints to guide a student toward solving it.
 
@@ -216,7 +239,7 @@ Instructions:
 - Focus on graduate-level problem-solving guidance
 """
 
-CHECKER_MESSAGE = """
+CHECKER_CRITERIA = """
 You are a mathematical proof and logic checker for graduate-level problems.
 
 For standard validation, check the following criteria:
@@ -243,13 +266,17 @@ PROBLEM TYPE VALIDATION:
 - Verify the problem does NOT ask for derivations or constructions
 - Confirm the problem has a definite, calculable answer
 - Ensure it's a computational problem, evaluation, calculation, or specific numerical/analytical result
+"""
 
+CHECKER_HINT_RULES = """
 HINT VALIDATION:
 - Check if the final answer is justified by the hints and logically sound
 - If some hints are incorrect or misleading, provide corrected versions
 - If most hints are correct, preserve them and only rewrite the flawed ones
 - Only regenerate the full set if all hints are flawed
+"""
 
+CHECKER_MESSAGE = CHECKER_CRITERIA + CHECKER_HINT_RULES + """
 Output JSON:
 {
   "valid": true or false,
@@ -267,6 +294,42 @@ Instructions:
 - Focus on graduate-level problem validation standards
 """
 
+# Checker for problems generated with deferred hints: only the problem is validated here,
+# the hints are checked with HINT_CHECKER_MESSAGE once the hinter has written them
+CHECKER_NO_HINTS_MESSAGE = CHECKER_CRITERIA + """
+The problem comes without hints on purpose; they are written and checked separately. Do NOT reject it for missing hints.
+
+Output JSON:
+{
+  "valid": true or false,
+  "reason": "..."
+}
+
+Instructions:
+- Do NOT include markdown formatting, LaTeX wrappers, or code blocks
+- Focus on graduate-level problem validation standards
+"""
+
+HINT_CHECKER_MESSAGE = """
+You are a mathematical proof and logic checker for graduate-level problems. The problem and its answer have already been validated; check only its hints.
+""" + CHECKER_HINT_RULES + """
+Output JSON:
+{
+  "valid": true or false,
+  "reason": "...",
+  "corrected_hints": {
+    "0": "...",
+    "1": "..."
+  }
+}
+
+Instructions:
+- Set "valid" to false only if the hints are flawed and you cannot correct them
+- Do NOT include markdown formatting, LaTeX wrappers, or code blocks
+- If no correction is needed, either omit "corrected_hints" or leave it out entirely
+- If some hints are kept as-is, you may copy them into the output list to preserve continuity
+"""
+
 TARGET_MESSAGE = """
 You are a graduate-level math student trying to solve the following problem. Only provide the final answer in JSON format.
 
@@ -29,7 +29,7 @@ def test_with_target(question, pipeline_config, mcq_mode=False):
             {"role": "user", "content": json.dumps(input_data)}
         ]
         
-        data, cost = call_llm(pipeline_config, messages)
+        data, cost = call_llm(pipeline_config, messages, role='target')
         
         # Handle different response formats
         answer = None
@@ -0,0 +1,83 @@
+import math
+from decimal import Decimal
+from math_agent.models import LLMCall
+from .budget import current_scope
+from .result_writer import result_writer
+
+PERCENTILES = [50, 95, 99]
+
+
+def record_call(provider, model, role, started_at, duration, input_tokens, output_tokens, cost, error=None):
+    """
+    Queue a telemetry record for one LLM call, tagged with the batch, attempt and
+    stage retry of the calling thread's budget scope.
+    """
+    scope = current_scope() or {}
+    result_writer.add_call(LLMCall(
+        provider=provider,
+        model=model,
+        role=role or 'other',
+        batch_id=scope.get('batch_id'),
+        attempt_id=scope.get('attempt_id'),
+        problem_id=scope.get('problem_id'),
+        retry=scope.get('retry', 0),
+        started_at=started_at,
+        duration=duration,
+        input_tokens=input_tokens,
+        output_tokens=output_tokens,
+        cost=Decimal(str(round(cost, 6))),
+        error=error
+    ))
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(pct / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def call_rollup(batch_id):
+    """
+    Latency, throughput and cost of a batch's LLM calls per role and model.
+
+    Returns:
+        list: One dict per (role, provider, model) with calls, errors, p50/p95/p99
+        duration in seconds, output tokens per second and total cost
+    """
+    groups = {}
+    calls = LLMCall.objects.filter(batch_id=batch_id).values_list(
+        'role', 'provider', 'model', 'duration', 'input_tokens', 'output_tokens', 'cost', 'error'
+    )
+    for role, provider, model, duration, input_tokens, output_tokens, cost, error in calls:
+        group = groups.setdefault((role, provider, model), {
+            'durations': [], 'errors': 0, 'input_tokens': 0, 'output_tokens': 0, 'ok_seconds': 0.0, 'cost': 0.0
+        })
+        group['durations'].append(duration)
+        group['cost'] += float(cost)
+        if error:
+            group['errors'] += 1
+        else:
+            group['input_tokens'] += input_tokens or 0
+            group['output_tokens'] += output_tokens or 0
+            group['ok_seconds'] += duration
+
+    rollup = []
+    for (role, provider, model), group in sorted(groups.items()):
+        durations = sorted(group['durations'])
+        row = {
+            'role': role,
+            'provider': provider,
+            'model': model,
+            'calls': len(durations),
+            'errors': group['errors'],
+            'input_tokens': group['input_tokens'],
+            'output_tokens': group['output_tokens'],
+            'tokens_per_second': group['output_tokens'] / group['ok_seconds'] if group['ok_seconds'] else None,
+            'cost': group['cost']
+        }
+        for pct in PERCENTILES:
+            row[f'p{pct}'] = percentile(durations, pct)
+        rollup.append(row)
+    return rollup
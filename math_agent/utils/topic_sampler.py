@@ -0,0 +1,182 @@
+import random
+from django.db import IntegrityError
+from django.db.models import Count, F, Q
+from math_agent.models import Attempt, TopicStats
+
+SAMPLER_POLICIES = ['uniform', 'quota', 'bandit']
+BANDIT_OBJECTIVES = ['valid_per_dollar', 'valid_per_second']
+PRIOR_STRENGTH = 1.0  # Pseudo-count of valid problems the bandit prior is worth
+
+
+def taxonomy_topics(taxonomy):
+    """Flatten a taxonomy {subject: [topics]} into a list of (subject, topic) pairs."""
+    return [(subject, topic) for subject, topics in taxonomy.items() for topic in topics]
+
+
+class UniformSampler:
+    """Pick a random subject, then a random topic within it."""
+
+    def __init__(self, taxonomy):
+        self.taxonomy = taxonomy
+
+    def choose(self, count):
+        """
+        Pick topics for new attempts.
+
+        Args:
+            count (int): Number of attempts being dispatched
+
+        Returns:
+            list: (subject, topic) pairs, one per attempt
+        """
+        choices = []
+        for _ in range(count):
+            subject = random.choice(list(self.taxonomy.keys()))
+            topic = random.choice(self.taxonomy[subject])
+            choices.append((subject, topic))
+        return choices
+
+
+class QuotaSampler(UniformSampler):
+    """
+    Fill every topic up to a quota of valid problems.
+
+    Each new attempt goes to the topic furthest from its quota, counting attempts
+    still in flight at the batch's observed yield. Once every topic has met its
+    quota, sampling falls back to uniform.
+    """
+
+    def __init__(self, taxonomy, batch_id, per_topic, expected_yield=0.2):
+        super().__init__(taxonomy)
+        self.batch_id = batch_id
+        self.per_topic = per_topic
+        self.expected_yield = expected_yield
+
+    def choose(self, count):
+        attempts = Attempt.objects.filter(batch_id=self.batch_id).values('subject', 'topic').annotate(
+            valid=Count('id', filter=Q(status='completed', outcome='valid')),
+            finished=Count('id', filter=Q(status__in=['completed', 'failed'])),
+            in_flight=Count('id', filter=Q(status__in=['pending', 'running']))
+        )
+        by_topic = {(row['subject'], row['topic']): row for row in attempts}
+        total_valid = sum(row['valid'] for row in by_topic.values())
+        total_finished = sum(row['finished'] for row in by_topic.values())
+        yield_estimate = (total_valid + 1) / (total_finished + 1 / self.expected_yield)
+
+        # Expected valid problems per topic, including attempts still running
+        expected = {}
+        for key in taxonomy_topics(self.taxonomy):
+            row = by_topic.get(key, {'valid': 0, 'in_flight': 0})
+            expected[key] = row['valid'] + row['in_flight'] * yield_estimate
+
+        choices = []
+        for _ in range(count):
+            key = min(expected, key=lambda k: (expected[k], random.random()))
+            if expected[key] >= self.per_topic:
+                choices.extend(super().choose(count - len(choices)))
+                break
+            choices.append(key)
+            expected[key] += yield_estimate
+        return choices
+
+
+class BanditSampler(UniformSampler):
+    """
+    Favour topics by their observed valid-per-dollar or valid-per-second rate.
+
+    Uses Thompson sampling on a Gamma-Poisson model: each topic's rate has a
+    Gamma(prior + valid, prior / global_rate + exposure) posterior, where exposure is
+    the money or time spent on the topic across all batches (TopicStats). A sample is
+    drawn per topic for each attempt and the best one wins, so unproven topics are
+    still explored while proven ones get most of the traffic.
+    """
+
+    def __init__(self, taxonomy, objective='valid_per_dollar'):
+        super().__init__(taxonomy)
+        if objective not in BANDIT_OBJECTIVES:
+            raise ValueError(f"Unknown bandit objective '{objective}'. Use one of: {', '.join(BANDIT_OBJECTIVES)}")
+        self.objective = objective
+
+    def _exposure(self, stats):
+        return float(stats.cost) if self.objective == 'valid_per_dollar' else stats.seconds
+
+    def choose(self, count):
+        topics = taxonomy_topics(self.taxonomy)
+        subjects = {subject for subject, _ in topics}
+        stats = {
+            (row.subject, row.topic): row
+            for row in TopicStats.objects.filter(subject__in=subjects)
+        }
+        known = [stats[key] for key in topics if key in stats]
+
+        # Prior centred on the rate observed across all topics of this taxonomy
+        total_valid = sum(row.valid for row in known)
+        total_exposure = sum(self._exposure(row) for row in known)
+        if total_valid and total_exposure:
+            global_rate = total_valid / total_exposure
+        else:
+            global_rate = 1.0
+        prior_exposure = PRIOR_STRENGTH / global_rate
+
+        choices = []
+        for _ in range(count):
+            best_key, best_rate = None, -1.0
+            for key in topics:
+                row = stats.get(key)
+                valid = row.valid if row else 0
+                exposure = self._exposure(row) if row else 0.0
+                rate = random.gammavariate(PRIOR_STRENGTH + valid, 1.0 / (prior_exposure + exposure))
+                if rate > best_rate:
+                    best_key, best_rate = key, rate
+            choices.append(best_key)
+        return choices
+
+
+def make_sampler(batch):
+    """
+    Build the topic sampler configured in batch.options['sampler'].
+
+    Example options:
+        {"sampler": {"policy": "quota", "per_topic": 5}}
+        {"sampler": {"policy": "bandit", "objective": "valid_per_second"}}
+
+    Returns:
+        UniformSampler, QuotaSampler or BanditSampler
+    """
+    config = (batch.options or {}).get('sampler') or {}
+    policy = config.get('policy', 'uniform')
+
+    if policy == 'uniform':
+        return UniformSampler(batch.taxonomy_json)
+    if policy == 'quota':
+        return QuotaSampler(batch.taxonomy_json, batch.id, int(config.get('per_topic', 1)))
+    if policy == 'bandit':
+        return BanditSampler(batch.taxonomy_json, config.get('objective', 'valid_per_dollar'))
+    raise ValueError(f"Unknown sampler policy '{policy}'. Use one of: {', '.join(SAMPLER_POLICIES)}")
+
+
+def record_topic_outcome(subject, topic, outcome, cost, seconds):
+    """
+    Add an attempt's outcome to the persistent per-topic statistics.
+
+    Args:
+        subject (str): Attempt subject
+        topic (str): Attempt topic
+        outcome (str): 'valid', 'solved', 'discarded' or 'error'
+        cost (float): Money spent by the attempt
+        seconds (float): Wall-clock time spent by the attempt
+    """
+    counter = {'valid': 'valid', 'solved': 'solved', 'discarded': 'discarded', 'error': 'errors'}[outcome]
+    updates = {
+        'attempts': F('attempts') + 1,
+        counter: F(counter) + 1,
+        'cost': F('cost') + cost,
+        'seconds': F('seconds') + seconds
+    }
+    if TopicStats.objects.filter(subject=subject, topic=topic).update(**updates):
+        return
+    try:
+        TopicStats.objects.create(subject=subject, topic=topic)
+    except IntegrityError:
+        pass  # Created concurrently by another worker
+    TopicStats.objects.filter(subject=subject, topic=topic).update(**updates)
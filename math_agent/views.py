@@ -1,206 +1,100 @@
 from django.shortcuts import render, get_object_or_404
 from django.views import View
 from django.views.generic import ListView, DetailView
-from django.http import JsonResponse, HttpResponse
-from django.db import transaction
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse, FileResponse, Http404
 from .models import Batch, Problem
-from .utils.generator import generate_problem
-from .utils.hinter import generate_hints
-from .utils.checker import check_problem
-from .utils.target import test_with_target
-from .utils.judge import judge_solution
+from .utils.batch_runner import run_batch, resume_batch
+from .utils.batch_stats import batch_stats, problem_count
+from .utils.pagination import keyset_page, InvalidCursor, PAGE_SIZE, MAX_PAGE_SIZE
+from .utils.search import search_problems, SearchPage, SEARCH_PAGE_SIZE
+from .utils.topic_sampler import SAMPLER_POLICIES, BANDIT_OBJECTIVES
+from .utils.evaluation import STATUS_RULES, DEFAULT_STATUS_RULE, pipeline_targets
+from .utils.telemetry import call_rollup
+from .utils.metrics import registry
+from .utils.export import (
+    EXPORT_FORMATS, COLUMNAR_FORMATS, parse_export_filters, filter_problems,
+    csv_lines, jsonl_lines, columnar_stream, text_stream, gzip_stream
+)
 from datetime import datetime
+from decimal import Decimal
 import json
-import random
-import csv
-import threading
-import queue
-import time
-from .utils.similarity_utils import SIMILARITY_THRESHOLD
+from .utils.similarity_utils import SIMILARITY_THRESHOLD, NEIGHBOR_LIMIT, top_neighbors, similar_problems_page
 
 # Create your views here.
 
-def problem_generation_worker(worker_id, task_queue, result_queue, pipeline, taxonomy_file, batch_id, stats_lock, stats, mcq_mode=False):
-    """
-    Worker function for generating problems in parallel.
-    
-    Args:
-        worker_id: Unique identifier for this worker
-        task_queue: Queue containing generation tasks
-        result_queue: Queue to put completed problems
-        pipeline: Pipeline configuration
-        taxonomy_file: Taxonomy data for subject/topic selection
-        batch_id: Batch ID for database operations
-        stats_lock: Thread lock for shared statistics
-        stats: Shared statistics dictionary
-    """
-    while True:
-        try:
-            # Get task from queue (blocking with timeout)
-            task = task_queue.get(timeout=1)
-            if task is None:  # Shutdown signal
-                break
-                
-            attempt_id = task['attempt_id']
-            print(f"\n[Worker {worker_id}] Starting attempt {attempt_id}")
-            print("=" * 50)
-            
-            problem_cost = 0.0
-            
-            try:
-                # Randomly select subject and topic from taxonomy
-                subject = random.choice(list(taxonomy_file.keys()))
-                topic = random.choice(taxonomy_file[subject])
-                
-                # Create taxonomy dict for generator
-                taxonomy = {
-                    "subject": subject,
-                    "topic": topic
-                }
-                
-                # Generate problem
-                print(f"[Worker {worker_id}] Calling generator for {subject} - {topic}... (MCQ: {mcq_mode})")
-                question, answer, hints, embedding, similar_problems, generator_cost = generate_problem(pipeline['generator'], taxonomy=taxonomy, mcq_mode=mcq_mode)
-                problem_cost += generator_cost
-                print(f"[Worker {worker_id}] Generator result:\nQuestion: {question}\nAnswer: {answer}\nCost: ${generator_cost}")
-                
-                # Check problem validity
-                print(f"[Worker {worker_id}] Calling checker...")
-                is_valid, rejection_reason, corrected_hints, checker_cost = check_problem(question, answer, hints, pipeline['checker'])
-                problem_cost += checker_cost
-                print(f"[Worker {worker_id}] Checker result: {'Valid' if is_valid else 'Invalid'}\nCost: ${checker_cost}")
-                
-                if not is_valid:
-                    print(f"[Worker {worker_id}] Rejection reason: {rejection_reason}")
-                    # Create discarded problem with transaction safety
-                    with transaction.atomic():
-                        problem = Problem.objects.create(
-                            subject=subject,
-                            topic=topic,
-                            question=question,
-                            answer=answer,
-                            hints=hints,
-                            rejection_reason=rejection_reason,
-                            status='discarded',
-                            batch_id=batch_id,
-                            problem_embedding=embedding,
-                            similar_problems=similar_problems,
-                            cost=problem_cost
-                        )
-                        
-                        # Update similar problems' similar_problems field
-                        for sim_id, sim_score in similar_problems.items():
-                            try:
-                                sim_prob = Problem.objects.select_for_update().get(id=sim_id)
-                                sim_dict = sim_prob.similar_problems or {}
-                                sim_dict[str(problem.id)] = sim_score
-                                sim_prob.similar_problems = sim_dict
-                                sim_prob.save(update_fields=['similar_problems'])
-                            except Problem.DoesNotExist:
-                                continue
-                    
-                    # Update shared stats
-                    with stats_lock:
-                        stats['discarded'] += 1
-                        stats['total_cost'] += problem_cost
-                        stats['attempts'] += 1
-                    
-                    result_queue.put({
-                        'type': 'discarded',
-                        'problem_id': problem.id,
-                        'cost': problem_cost,
-                        'attempt_id': attempt_id,
-                        'worker_id': worker_id
-                    })
-                    
-                else:
-                    # Use corrected hints if provided
-                    if corrected_hints:
-                        print(f"[Worker {worker_id}] Using corrected hints from checker")
-                        hints = corrected_hints
-
-                    # Test with target
-                    print(f"[Worker {worker_id}] Calling target...")
-                    target_result, target_cost = test_with_target(question, pipeline['target'], mcq_mode)
-                    problem_cost += target_cost
-                    print(f"[Worker {worker_id}] Target result:\n{target_result}\nCost: ${target_cost}")
-                    
-                    # Judge the solution
-                    print(f"[Worker {worker_id}] Calling judge...")
-                    is_solved, judge_cost = judge_solution(target_result, answer, pipeline['judge'], mcq_mode, question)
-                    problem_cost += judge_cost
-                    print(f"[Worker {worker_id}] Judge result: {'Solved' if is_solved else 'Not Solved'}\nCost: ${judge_cost}")
-                    
-                    # Create problem with appropriate status and transaction safety
-                    status = 'solved' if is_solved else 'valid'
-                    with transaction.atomic():
-                        problem = Problem.objects.create(
-                            subject=subject,
-                            topic=topic,
-                            question=question,
-                            answer=answer,
-                            hints=hints,
-                            status=status,
-                            batch_id=batch_id,
-                            problem_embedding=embedding,
-                            similar_problems=similar_problems,
-                            cost=problem_cost
-                        )
-                        
-                        # Update similar problems' similar_problems field
-                        for sim_id, sim_score in similar_problems.items():
-                            try:
-                                sim_prob = Problem.objects.select_for_update().get(id=sim_id)
-                                sim_dict = sim_prob.similar_problems or {}
-                                sim_dict[str(problem.id)] = sim_score
-                                sim_prob.similar_problems = sim_dict
-                                sim_prob.save(update_fields=['similar_problems'])
-                            except Problem.DoesNotExist:
-                                continue
-                    
-                    # Update shared stats
-                    with stats_lock:
-                        stats['total_cost'] += problem_cost
-                        stats['attempts'] += 1
-                        if status == 'valid':
-                            stats['valid'] += 1
-                        else:
-                            stats['solved'] += 1
-                    
-                    result_queue.put({
-                        'type': status,
-                        'problem_id': problem.id,
-                        'cost': problem_cost,
-                        'attempt_id': attempt_id,
-                        'worker_id': worker_id
-                    })
-                    
-                    print(f"[Worker {worker_id}] Valid problem count: {stats['valid']}/{stats['target_valid']}")
-                
-            except Exception as e:
-                print(f"[Worker {worker_id}] Error in attempt {attempt_id}: {str(e)}")
-                print(f"[Worker {worker_id}] Skipping this attempt and continuing with next generation...")
-                
-                # Update shared stats
-                with stats_lock:
-                    stats['attempts'] += 1
-                
-                result_queue.put({
-                    'type': 'error',
-                    'error': str(e),
-                    'attempt_id': attempt_id,
-                    'worker_id': worker_id
-                })
-            
-            # Mark task as done
-            task_queue.task_done()
-            
-        except queue.Empty:
-            # Timeout waiting for task, check if we should continue
-            continue
-        except Exception as e:
-            print(f"[Worker {worker_id}] Fatal error: {str(e)}")
-            break
+# Large fields the problem lists never show
+LIST_DEFERRED_FIELDS = ['problem_embedding', 'hints', 'similar_problems']
+
+def parse_batch_options(request):
+    """Read the optional run settings submitted with the generate form into Batch.options."""
+    policy = request.POST.get('sampler_policy') or 'uniform'
+    if policy not in SAMPLER_POLICIES:
+        raise ValueError(f"Unknown sampler policy '{policy}'")
+
+    sampler = {'policy': policy}
+    if policy == 'quota':
+        sampler['per_topic'] = int(request.POST.get('sampler_per_topic') or 1)
+    elif policy == 'bandit':
+        sampler['objective'] = request.POST.get('sampler_objective') or 'valid_per_dollar'
+        if sampler['objective'] not in BANDIT_OBJECTIVES:
+            raise ValueError(f"Unknown bandit objective '{sampler['objective']}'")
+
+    status_rule = request.POST.get('status_rule') or DEFAULT_STATUS_RULE
+    if status_rule not in STATUS_RULES:
+        raise ValueError(f"Unknown status rule '{status_rule}'")
+
+    target_samples = int(request.POST.get('target_samples') or 1)
+    if target_samples < 1:
+        raise ValueError("target_samples must be at least 1")
+
+    problems_per_call = int(request.POST.get('problems_per_call') or 1)
+    if problems_per_call < 1:
+        raise ValueError("problems_per_call must be at least 1")
+
+    local_judge = request.POST.get('local_judge', 'true') != 'false'
+    defer_hints = request.POST.get('defer_hints') == 'true'
+    profile = request.POST.get('profile') == 'true'
+
+    return {
+        'sampler': sampler,
+        'local_judge': local_judge,
+        'defer_hints': defer_hints,
+        'status_rule': status_rule,
+        'target_samples': target_samples,
+        'problems_per_call': problems_per_call,
+        'profile': profile
+    }
+
+def parse_budget(request, field):
+    """Read an optional dollar amount from the generate form."""
+    value = request.POST.get(field)
+    if not value:
+        return None
+    amount = Decimal(value)
+    if amount <= 0:
+        raise ValueError(f"{field} must be positive")
+    return amount
+
+def batch_run_response(batch, summary, verb='generated'):
+    """Build the JSON response for a finished (or resumed) batch run."""
+    stats = summary['stats']
+    return JsonResponse({
+        'status': 'success',
+        'batch_id': batch.id,
+        'batch_status': batch.status,
+        'message': f'Successfully {verb} batch with {stats["valid"]} valid problems in {stats["attempts"]} attempts using {summary["num_workers"]} workers',
+        'total_cost': summary['total_cost'],
+        'stats': {
+            'valid': stats['valid'],
+            'solved': stats['solved'],
+            'discarded': stats['discarded'],
+            'attempts': stats['attempts'],
+            'cancelled': stats['cancelled'],
+            'success_rate': round(stats['valid'] / stats['attempts'] * 100, 1) if stats['attempts'] > 0 else 0
+        },
+        'overshoot': summary['overshoot'],
+        'judging': summary['judging']
+    })
 
 class GenerateView(View):
     def get(self, request):
@@ -213,149 +107,45 @@ class GenerateView(View):
             pipeline = json.loads(request.POST.get('pipeline'))
             taxonomy_file = json.loads(request.FILES.get('taxonomy_file').read().decode('utf-8'))
             mcq_mode = request.POST.get('mcq_mode') == 'true'
+            options = parse_batch_options(request)
+            targets = pipeline_targets(pipeline)
+            budget_limit = parse_budget(request, 'budget_limit')
+            max_cost_per_valid = parse_budget(request, 'max_cost_per_valid')
 
             # Create new batch
             batch = Batch.objects.create(
-                name=f"Batch_{pipeline['target']['model']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+                name=f"Batch_{'+'.join(target['model'] for _, target, _ in targets)}_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
                 taxonomy_json=taxonomy_file,
                 pipeline=pipeline,
-                number_of_valid_needed=number_of_valid_needed
+                number_of_valid_needed=number_of_valid_needed,
+                mcq_mode=mcq_mode,
+                options=options,
+                budget_limit=budget_limit,
+                max_cost_per_valid=max_cost_per_valid
             )
 
-            print(f"\n🚀 Starting threaded problem generation with 10 workers")
-            print(f"Target: {number_of_valid_needed} valid problems")
-            print(f"MCQ Mode: {'Enabled' if mcq_mode else 'Disabled'}")
-            print("=" * 60)
+            summary = run_batch(batch)
+            return batch_run_response(batch, summary)
 
-            # Threading setup
-            NUM_WORKERS = 10
-            task_queue = queue.Queue()
-            result_queue = queue.Queue()
-            stats_lock = threading.Lock()
-            
-            # Shared statistics
-            stats = {
-                'valid': 0,
-                'solved': 0,
-                'discarded': 0,
-                'attempts': 0,
-                'total_cost': 0.0,
-                'target_valid': number_of_valid_needed,
-                'completed': False
-            }
-            
-            # Start worker threads
-            workers = []
-            for i in range(NUM_WORKERS):
-                worker = threading.Thread(
-                    target=problem_generation_worker,
-                    args=(i + 1, task_queue, result_queue, pipeline, taxonomy_file, batch.id, stats_lock, stats, mcq_mode),
-                    daemon=True
-                )
-                worker.start()
-                workers.append(worker)
-                print(f"Started worker {i + 1}")
-            
-            # Add initial tasks to queue (start with 3x the target to ensure we have enough work)
-            initial_tasks = number_of_valid_needed * 3
-            for attempt_id in range(1, initial_tasks + 1):
-                task_queue.put({'attempt_id': attempt_id})
-            
-            print(f"Added {initial_tasks} initial tasks to queue")
-            
-            # Monitor progress and add more tasks as needed
-            last_status_time = time.time()
-            status_interval = 10  # Print status every 10 seconds
-            
-            while stats['valid'] < number_of_valid_needed:
-                try:
-                    # Check for results
-                    try:
-                        result = result_queue.get(timeout=1)
-                        if result['type'] in ['valid', 'solved', 'discarded']:
-                            print(f"✅ [Worker {result['worker_id']}] Completed {result['type']} problem (Attempt {result['attempt_id']})")
-                        elif result['type'] == 'error':
-                            print(f"❌ [Worker {result['worker_id']}] Error in attempt {result['attempt_id']}: {result['error']}")
-                        
-                        result_queue.task_done()
-                    except queue.Empty:
-                        pass
-                    
-                    # Add more tasks if queue is getting low and we haven't reached target
-                    if task_queue.qsize() < 5 and stats['valid'] < number_of_valid_needed:
-                        # Add 10 more tasks
-                        for i in range(10):
-                            task_queue.put({'attempt_id': stats['attempts'] + i + 1})
-                        print(f"Added 10 more tasks to queue (Queue size: {task_queue.qsize()})")
-                    
-                    # Print periodic status
-                    current_time = time.time()
-                    if current_time - last_status_time >= status_interval:
-                        with stats_lock:
-                            print(f"\n📊 Status Update:")
-                            print(f"   Valid: {stats['valid']}/{number_of_valid_needed}")
-                            print(f"   Solved: {stats['solved']}")
-                            print(f"   Discarded: {stats['discarded']}")
-                            print(f"   Total Attempts: {stats['attempts']}")
-                            print(f"   Total Cost: ${stats['total_cost']:.4f}")
-                            print(f"   Queue Size: {task_queue.qsize()}")
-                            print(f"   Active Workers: {sum(1 for w in workers if w.is_alive())}")
-                        last_status_time = current_time
-                    
-                    # Safety check - prevent infinite loop
-                    if stats['attempts'] > number_of_valid_needed * 25:  # 25x safety factor
-                        print(f"⚠️  Safety limit reached ({stats['attempts']} attempts). Stopping generation.")
-                        break
-                        
-                except KeyboardInterrupt:
-                    print("\n🛑 Generation interrupted by user")
-                    break
-            
-            # Shutdown workers
-            print("\n🔄 Shutting down workers...")
-            for _ in range(NUM_WORKERS):
-                task_queue.put(None)  # Shutdown signal
-            
-            # Wait for workers to finish
-            for worker in workers:
-                worker.join(timeout=5)
-            
-            # Process any remaining results
-            while not result_queue.empty():
-                try:
-                    result = result_queue.get_nowait()
-                    if result['type'] in ['valid', 'solved', 'discarded']:
-                        print(f"✅ Final result: {result['type']} problem from worker {result['worker_id']}")
-                    result_queue.task_done()
-                except queue.Empty:
-                    break
-            
-            # Update batch with final cost
-            batch.batch_cost = stats['total_cost']
-            batch.save(update_fields=['batch_cost'])
-            
-            print(f"\n🎉 Generation Complete!")
-            print(f"   Valid Problems: {stats['valid']}")
-            print(f"   Solved Problems: {stats['solved']}")
-            print(f"   Discarded Problems: {stats['discarded']}")
-            print(f"   Total Attempts: {stats['attempts']}")
-            print(f"   Total Cost: ${stats['total_cost']:.4f}")
-            print(f"   Success Rate: {(stats['valid'] / stats['attempts'] * 100):.1f}%" if stats['attempts'] > 0 else "N/A")
+        except Exception as e:
+            print(f"\n❌ Error occurred: {str(e)}")
+            return JsonResponse({
+                'status': 'error',
+                'message': str(e)
+            }, status=400)
 
+class ResumeBatchView(View):
+    def post(self, request, pk):
+        batch = get_object_or_404(Batch, pk=pk)
+        if batch.status == 'completed':
             return JsonResponse({
-                'status': 'success',
-                'batch_id': batch.id,
-                'message': f'Successfully generated batch with {stats["valid"]} valid problems in {stats["attempts"]} attempts using {NUM_WORKERS} workers',
-                'total_cost': stats['total_cost'],
-                'stats': {
-                    'valid': stats['valid'],
-                    'solved': stats['solved'],
-                    'discarded': stats['discarded'],
-                    'attempts': stats['attempts'],
-                    'success_rate': round(stats['valid'] / stats['attempts'] * 100, 1) if stats['attempts'] > 0 else 0
-                }
-            })
+                'status': 'error',
+                'message': f'Batch {batch.id} is already completed'
+            }, status=400)
 
+        try:
+            summary = resume_batch(batch)
+            return batch_run_response(batch, summary, verb='resumed')
         except Exception as e:
             print(f"\n❌ Error occurred: {str(e)}")
             return JsonResponse({
@@ -363,20 +153,27 @@ class GenerateView(View):
                 'message': str(e)
             }, status=400)
 
+class BatchProfileView(View):
+    def get(self, request, pk):
+        batch = get_object_or_404(Batch, pk=pk)
+        if not batch.profile_trace:
+            raise Http404(f"Batch {batch.id} has no profile")
+        return FileResponse(batch.profile_trace.open('rb'), as_attachment=True, filename=f"batch_{batch.id}_trace.json")
+
 class BatchListView(ListView):
     model = Batch
     template_name = 'math_agent/batches.html'
     context_object_name = 'batches'
     ordering = ['-created_at']
 
+    def get_queryset(self):
+        # The list only shows names, statuses and the stored counters
+        return super().get_queryset().defer('taxonomy_json', 'pipeline', 'options')
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         for batch in context['batches']:
-            batch.stats = {
-                'discarded': batch.problems.filter(status='discarded').count(),
-                'solved': batch.problems.filter(status='solved').count(),
-                'valid': batch.problems.filter(status='valid').count()
-            }
+            batch.stats = batch_stats(batch)
         return context
 
 class BatchDetailView(DetailView):
@@ -386,12 +183,9 @@ class BatchDetailView(DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['stats'] = {
-            'discarded': self.object.problems.filter(status='discarded').count(),
-            'solved': self.object.problems.filter(status='solved').count(),
-            'valid': self.object.problems.filter(status='valid').count()
-        }
-        
+        context['stats'] = batch_stats(self.object)
+        context['judging'] = context['stats']
+
         # Calculate cost per valid problem
         valid_count = context['stats']['valid']
         if valid_count > 0:
@@ -401,28 +195,98 @@ class BatchDetailView(DetailView):
         
         return context
 
+class BatchTelemetryView(DetailView):
+    model = Batch
+    template_name = 'math_agent/batch_telemetry.html'
+    context_object_name = 'batch'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['rollup'] = call_rollup(self.object.id)
+        return context
+
 class ProblemDetailView(DetailView):
     model = Problem
     template_name = 'math_agent/problem_detail.html'
     context_object_name = 'problem'
 
+    def get_queryset(self):
+        return Problem.objects.defer('problem_embedding', 'similar_problems')
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         # Add batch information
         context['batch'] = self.object.batch
-        # Add similar problems queryset
-        similar_ids = list(map(int, self.object.similar_problems.keys())) if self.object.similar_problems else []
-        context['similar_problems'] = Problem.objects.filter(id__in=similar_ids) if similar_ids else []
-        context['similarity_scores'] = self.object.similar_problems if self.object.similar_problems else {}
+        # Add the most similar problems, best first
+        context['similar_problems'] = top_neighbors(self.object.id)
+        context['more_similar'] = len(context['similar_problems']) >= NEIGHBOR_LIMIT
+        context['target_results'] = self.object.target_results.all()
+        return context
+
+class SimilarProblemsView(DetailView):
+    """All similar problems of a problem, best first, paged with ?after= cursors."""
+    model = Problem
+    template_name = 'math_agent/similar_problems.html'
+    context_object_name = 'problem'
+
+    def get_queryset(self):
+        return Problem.objects.only('id', 'subject', 'topic', 'question', 'status')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        try:
+            page_size = int(self.request.GET.get('page_size') or NEIGHBOR_LIMIT)
+        except ValueError:
+            page_size = NEIGHBOR_LIMIT
+        after = self.request.GET.get('after')
+        try:
+            page = similar_problems_page(self.object.id, after, min(max(page_size, 1), MAX_PAGE_SIZE))
+        except InvalidCursor as e:
+            raise Http404(str(e))
+        params = self.request.GET.copy()
+        params['after'] = page.next_cursor
+        page.next_url = f"?{params.urlencode()}" if page.has_next else None
+        context['similar_problems'] = page.items
+        context['page_obj'] = page
+        context['first_page'] = not after
         return context
 
-class ProblemListView(ListView):
+class KeysetPaginationMixin:
+    """
+    Pages a list view newest first with (created_at, id) cursors: ?after= and ?before=
+    move between pages and ?page_size= sets their size.
+    """
+
+    def get_paginate_by(self, queryset):
+        try:
+            page_size = int(self.request.GET.get('page_size') or PAGE_SIZE)
+        except ValueError:
+            page_size = PAGE_SIZE
+        return min(max(page_size, 1), MAX_PAGE_SIZE)
+
+    def page_url(self, **cursor):
+        params = self.request.GET.copy()
+        params.pop('after', None)
+        params.pop('before', None)
+        params.update(cursor)
+        return f"?{params.urlencode()}"
+
+    def paginate_queryset(self, queryset, page_size):
+        try:
+            page = keyset_page(queryset, self.request.GET.get('after'), self.request.GET.get('before'), page_size)
+        except InvalidCursor as e:
+            raise Http404(str(e))
+        page.next_url = self.page_url(after=page.next_cursor) if page.has_next else None
+        page.previous_url = self.page_url(before=page.previous_cursor) if page.has_previous else None
+        return None, page, page.items, page.has_next or page.has_previous
+
+class ProblemListView(KeysetPaginationMixin, ListView):
     model = Problem
     template_name = 'math_agent/problems.html'
     context_object_name = 'problems'
 
     def get_queryset(self):
-        queryset = Problem.objects.all()
+        queryset = Problem.objects.defer(*LIST_DEFERRED_FIELDS)
         batch_id = self.kwargs.get('batch_id')
         status = self.request.GET.get('status')
 
@@ -431,91 +295,150 @@ class ProblemListView(ListView):
         if status:
             queryset = queryset.filter(status=status)
 
-        return queryset.order_by('-created_at')
+        return queryset
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['batch_id'] = self.kwargs.get('batch_id')
         context['status'] = self.request.GET.get('status')
+        context['total_count'] = problem_count(context['batch_id'], context['status'] or None)
         return context
 
-class AllProblemsView(ListView):
+class AllProblemsView(KeysetPaginationMixin, ListView):
     model = Problem
     template_name = 'math_agent/all_problems.html'
     context_object_name = 'problems'
 
     def get_queryset(self):
-        queryset = Problem.objects.all()
+        queryset = Problem.objects.select_related('batch').defer(
+            *LIST_DEFERRED_FIELDS, 'batch__taxonomy_json', 'batch__pipeline', 'batch__options'
+        )
         status = self.request.GET.get('status')
         
         if status:
             queryset = queryset.filter(status=status)
             
-        return queryset.order_by('-created_at')
+        return queryset
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['status'] = self.request.GET.get('status')
+        context['total_count'] = problem_count(status=context['status'] or None)
         return context
 
-def export_problems_csv(request):
+class ProblemSearchView(View):
     """
-    Export problems to CSV format.
-    Accepts optional batch_id parameter to export problems from a specific batch.
+    Full-text search over question, answer and hints, best matches first.
+
+    Query parameters: q (search text), status, batch_id, page and page_size;
+    format=json returns the results as JSON instead of the search page.
     """
-    # Get batch_id from query parameters
-    batch_id = request.GET.get('batch_id')
-    
+
+    def get(self, request):
+        query = (request.GET.get('q') or '').strip()
+        status = request.GET.get('status') or None
+        batch_id = request.GET.get('batch_id') or None
+        try:
+            page_number = max(int(request.GET.get('page') or 1), 1)
+            page_size = min(max(int(request.GET.get('page_size') or SEARCH_PAGE_SIZE), 1), MAX_PAGE_SIZE)
+            batch_id = int(batch_id) if batch_id else None
+        except ValueError:
+            return HttpResponse("page, page_size and batch_id must be numbers", status=400)
+
+        queryset = Problem.objects.select_related('batch').defer(
+            *LIST_DEFERRED_FIELDS, 'batch__taxonomy_json', 'batch__pipeline', 'batch__options'
+        )
+        page = search_problems(query, batch_id, status, page_number, page_size, queryset=queryset) if query else SearchPage([], 1, False)
+
+        params = request.GET.copy()
+        if page.has_next:
+            params['page'] = page.number + 1
+            page.next_url = f"?{params.urlencode()}"
+        if page.has_previous:
+            params['page'] = page.number - 1
+            page.previous_url = f"?{params.urlencode()}"
+
+        if request.GET.get('format') == 'json':
+            return JsonResponse({
+                'query': query,
+                'page': page.number,
+                'has_next': page.has_next,
+                'results': [
+                    {
+                        'id': problem.id,
+                        'batch_id': problem.batch_id,
+                        'subject': problem.subject,
+                        'topic': problem.topic,
+                        'status': problem.status,
+                        'question': problem.question,
+                        'answer': problem.answer,
+                        'rank': problem.search_rank
+                    }
+                    for problem in page.items
+                ]
+            })
+
+        return render(request, 'math_agent/search.html', {
+            'query': query,
+            'status': status,
+            'batch_id': batch_id,
+            'batches': Batch.objects.only('id', 'name').order_by('-created_at'),
+            'problems': page.items,
+            'page_obj': page
+        })
+
+def export_problems(request):
+    """
+    Export problems as CSV, JSON Lines, Parquet or an Arrow IPC stream.
+
+    Query parameters (all optional):
+        format: csv (default), jsonl, parquet or arrow
+        batch_id, status, subject, topic: Only matching problems
+        since, until: Created from (inclusive) / before (exclusive), as ISO dates or datetimes
+        embeddings=1: Include the embeddings (jsonl, parquet and arrow)
+        gzip=1: Gzip-compress the file (csv and jsonl)
+
+    The file is streamed while problems are read in chunks, so memory use doesn't
+    grow with the number of problems exported.
+    """
+    fmt = request.GET.get('format') or 'csv'
+    if fmt not in EXPORT_FORMATS:
+        return HttpResponse(f"Unknown export format '{fmt}'. Use: {', '.join(EXPORT_FORMATS)}", status=400)
+    try:
+        filters = parse_export_filters(request.GET)
+    except ValueError as e:
+        return HttpResponse(str(e), status=400)
+
     # Filter problems based on batch_id
-    if batch_id:
+    batch_id = filters.get('batch_id')
+    if batch_id and not Batch.objects.filter(id=batch_id).exists():
+        return HttpResponse("Batch not found", status=404)
+    problems = filter_problems(**filters)
+
+    extension, content_type = EXPORT_FORMATS[fmt]
+    prefix = f"batch_{batch_id}_problems" if batch_id else "all_problems"
+    filename = f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+    embeddings = request.GET.get('embeddings') in ('1', 'true')
+
+    if fmt in COLUMNAR_FORMATS:
         try:
-            batch = Batch.objects.get(id=batch_id)
-            problems = Problem.objects.filter(batch=batch)
-            filename = f"batch_{batch_id}_problems_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        except Batch.DoesNotExist:
-            return HttpResponse("Batch not found", status=404)
+            content = columnar_stream(problems, fmt, embeddings=embeddings)
+        except ImportError as e:
+            return HttpResponse(str(e), status=501)
     else:
-        problems = Problem.objects.all()
-        filename = f"all_problems_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-    
-    # Create HTTP response with CSV content
-    response = HttpResponse(content_type='text/csv')
+        lines = csv_lines(problems) if fmt == 'csv' else jsonl_lines(problems, embeddings=embeddings)
+        content = text_stream(lines)
+        if request.GET.get('gzip') in ('1', 'true'):
+            content = gzip_stream(content)
+            content_type = 'application/gzip'
+            filename += '.gz'
+
+    response = StreamingHttpResponse(content, content_type=content_type)
     response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    
-    # Create CSV writer
-    writer = csv.writer(response)
-    
-    # Write header row
-    writer.writerow(['ID', 'Subject', 'Topic', 'Question', 'Answer', 'Hints', 'Status', 'Similar Problems'])
-    
-    # Write data rows
-    for problem in problems:
-        # Format hints as they appear on frontend
-        hints_text = ""
-        if problem.hints:
-            hints_list = []
-            for hint_key, hint_value in problem.hints.items():
-                hints_list.append(f"Hint {hint_key}: {hint_value}")
-            hints_text = "; ".join(hints_list)
-        
-        # Format similar problems as they appear on frontend
-        similar_text = ""
-        if problem.similar_problems:
-            similar_list = []
-            for sim_id, sim_score in problem.similar_problems.items():
-                similar_list.append(f"ID {sim_id}: {sim_score:.3f}")
-            similar_text = "; ".join(similar_list)
-        
-        # Write row with all fields
-        writer.writerow([
-            problem.id,
-            problem.subject,
-            problem.topic,
-            problem.question,
-            problem.answer,
-            hints_text,
-            problem.status,
-            similar_text
-        ])
-    
     return response
+
+def metrics(request):
+    """
+    Expose this process's metrics in the Prometheus text format for scraping.
+    """
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -39,6 +40,20 @@ GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
 # DeepSeek Key
 DEEPSEEK_KEY = os.getenv('DEEPSEEK_KEY')
 
+# Upper bound on pending + running attempts per batch, shared by workers on every node
+MAX_IN_FLIGHT_ATTEMPTS = int(os.getenv('MAX_IN_FLIGHT_ATTEMPTS', '20'))
+
+# Finished attempts and LLM call records are written in bulk by a background thread:
+# as soon as this many are queued, or once the oldest has waited this many seconds
+RESULT_WRITER_BATCH_SIZE = int(os.getenv('RESULT_WRITER_BATCH_SIZE', '50'))
+RESULT_WRITER_MAX_LATENCY = float(os.getenv('RESULT_WRITER_MAX_LATENCY', '0.5'))
+
+# Problems per page of the problem lists (?page_size= overrides it per request)
+PROBLEMS_PAGE_SIZE = int(os.getenv('PROBLEMS_PAGE_SIZE', '50'))
+
+# Most similar problems kept per problem for its detail page (run rebuild_neighbors after changing it)
+SIMILAR_PROBLEMS_TOP_K = int(os.getenv('SIMILAR_PROBLEMS_TOP_K', '20'))
+
 # Production and development hosts
 ALLOWED_HOSTS = [
     'localhost',
@@ -94,12 +109,50 @@ WSGI_APPLICATION = "math_agent_development.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+# SQLite by default; set DB_ENGINE=postgres when several nodes run workers
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite').lower()
+
+if DB_ENGINE == 'sqlite':
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / "db.sqlite3",
+            "OPTIONS": {
+                # Seconds a writer waits for the database lock (SQLite's busy timeout) before "database is locked"
+                "timeout": int(os.getenv('SQLITE_BUSY_TIMEOUT', '30')),
+                # Take the write lock when a transaction starts, so concurrent atomic blocks queue on
+                # the busy timeout instead of failing when they upgrade from a read lock
+                "transaction_mode": "IMMEDIATE",
+                # WAL lets readers run while a worker writes; NORMAL sync is safe with WAL
+                "init_command": "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;",
+            },
+        }
+    }
+elif DB_ENGINE in ('postgres', 'postgresql'):
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.getenv('DB_NAME', 'math_agent'),
+            "USER": os.getenv('DB_USER', 'postgres'),
+            "PASSWORD": os.getenv('DB_PASSWORD', ''),
+            "HOST": os.getenv('DB_HOST', 'localhost'),
+            "PORT": os.getenv('DB_PORT', '5432'),
+            "CONN_HEALTH_CHECKS": True,
+        }
     }
-}
+    if os.getenv('DB_POOL', 'false').lower() == 'true':
+        # psycopg connection pool shared by the worker threads (needs psycopg[pool]); replaces persistent connections
+        DATABASES["default"]["OPTIONS"] = {
+            "pool": {
+                "min_size": int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+                "max_size": int(os.getenv('DB_POOL_MAX_SIZE', '20')),
+            }
+        }
+    else:
+        # Keep each thread's connection open between requests instead of reconnecting
+        DATABASES["default"]["CONN_MAX_AGE"] = int(os.getenv('DB_CONN_MAX_AGE', '60'))
+else:
+    raise ImproperlyConfigured(f"Unknown DB_ENGINE '{DB_ENGINE}'. Use 'sqlite' or 'postgres'.")
 
 
 # Password validation
@@ -139,6 +192,10 @@ USE_TZ = True
 STATIC_URL = "/static/"
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+# Uploaded and generated files, e.g. batch profile traces
+MEDIA_URL = "/media/"
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
 # Additional static files directories
 STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'static'),